@@ -5,6 +5,90 @@ import 'package:flutter/scheduler.dart';
 import 'dart:async';
 import 'package:shared_preferences/shared_preferences.dart';
 
+// Session token issued by the server's /store-data endpoint
+String? sessionToken;
+
+// Adds the session token to the headers of a request to the server
+Map<String, String> sessionHeaders([Map<String, String>? headers]) {
+  return {
+    ...?headers,
+    if (sessionToken != null) 'X-Session-Token': sessionToken!,
+  };
+}
+
+// How long a write queued by the server (202 Accepted) is waited for
+const Duration writeTimeout = Duration(minutes: 2);
+
+// Waits for the write answered by response: a 202 is only accepted by the
+// server, so its operation (the Location header) is polled until it is done or
+// failed. Returns null on success, the error otherwise
+Future<String?> waitForWrite(http.Response response) async {
+  if (response.statusCode == 200) {
+    return null;
+  }
+  final location = response.headers['location'];
+  if (response.statusCode != 202 || location == null) {
+    return 'Error ${response.statusCode}: ${response.body}';
+  }
+  final deadline = DateTime.now().add(writeTimeout);
+  while (DateTime.now().isBefore(deadline)) {
+    await Future.delayed(Duration(milliseconds: 500));
+    final status = await http.get(Uri.parse('http://127.0.0.1:5000$location'), headers: sessionHeaders());
+    if (status.statusCode != 200) {
+      return 'Error ${status.statusCode}: ${status.body}';
+    }
+    final operation = jsonDecode(status.body) as Map<String, dynamic>;
+    if (operation['status'] == 'done') {
+      return null;
+    }
+    if (operation['status'] == 'failed') {
+      return operation['error']?.toString() ?? 'The write failed';
+    }
+  }
+  return 'The write is still queued';
+}
+
+// Last response of each polled URL, revalidated with its ETag
+final Map<String, http.Response> _conditionalResponses = {};
+
+// GET sending the ETag of the last response as If-None-Match; when the server
+// answers 304 Not Modified the previous response is returned instead
+Future<http.Response> conditionalGet(Uri url) async {
+  final cached = _conditionalResponses[url.toString()];
+  final etag = cached?.headers['etag'];
+  final response = await http.get(url, headers: sessionHeaders({
+    if (etag != null) 'If-None-Match': etag,
+  }));
+  if (response.statusCode == 304 && cached != null) {
+    return cached;
+  }
+  if (response.statusCode == 200 && response.headers.containsKey('etag')) {
+    _conditionalResponses[url.toString()] = response;
+  }
+  return response;
+}
+
+// Sections loaded by the last /bootstrap call, each used once by the page showing it
+final Map<String, dynamic> _bootstrapSections = {};
+
+// Loads the uid and the data of several screens in one round trip; returns the
+// decoded response, or null when the request failed
+Future<Map<String, dynamic>?> bootstrap(List<String> sections) async {
+  final url = Uri.parse('http://127.0.0.1:5000/bootstrap?sections=${sections.join(',')}');
+  final response = await http.get(url, headers: sessionHeaders());
+  if (response.statusCode != 200) {
+    print('Failed to bootstrap ${sections.join(',')}: ${response.statusCode}');
+    return null;
+  }
+  final data = jsonDecode(response.body) as Map<String, dynamic>;
+  _bootstrapSections.addAll(Map<String, dynamic>.from(data['sections']));
+  (data['errors'] as Map).forEach((section, error) => print('Failed to load $section: $error'));
+  return data;
+}
+
+// A section loaded by bootstrap(), or null when it was not or was already used
+dynamic takeBootstrapSection(String section) => _bootstrapSections.remove(section);
+
 void main() {
   runApp(MyApp());
 }
@@ -103,6 +187,7 @@ class _LoginFormState extends State<LoginForm> {
       );
 
       if (response.statusCode == 200) {
+        sessionToken = jsonDecode(response.body)['token'];
         print('Data sent successfully');
       } else {
         print('Failed to send data: ${response.statusCode}');
@@ -146,27 +231,23 @@ class _LoginFormState extends State<LoginForm> {
     }
   }
   Future<void> fetchActiveApps(BuildContext context) async {
-  final fetchAppsUrl = Uri.parse('http://127.0.0.1:5000/fetch-apps');
   try {
-    final response = await http.get(fetchAppsUrl);
-
-    if (response.statusCode == 200) {
-      final data = jsonDecode(response.body);
-      if (data.containsKey('active_apps')) {
-        Navigator.pushReplacement(
-          context,
-          MaterialPageRoute(
-            builder: (context) => HomePage(
-              uid: data['uid'].toString(),
-              activeApps: List<String>.from(data['active_apps']),
-            ),
+    // The uid and the installed apps in one round trip
+    final data = await bootstrap(['apps']);
+    final apps = takeBootstrapSection('apps');
+
+    if (data != null && apps != null) {
+      Navigator.pushReplacement(
+        context,
+        MaterialPageRoute(
+          builder: (context) => HomePage(
+            uid: data['uid'].toString(),
+            activeApps: List<String>.from(apps['active_apps']),
           ),
-        );
-      } else {
-        print('Error: active_apps not found in response');
-      }
+        ),
+      );
     } else {
-      print('Failed to fetch active apps: ${response.statusCode}');
+      print('Failed to fetch active apps');
     }
   } catch (e) {
     print('Error fetching active apps: $e');
@@ -178,28 +259,25 @@ class _LoginFormState extends State<LoginForm> {
   // First, send form data
   await sendFormData(context);
   
-  // Fetch active apps
+  // Fetch the uid and the active apps in one round trip
   try {
-    final url = Uri.parse('http://127.0.0.1:5000/fetch-apps');
-    final response = await http.get(url);
-
-    if (response.statusCode == 200) {
-      final data = jsonDecode(response.body);
-      if (data['active_apps'] != null && data['active_apps'] is List) {
-        Navigator.push(
-          context,
-          MaterialPageRoute(
-            builder: (context) => HomePage(
-              uid: data['uid'].toString(),
-              activeApps: List<String>.from(data['active_apps']),
-            ),
+    final data = await bootstrap(['apps']);
+    final apps = takeBootstrapSection('apps');
+
+    if (data == null) {
+      _showErrorDialog(context, 'Failed to fetch active apps');
+    } else if (apps != null && apps['active_apps'] is List) {
+      Navigator.push(
+        context,
+        MaterialPageRoute(
+          builder: (context) => HomePage(
+            uid: data['uid'].toString(),
+            activeApps: List<String>.from(apps['active_apps']),
           ),
-        );
-      } else {
-        _showErrorDialog(context, 'Invalid response: Active apps list is missing or empty');
-      }
+        ),
+      );
     } else {
-      _showErrorDialog(context, 'Failed to fetch active apps: ${response.statusCode}');
+      _showErrorDialog(context, 'Invalid response: Active apps list is missing or empty');
     }
   } catch (e) {
     _showErrorDialog(context, 'Error fetching active apps: $e');
@@ -373,36 +451,23 @@ class HomePage extends StatelessWidget {
   }
 
   Future<void> _fetchAndNavigateToTaskPage(BuildContext context) async {
-  final authenticateUrl = Uri.parse('http://127.0.0.1:5000/authenticate-api');
-  final fetchTasksUrl = Uri.parse('http://127.0.0.1:5000/fetch-tasks');
-
   try {
-    // Authenticate to get the uid
-    final authResponse = await http.get(authenticateUrl);
-    if (authResponse.statusCode == 200) {
-      final authData = jsonDecode(authResponse.body);
-      final uid = authData['uid'];  // Extracting the uid from the response
+    // The uid, the tasks and the admin flag of the add button in one round trip
+    final data = await bootstrap(['tasks', 'isadmin']);
+    if (data != null && data['sections'].containsKey('tasks')) {
+      final uid = data['uid'];
       print('UID fetched: $uid');
+      print('Tasks fetched: ${data['sections']['tasks'].length}');
 
-      // Fetch tasks with the authenticated uid
-      final tasksResponse = await http.get(fetchTasksUrl);
-      if (tasksResponse.statusCode == 200) {
-        final tasksData = jsonDecode(tasksResponse.body);
-        print('Tasks fetched: ${tasksData.length}');
-
-        // Navigate to TaskPage with uid
-        Navigator.pushReplacement(
-          context,
-          MaterialPageRoute(
-            builder: (context) => TaskPage(uid: uid.toString()),
-          ),
-        );
-      } else {
-        print('Failed to fetch tasks: ${tasksResponse.statusCode}');
-        // Handle error
-      }
+      // Navigate to TaskPage with uid
+      Navigator.pushReplacement(
+        context,
+        MaterialPageRoute(
+          builder: (context) => TaskPage(uid: uid.toString()),
+        ),
+      );
     } else {
-      print('Failed to authenticate: ${authResponse.statusCode}');
+      print('Failed to fetch tasks');
       // Handle error
     }
   } catch (e) {
@@ -412,35 +477,22 @@ class HomePage extends StatelessWidget {
 }
 
 Future<void> _fetchAndNavigateToContactPages(BuildContext context) async {
-  final authenticateUrl = Uri.parse('http://127.0.0.1:5000/authenticate-api');
-  final fetchcntsUrl = Uri.parse('http://127.0.0.1:5000/fetch-contacts');
-
   try {
-    // Authenticate to get the uid
-    final authResponse = await http.get(authenticateUrl);
-    if (authResponse.statusCode == 200) {
-      final authData = jsonDecode(authResponse.body);
-      final uid = authData['uid'];  // Extracting the uid from the response
-      print('UID fetched: $uid');
-      // Fetch contacts with the authenticated uid
-      final cntResponse = await http.get(fetchcntsUrl);
-      if (cntResponse.statusCode == 200) {
-        final cntData = jsonDecode(cntResponse.body);
-        print('contact fetched: ${cntData.length}');
-
-        // Navigate to contactpage with uid
-        Navigator.pushReplacement(
-          context,
-          MaterialPageRoute(
-            builder: (context) => ContactPages(),
-          ),
-        );
-      } else {
-        print('Failed to fetch contacts: ${cntResponse.statusCode}');
-        // Handle error
-      }
+    // The uid and the contacts in one round trip
+    final data = await bootstrap(['contacts']);
+    if (data != null && data['sections'].containsKey('contacts')) {
+      print('UID fetched: ${data['uid']}');
+      print('contact fetched: ${data['sections']['contacts'].length}');
+
+      // Navigate to contactpage with uid
+      Navigator.pushReplacement(
+        context,
+        MaterialPageRoute(
+          builder: (context) => ContactPages(),
+        ),
+      );
     } else {
-      print('Failed to authenticate: ${authResponse.statusCode}');
+      print('Failed to fetch contacts');
       // Handle error
     }
   } catch (e) {
@@ -449,36 +501,22 @@ Future<void> _fetchAndNavigateToContactPages(BuildContext context) async {
   }
 }
 Future<void> _fetchAndNavigateTotimePages(BuildContext context) async {
-  final authenticateUrl = Uri.parse('http://127.0.0.1:5000/authenticate-api');
-  final fetchtssUrl = Uri.parse('http://127.0.0.1:5000/fetch-timesheet');
-
   try {
-    // Authenticate to get the uid
-    final authResponse = await http.get(authenticateUrl);
-    if (authResponse.statusCode == 200) {
-      final authData = jsonDecode(authResponse.body);
-      final uid = authData['uid'];  // Extracting the uid from the response
-      print('UID fetched: $uid');
-
-      // Fetch timesheet with the authenticated uid
-      final tsResponse = await http.get(fetchtssUrl);
-      if (tsResponse.statusCode == 200) {
-        final tsData = jsonDecode(tsResponse.body);
-        print('timesheets fetched: ${tsData.length}');
-
-        // Navigate to TimePages with the fetched tasks
-        Navigator.pushReplacement(
-          context,
-          MaterialPageRoute(
-            builder: (context) => TimePage(), // Pass the fetched data here
-          ),
-        );
-      } else {
-        print('Failed to fetch timesheets: ${tsResponse.statusCode}');
-        // Handle error
-      }
+    // The uid and the timesheets in one round trip
+    final data = await bootstrap(['timesheet']);
+    if (data != null && data['sections'].containsKey('timesheet')) {
+      print('UID fetched: ${data['uid']}');
+      print('timesheets fetched: ${data['sections']['timesheet'].length}');
+
+      // Navigate to TimePages, which shows the fetched tasks
+      Navigator.pushReplacement(
+        context,
+        MaterialPageRoute(
+          builder: (context) => TimePage(),
+        ),
+      );
     } else {
-      print('Failed to authenticate: ${authResponse.statusCode}');
+      print('Failed to fetch timesheets');
       // Handle error
     }
   } catch (e) {
@@ -497,13 +535,14 @@ class TaskPage extends StatelessWidget {
   TaskPage({required this.uid});
 
   Future<List<dynamic>> fetchTasks() async {
-    final authenticateUrl = Uri.parse('http://127.0.0.1:5000/authenticate-api');
-    final authResponse = await http.get(authenticateUrl);
-    final authData = jsonDecode(authResponse.body);
-    final uid = authData['uid'];
+    // Tasks already loaded by /bootstrap on the way to this page
+    final prefetched = takeBootstrapSection('tasks');
+    if (prefetched != null) {
+      return prefetched;
+    }
 
     final url = Uri.parse('http://127.0.0.1:5000/fetch-tasks?uid=$uid');
-    final response = await http.get(url);
+    final response = await conditionalGet(url);
 
     if (response.statusCode == 200) {
       return jsonDecode(response.body);
@@ -515,30 +554,22 @@ class TaskPage extends StatelessWidget {
   @override
   Widget build(BuildContext context) {
     void navigateToHomePage(BuildContext context) async{
-      final fetchAppsUrl = Uri.parse('http://127.0.0.1:5000/fetch-apps');
-      final authenticateUrl = Uri.parse('http://127.0.0.1:5000/authenticate-api');
       try {
-        final authResponse = await http.get(authenticateUrl);
-        final response = await http.get(fetchAppsUrl);
-        if (response.statusCode == 200 && authResponse.statusCode == 200) {
-          final authData = jsonDecode(authResponse.body);
-          final uid = authData['uid'];
-          final data = jsonDecode(response.body);
-          if (data.containsKey('active_apps')) {
-            Navigator.pushReplacement(
-              context,
-              MaterialPageRoute(
-                builder: (context) => HomePage(
-                  uid: uid.toString(),
-                  activeApps: List<String>.from(data['active_apps']),
-                ),
+        // The uid and the installed apps in one round trip
+        final data = await bootstrap(['apps']);
+        final apps = takeBootstrapSection('apps');
+        if (data != null && apps != null) {
+          Navigator.pushReplacement(
+            context,
+            MaterialPageRoute(
+              builder: (context) => HomePage(
+                uid: data['uid'].toString(),
+                activeApps: List<String>.from(apps['active_apps']),
               ),
-            );
-          } else {
-            print('Error: active_apps not found in response');
-          }
+            ),
+          );
         } else {
-          print('Failed to fetch active apps: ${response.statusCode}');
+          print('Error: active_apps not found in response');
         }
       } catch (e) {
         print('Error fetching active apps: $e');
@@ -548,7 +579,11 @@ class TaskPage extends StatelessWidget {
   final isadminurl = Uri.parse('http://127.0.0.1:5000/isadmin');
   
   try {
-    final isadminresponse = await http.get(isadminurl);
+    // Admin flag already loaded by /bootstrap with the tasks
+    final prefetched = takeBootstrapSection('isadmin');
+    final isadminresponse = prefetched != null
+        ? http.Response(jsonEncode(prefetched), 200)
+        : await conditionalGet(isadminurl);
 
     if (isadminresponse.statusCode == 200) {
       final isadmindata = jsonDecode(isadminresponse.body);
@@ -681,6 +716,8 @@ class _TaskCardState extends State<TaskCard> {
 
     Map<String, String> headers = {
       'Content-Type': 'application/json',
+      // Let the server acknowledge right away and write to Odoo in the background
+      'Prefer': 'respond-async',
     };
 
     Map<String, dynamic> data = {
@@ -692,21 +729,33 @@ class _TaskCardState extends State<TaskCard> {
     try {
       final response = await http.post(
         Uri.parse(url),
-        headers: headers,
+        headers: sessionHeaders(headers),
         body: body,
       );
 
-      if (response.statusCode == 200) {
+      // The task list is only refreshed once Odoo has the new stage
+      final error = await waitForWrite(response);
+      if (error == null) {
         print('Stage updated successfully');
         widget.onStageUpdated(); // Trigger the callback to refresh the task list
       } else {
-        print('Failed to update stage: ${response.body}');
+        print('Failed to update stage: $error');
+        showWriteError('Failed to update stage: $error');
       }
     } catch (e) {
       print('Error updating stage: $e');
+      showWriteError('Error updating stage: $e');
     }
   }
 
+  void showWriteError(String message) {
+    if (!mounted) return;
+    setState(() {
+      selectedStage = widget.task['stage_id'][1] ?? 'No stage'; // Back to the stage Odoo has
+    });
+    ScaffoldMessenger.of(context).showSnackBar(SnackBar(content: Text(message)));
+  }
+
   @override
   void initState() {
     super.initState();
@@ -986,7 +1035,7 @@ class _AddTaskPageState extends State<AddTaskPage> {
 
   Future<void> fetchTaskData() async {
     try {
-      final response = await http.get(Uri.parse('http://127.0.0.1:5000/fetch-new-task'));
+      final response = await http.get(Uri.parse('http://127.0.0.1:5000/fetch-new-task'), headers: sessionHeaders());
 
       if (response.statusCode == 200) {
         final data = json.decode(response.body);
@@ -1034,7 +1083,7 @@ class _AddTaskPageState extends State<AddTaskPage> {
   try {
     final response = await http.post(
       Uri.parse('http://127.0.0.1:5000/add-task'),
-      headers: {'Content-Type': 'application/json'},
+      headers: sessionHeaders({'Content-Type': 'application/json'}),
       body: json.encode({
         'task_name': taskName,
         'project_name': selectedProject, // Send project name
@@ -1207,7 +1256,16 @@ class _ContactPagesState extends State<ContactPages> {
   }
 
   Future<void> fetchContacts() async {
-    final response = await http.get(Uri.parse('http://127.0.0.1:5000/fetch-contacts'));
+    // Contacts already loaded by /bootstrap on the way to this page
+    final prefetched = takeBootstrapSection('contacts');
+    if (prefetched != null) {
+      setState(() {
+        contacts = prefetched;
+      });
+      return;
+    }
+
+    final response = await conditionalGet(Uri.parse('http://127.0.0.1:5000/fetch-contacts'));
 
     if (response.statusCode == 200) {
       setState(() {
@@ -1222,30 +1280,22 @@ class _ContactPagesState extends State<ContactPages> {
   @override
   Widget build(BuildContext context) {
     void navigateToHomePage(BuildContext context) async{
-      final fetchAppsUrl = Uri.parse('http://127.0.0.1:5000/fetch-apps');
-      final authenticateUrl = Uri.parse('http://127.0.0.1:5000/authenticate-api');
       try {
-        final authResponse = await http.get(authenticateUrl);
-        final response = await http.get(fetchAppsUrl);
-        if (response.statusCode == 200 && authResponse.statusCode == 200) {
-          final authData = jsonDecode(authResponse.body);
-          final uid = authData['uid'];
-          final data = jsonDecode(response.body);
-          if (data.containsKey('active_apps')) {
-            Navigator.pushReplacement(
-              context,
-              MaterialPageRoute(
-                builder: (context) => HomePage(
-                  uid: uid.toString(),
-                  activeApps: List<String>.from(data['active_apps']),
-                ),
+        // The uid and the installed apps in one round trip
+        final data = await bootstrap(['apps']);
+        final apps = takeBootstrapSection('apps');
+        if (data != null && apps != null) {
+          Navigator.pushReplacement(
+            context,
+            MaterialPageRoute(
+              builder: (context) => HomePage(
+                uid: data['uid'].toString(),
+                activeApps: List<String>.from(apps['active_apps']),
               ),
-            );
-          } else {
-            print('Error: active_apps not found in response');
-          }
+            ),
+          );
         } else {
-          print('Failed to fetch active apps: ${response.statusCode}');
+          print('Error: active_apps not found in response');
         }
       } catch (e) {
         print('Error fetching active apps: $e');
@@ -1265,8 +1315,9 @@ class _ContactPagesState extends State<ContactPages> {
         itemCount: contacts.length,
         itemBuilder: (context, index) {
           final contact = contacts[index];
-          final imageProvider = contact['image_1920'] != null
-              ? MemoryImage(base64Decode(contact['image_1920']))
+          // Images are downloaded lazily, one small thumbnail per visible contact
+          final imageProvider = contact['image_url'] != null
+              ? NetworkImage('http://127.0.0.1:5000${contact['image_url']}', headers: sessionHeaders())
               : AssetImage('assets/unknown_profile.png') as ImageProvider;
 
           return Card(
@@ -1306,7 +1357,13 @@ class _TimePageState extends State<TimePage> {
   }
 
   Future<List<Map<String, dynamic>>> fetchTasks() async {
-    final response = await http.get(Uri.parse('http://127.0.0.1:5000/fetch-timesheet'));
+    // Timesheets already loaded by /bootstrap on the way to this page
+    final prefetched = takeBootstrapSection('timesheet');
+    if (prefetched != null) {
+      return (prefetched as List).map((item) => item as Map<String, dynamic>).toList();
+    }
+
+    final response = await http.get(Uri.parse('http://127.0.0.1:5000/fetch-timesheet'), headers: sessionHeaders());
 
     if (response.statusCode == 200) {
       List<dynamic> data = json.decode(response.body);
@@ -1319,30 +1376,22 @@ class _TimePageState extends State<TimePage> {
   @override
   Widget build(BuildContext context) {
     void navigateToHomePage(BuildContext context) async{
-      final fetchAppsUrl = Uri.parse('http://127.0.0.1:5000/fetch-apps');
-      final authenticateUrl = Uri.parse('http://127.0.0.1:5000/authenticate-api');
       try {
-        final authResponse = await http.get(authenticateUrl);
-        final response = await http.get(fetchAppsUrl);
-        if (response.statusCode == 200 && authResponse.statusCode == 200) {
-          final authData = jsonDecode(authResponse.body);
-          final uid = authData['uid'];
-          final data = jsonDecode(response.body);
-          if (data.containsKey('active_apps')) {
-            Navigator.pushReplacement(
-              context,
-              MaterialPageRoute(
-                builder: (context) => HomePage(
-                  uid: uid.toString(),
-                  activeApps: List<String>.from(data['active_apps']),
-                ),
+        // The uid and the installed apps in one round trip
+        final data = await bootstrap(['apps']);
+        final apps = takeBootstrapSection('apps');
+        if (data != null && apps != null) {
+          Navigator.pushReplacement(
+            context,
+            MaterialPageRoute(
+              builder: (context) => HomePage(
+                uid: data['uid'].toString(),
+                activeApps: List<String>.from(apps['active_apps']),
               ),
-            );
-          } else {
-            print('Error: active_apps not found in response');
-          }
+            ),
+          );
         } else {
-          print('Failed to fetch active apps: ${response.statusCode}');
+          print('Error: active_apps not found in response');
         }
       } catch (e) {
         print('Error fetching active apps: $e');
@@ -1521,9 +1570,10 @@ class _ChronoPageState extends State<ChronoPage> with WidgetsBindingObserver {
 
     final response = await http.post(
       Uri.parse('http://127.0.0.1:5000/add-timesheet-line'),
-      headers: <String, String>{
+      headers: sessionHeaders(<String, String>{
         'Content-Type': 'application/json; charset=UTF-8',
-      },
+        'Prefer': 'respond-async',
+      }),
       body: jsonEncode(<String, dynamic>{
         'task_id': widget.task['id'],
         'unit_amount': unitAmount,
@@ -1532,10 +1582,14 @@ class _ChronoPageState extends State<ChronoPage> with WidgetsBindingObserver {
       }),
     );
 
-    if (response.statusCode == 200) {
+    final error = await waitForWrite(response);
+    if (error == null) {
       print('Timesheet line added successfully');
     } else {
-      print('Failed to add timesheet line');
+      print('Failed to add timesheet line: $error');
+      if (mounted) {
+        ScaffoldMessenger.of(context).showSnackBar(SnackBar(content: Text('Failed to add timesheet line: $error')));
+      }
     }
 
     _resetStopwatch(); // Reset the stopwatch after adding a timesheet line
@@ -0,0 +1,334 @@
+import contextlib
+import contextvars
+import itertools
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+import utils
+
+# Set ADMISSION=0 to send every Odoo call right away, as before
+ADMISSION = os.environ.get('ADMISSION', '1') != '0'
+# Odoo calls in flight at once against one Odoo backend, from this process;
+# the others wait their turn in priority order
+MAX_IN_FLIGHT = int(os.environ.get('ADMISSION_MAX_IN_FLIGHT', 16))
+# How many of them may be bulk reads: the other slots stay free for the writes
+# and interactive reads, which would otherwise wait for a long read to finish
+BULK_IN_FLIGHT = int(os.environ.get('ADMISSION_BULK_IN_FLIGHT', max(MAX_IN_FLIGHT * 3 // 4, 1)))
+# Odoo calls per second allowed to one user, and the burst allowed above that
+# rate; 0 does not limit users
+USER_RATE = float(os.environ.get('ADMISSION_USER_RATE', 0))
+USER_BURST = int(os.environ.get('ADMISSION_USER_BURST', 60))
+# Odoo calls per second sent to one Odoo backend, and the burst; 0 does not limit
+BACKEND_RATE = float(os.environ.get('ADMISSION_BACKEND_RATE', 0))
+BACKEND_BURST = int(os.environ.get('ADMISSION_BACKEND_BURST', 100))
+# Seconds a call may wait for its turn before it is refused
+QUEUE_TIMEOUT = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', 10))
+# Calls waiting for one backend beyond which new calls are refused right away
+MAX_QUEUED = int(os.environ.get('ADMISSION_MAX_QUEUED', 256))
+# Users whose rate is tracked before the idle ones are forgotten
+MAX_USERS = int(os.environ.get('ADMISSION_MAX_USERS', 10000))
+
+# Priorities, highest first: writes the user is waiting for, interactive reads,
+# then the bulk reads (full lists, reports) and the background syncs
+WRITE, READ, BULK = 'write', 'read', 'bulk'
+PRIORITIES = (WRITE, READ, BULK)
+
+
+class RejectedError(Exception):
+    # Raised instead of calling Odoo when the call cannot be admitted: the
+    # user is over their rate (429) or the backend's queue is full (503)
+
+    def __init__(self, backend, reason, retry_after):
+        self.backend = backend
+        self.reason = reason
+        self.retry_after = max(int(math.ceil(retry_after)), 1)
+        self.status = 429 if reason == 'user' else 503
+        if reason == 'user':
+            message = f"Too many Odoo calls, retry in {self.retry_after}s"
+        else:
+            message = f"Odoo at {backend} is overloaded, retry in {self.retry_after}s"
+        super().__init__(message)
+
+
+class Scope:
+    # Who the Odoo calls of a request or background job are made for
+
+    __slots__ = ('user', 'priority', 'rejected')
+
+    def __init__(self, user=None, priority=READ):
+        self.user = user
+        self.priority = priority
+        # RejectedError of the last refused call, turned into the response status
+        self.rejected = None
+
+
+# Scope of the request being served; the gateway threads see the same object
+# because they run in a copy of the request's context
+_scope = contextvars.ContextVar('admission_scope', default=None)
+
+
+def start_request(priority):
+    _scope.set(Scope(priority=priority))
+
+
+def set_user(session):
+    scope = _scope.get()
+    if scope is not None:
+        scope.user = utils.owner(session['url'], session['db'], session['username'])
+
+
+@contextmanager
+def scope(session, priority):
+    # Calls made outside of a request, e.g. by the write queue or the replica sync
+    token = _scope.set(Scope(utils.owner(session['url'], session['db'], session['username']), priority))
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def priority():
+    # Priority of the calls made in the current context
+    scope = _scope.get()
+    return scope.priority if scope is not None else READ
+
+
+def rejection():
+    # RejectedError of the current request, None when all its calls were admitted
+    scope = _scope.get()
+    return scope.rejected if scope is not None else None
+
+
+class TokenBucket:
+    # rate tokens per second, up to burst; a rate of 0 never runs out
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+
+    def wait_time(self, now, needed=1):
+        # Seconds before needed tokens are available
+        if self.rate <= 0:
+            return 0
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return max(needed - self.tokens, 0) / self.rate
+
+    def take(self):
+        if self.rate > 0:
+            self.tokens -= 1
+
+
+class _User:
+
+    def __init__(self):
+        self.bucket = TokenBucket(USER_RATE, USER_BURST)
+        self.in_flight = 0
+        self.waiting = 0
+        # Virtual time of the user's last call, see Scheduler._tag
+        self.tag = 0
+
+
+class _Backend:
+
+    def __init__(self, name):
+        self.name = name
+        self.bucket = TokenBucket(BACKEND_RATE, BACKEND_BURST)
+        self.in_flight = 0
+        self.bulk_in_flight = 0
+        self.waiting = []
+
+
+class _Waiter:
+    __slots__ = ('rank', 'tag', 'sequence', 'user')
+
+    def __init__(self, rank, tag, sequence, user):
+        self.rank = rank
+        self.tag = tag
+        self.sequence = sequence
+        self.user = user
+
+
+class Scheduler:
+    # Admission control of the Odoo calls of this process. A call runs once
+    # its backend has fewer than max_in_flight calls running (bulk_in_flight
+    # for the bulk reads) and tokens left, and its user has tokens left.
+    # Waiting calls go in priority order, so that
+    # bulk reads cannot hold back the writes, and the users waiting with the
+    # same priority take turns, so that one user's many calls cannot hold back
+    # another user's few.
+
+    def __init__(self, max_in_flight=MAX_IN_FLIGHT, bulk_in_flight=BULK_IN_FLIGHT, queue_timeout=QUEUE_TIMEOUT,
+                 max_queued=MAX_QUEUED):
+        self.max_in_flight = max_in_flight
+        self.bulk_in_flight = min(bulk_in_flight, max_in_flight)
+        self.queue_timeout = queue_timeout
+        self.max_queued = max_queued
+        self._backends = {}
+        self._users = {}
+        self._sequence = itertools.count()
+        self._virtual = 0
+        self._condition = threading.Condition()
+
+    def _backend(self, name):
+        backend = self._backends.get(name)
+        if backend is None:
+            backend = self._backends[name] = _Backend(name)
+        return backend
+
+    def _user(self, key, now):
+        user = self._users.get(key)
+        if user is None:
+            if len(self._users) >= MAX_USERS:
+                # Forget the users with nothing running and a full bucket
+                for idle in [key for key, user in self._users.items() if not user.in_flight and not user.waiting
+                             and not user.bucket.wait_time(now, user.bucket.burst)]:
+                    del self._users[idle]
+            user = self._users[key] = _User()
+        return user
+
+    def _tag(self, user):
+        # Fair queuing: each call of a user is tagged one after the user's
+        # previous call, and never before the call that went last, so that the
+        # calls of the users waiting take turns whatever their number
+        user.tag = max(user.tag, self._virtual) + 1
+        return user.tag
+
+    def acquire(self, name, scope):
+        # Wait for the turn of a call to the backend name and return its user,
+        # or raise RejectedError
+        now = time.monotonic()
+        priority = scope.priority if scope is not None else READ
+        with self._condition:
+            backend = self._backend(name)
+            user = self._user(scope.user if scope is not None else None, now)
+            if not backend.waiting and self._has_slot(backend, priority) \
+                    and not user.bucket.wait_time(now) and not backend.bucket.wait_time(now):
+                self._virtual = self._tag(user)
+                self._grant(backend, user, priority)
+                return user
+            if len(backend.waiting) >= self.max_queued:
+                raise self._reject(scope, name, priority, 'queue_full', 1)
+            user_wait = user.bucket.wait_time(now, user.waiting + 1)
+            if user_wait > self.queue_timeout:
+                # The calls the user already queued use up their rate until then
+                raise self._reject(scope, name, priority, 'user', user_wait)
+
+            waiter = _Waiter(PRIORITIES.index(priority), self._tag(user), next(self._sequence), user)
+            backend.waiting.append(waiter)
+            user.waiting += 1
+            metrics.ADMISSION_QUEUED.add(1, name, priority)
+            deadline = now + self.queue_timeout
+            start = now
+            try:
+                with metrics.timed('queue'):
+                    while True:
+                        delay = self._turn(backend, waiter, now)
+                        if delay == 0:
+                            break
+                        if now >= deadline:
+                            user_wait = user.bucket.wait_time(now)
+                            if user_wait:
+                                raise self._reject(scope, name, priority, 'user', user_wait)
+                            raise self._reject(scope, name, priority, 'timeout', 1)
+                        self._condition.wait(deadline - now if delay is None else min(delay, deadline - now))
+                        now = time.monotonic()
+            finally:
+                backend.waiting.remove(waiter)
+                user.waiting -= 1
+                metrics.ADMISSION_QUEUED.add(-1, name, priority)
+                self._condition.notify_all()
+            metrics.ADMISSION_WAIT.observe(now - start, priority)
+            self._virtual = max(self._virtual, waiter.tag)
+            self._grant(backend, user, priority)
+            return user
+
+    def _has_slot(self, backend, priority):
+        if priority == BULK and backend.bulk_in_flight >= self.bulk_in_flight:
+            return False
+        return backend.in_flight < self.max_in_flight
+
+    def _turn(self, backend, waiter, now):
+        # 0 when waiter goes now, else the seconds before its tokens are
+        # available, or None to wait for another call to go or finish
+        if backend.in_flight >= self.max_in_flight:
+            return None
+        best = None
+        for other in backend.waiting:
+            if not self._has_slot(backend, PRIORITIES[other.rank]) or other.user.bucket.wait_time(now):
+                continue
+            if best is None or (other.rank, other.tag, other.sequence) < (best.rank, best.tag, best.sequence):
+                best = other
+        if best is None:
+            # Waiting for a slot or for the user's tokens
+            return waiter.user.bucket.wait_time(now) or None
+        if best is not waiter:
+            return None
+        return backend.bucket.wait_time(now)
+
+    def _grant(self, backend, user, priority):
+        backend.in_flight += 1
+        backend.bulk_in_flight += priority == BULK
+        backend.bucket.take()
+        user.in_flight += 1
+        user.bucket.take()
+        metrics.ADMISSION_IN_FLIGHT.add(1, backend.name)
+
+    def _reject(self, scope, name, priority, reason, retry_after):
+        metrics.ADMISSION_REJECTED.inc(name, priority, reason)
+        error = RejectedError(name, reason, retry_after)
+        if scope is not None:
+            scope.rejected = error
+        return error
+
+    def release(self, name, user, priority):
+        with self._condition:
+            backend = self._backends[name]
+            backend.in_flight -= 1
+            backend.bulk_in_flight -= priority == BULK
+            user.in_flight -= 1
+            metrics.ADMISSION_IN_FLIGHT.add(-1, name)
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self, name):
+        scope = _scope.get()
+        user = self.acquire(name, scope)
+        try:
+            yield
+        finally:
+            self.release(name, user, priority())
+
+    def stats(self, name=None):
+        # Calls running and waiting per backend, or for the backend name only
+        with self._condition:
+            result = {
+                'backends': {backend.name: {
+                    'in_flight': backend.in_flight,
+                    'queued': {priority: sum(1 for waiter in backend.waiting if PRIORITIES[waiter.rank] == priority)
+                               for priority in PRIORITIES},
+                } for backend in self._backends.values() if name in (None, backend.name)},
+            }
+            if name is None:
+                result['users'] = len(self._users)
+            return result
+
+
+_scheduler = Scheduler()
+
+
+def slot(backend):
+    # Context manager holding the turn of one call to backend, e.g. http://odoo:8069
+    if not ADMISSION:
+        return contextlib.nullcontext()
+    return _scheduler.slot(backend)
+
+
+def stats(backend=None):
+    return _scheduler.stats(backend) if ADMISSION else None
@@ -0,0 +1,307 @@
+# End-to-end benchmark of the proxy routes against the synthetic Odoo of mock_odoo.py.
+# The proxy runs in a subprocess (so its peak RSS can be measured) while this
+# process hosts the mock Odoo and the load generator:
+#   python bench.py --requests 200 --concurrency 8 --latency 0.005
+#   python bench.py --routes /fetch-tasks,/fetch-contacts --json after.json --compare before.json
+#   python bench.py --accept-encoding gzip --env JSON_BACKEND=json
+#   python bench.py --env ODOO_PROTOCOL=jsonrpc
+#   python bench.py --server gunicorn --workers 4 --threads 8
+# Linux only: peak RSS is read from /proc.
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import mock_odoo
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+STAGES = ('New', 'In Progress', 'Done', 'Cancelled')
+
+
+
+def server_command(options, port):
+    # Command starting the proxy on port with the development server or gunicorn
+    if options.server == 'gunicorn':
+        return [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}',
+                '--workers', str(options.workers), '--threads', str(options.threads), 'wsgi:app']
+    return [sys.executable, '-c', 'import sys, server; server.create_app().run('
+            'host="127.0.0.1", port=int(sys.argv[1]), threaded=True)', str(port)]
+
+
+def task_item(i):
+    return {'task_name': f'Bench task {i}', 'project_name': f'Project {1 + i % 4}', 'stage_name': STAGES[i % 4],
+            'user_name': 'Mitchell Admin', 'priority': str(i % 2), 'deadline': '2024-06-01'}
+
+
+def timesheet_item(i):
+    return {'task_id': 1 + i % 40, 'unit_amount': 1.5, 'name': f'Bench line {i}', 'date': '2024-06-01'}
+
+
+# (route, method, path, body) where path and body are functions of the request
+# number so that successive requests do not all hit the same record
+SCENARIOS = [
+    ('/get-data', 'GET', lambda i, o: '/get-data', None),
+    ('/login-api', 'POST', lambda i, o: '/login-api', lambda i, o: {'url': o.odoo_url}),
+    ('/test-database-api', 'GET', lambda i, o: '/test-database-api', None),
+    ('/authenticate-api', 'GET', lambda i, o: '/authenticate-api', None),
+    ('/fetch-tasks', 'GET', lambda i, o: '/fetch-tasks', None),
+    ('/fetch-tasks?limit=50', 'GET', lambda i, o: f'/fetch-tasks?limit=50&offset={50 * (i % 4)}', None),
+    ('/fetch-tasks?stream=1', 'GET', lambda i, o: '/fetch-tasks?stream=1', None),
+    ('/fetch-apps', 'GET', lambda i, o: '/fetch-apps', None),
+    ('/isadmin', 'GET', lambda i, o: '/isadmin', None),
+    ('/fetch-new-task', 'GET', lambda i, o: '/fetch-new-task', None),
+    ('/fetch-contacts', 'GET', lambda i, o: '/fetch-contacts', None),
+    ('/fetch-contacts?images=full', 'GET', lambda i, o: '/fetch-contacts?images=full', None),
+    ('/contact-image', 'GET', lambda i, o: f'/contact-image/{2 + 4 * (i % max(1, o.contacts // 4 - 1))}?size=64', None),
+    ('/fetch-timesheet', 'GET', lambda i, o: '/fetch-timesheet', None),
+    ('/timesheet-report', 'GET', lambda i, o: '/timesheet-report?group_by=project,week', None),
+    ('/bootstrap', 'GET', lambda i, o: '/bootstrap?sections=apps,isadmin,tasks', None),
+    ('/sync', 'GET', lambda i, o: '/sync', None),
+    ('/cache-stats', 'GET', lambda i, o: '/cache-stats', None),
+    ('/update-stage', 'POST', lambda i, o: '/update-stage',
+     lambda i, o: {'task_id': 1 + i % o.tasks, 'new_stage_name': STAGES[i % 4]}),
+    ('/update-stage/bulk', 'POST', lambda i, o: '/update-stage/bulk',
+     lambda i, o: [{'task_id': 1 + (i * 20 + j) % o.tasks, 'new_stage_name': STAGES[j % 4]} for j in range(20)]),
+    ('/add-task', 'POST', lambda i, o: '/add-task', lambda i, o: task_item(i)),
+    ('/add-task/bulk', 'POST', lambda i, o: '/add-task/bulk', lambda i, o: [task_item(i * 10 + j) for j in range(10)]),
+    ('/add-timesheet-line', 'POST', lambda i, o: '/add-timesheet-line', lambda i, o: timesheet_item(i)),
+    ('/add-timesheet-line/bulk', 'POST', lambda i, o: '/add-timesheet-line/bulk',
+     lambda i, o: [timesheet_item(i * 10 + j) for j in range(10)]),
+]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def process_tree(pid):
+    # pid and its descendants, e.g. the gunicorn master and its workers
+    pids = [pid]
+    for child_pid in pids:
+        try:
+            with open(f'/proc/{child_pid}/task/{child_pid}/children') as f:
+                pids.extend(int(child) for child in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+def read_status_kb(pid, key):
+    # VmRSS / VmHWM of a process and its descendants, in kB
+    total = 0
+    for process_id in process_tree(pid):
+        try:
+            with open(f'/proc/{process_id}/status') as f:
+                total += next((int(line.split()[1]) for line in f if line.startswith(key + ':')), 0)
+        except OSError:
+            pass
+    return total
+
+
+def reset_peak_rss(pid):
+    # Writing 5 to clear_refs resets VmHWM to the current RSS (Linux >= 4.0)
+    for process_id in process_tree(pid):
+        try:
+            with open(f'/proc/{process_id}/clear_refs', 'w') as f:
+                f.write('5')
+        except OSError:
+            pass
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+class Proxy:
+    # The proxy under test, running in a subprocess
+
+    def __init__(self, command, port, log=False, env=None):
+        self.port = port
+        env = dict(os.environ, CONTACT_IMAGE_CACHE_DIR=tempfile.mkdtemp(prefix='bench-images-'), **(env or {}))
+        output = None if log else subprocess.DEVNULL
+        self.process = subprocess.Popen(command, cwd=SERVER_DIR, env=env, stdout=output, stderr=output)
+        self.local = threading.local()
+
+    def wait_ready(self, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f'Proxy exited with code {self.process.returncode}')
+            try:
+                socket.create_connection(('127.0.0.1', self.port), timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.1)
+        raise RuntimeError('Proxy did not start')
+
+    def request(self, method, path, body=None, headers=None):
+        # One keep-alive connection per load-generator thread
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.local.connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=120)
+        headers = dict(headers or {})
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        try:
+            connection.request(method, path, payload, headers)
+            response = connection.getresponse()
+            data = response.read()
+        except (http.client.HTTPException, OSError):
+            connection.close()
+            raise
+        if response.getheader('Connection', '').lower() == 'close' or response.version == 10:
+            connection.close()
+        return response.status, data
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+def run_scenario(proxy, odoo, options, headers, scenario):
+    route, method, path, body = scenario
+
+    def call(i):
+        start = time.perf_counter()
+        try:
+            status, data = proxy.request(method, path(i, options), body(i, options) if body else None, headers)
+        except Exception:
+            status, data = None, b''
+        return time.perf_counter() - start, status, len(data)
+
+    with ThreadPoolExecutor(options.concurrency) as pool:
+        list(pool.map(call, range(options.warmup)))
+        reset_peak_rss(proxy.process.pid)
+        odoo.calls = 0
+        start = time.perf_counter()
+        results = list(pool.map(call, range(options.warmup, options.warmup + options.requests)))
+        elapsed = time.perf_counter() - start
+
+    latencies = [latency for latency, _, _ in results]
+    return {
+        'route': route,
+        'requests': len(results),
+        'errors': sum(1 for _, status, _ in results if status is None or status >= 400),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'rps': round(len(results) / elapsed, 1),
+        'rpc_per_request': round(odoo.calls / len(results), 2),
+        'kb_per_response': round(sum(size for _, _, size in results) / len(results) / 1024, 1),
+        'peak_rss_mb': round((read_status_kb(proxy.process.pid, 'VmHWM') or 0) / 1024, 1),
+    }
+
+
+def print_table(results):
+    columns = ['route', 'requests', 'errors', 'p50_ms', 'p99_ms', 'rps', 'rpc_per_request', 'kb_per_response',
+               'peak_rss_mb']
+    widths = [max(len(column), *(len(str(result.get(column))) for result in results)) for column in columns]
+    print('  '.join(column.ljust(width) for column, width in zip(columns, widths)))
+    for result in results:
+        print('  '.join(str(result.get(column)).ljust(width) for column, width in zip(columns, widths)))
+
+
+def compare(results, baseline, max_regression):
+    # Returns the regressions of p50 latency and RPC calls beyond max_regression (0.2 = 20%)
+    previous = {result['route']: result for result in baseline}
+    regressions = []
+    for result in results:
+        before = previous.get(result['route'])
+        if before is None:
+            continue
+        for metric in ('p50_ms', 'rpc_per_request'):
+            if before[metric] and result[metric] > before[metric] * (1 + max_regression):
+                regressions.append(f"{result['route']}: {metric} {before[metric]} -> {result[metric]}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the proxy routes against a synthetic Odoo')
+    parser.add_argument('--routes', help='comma separated routes to run (default: all)')
+    parser.add_argument('--requests', type=int, default=100, help='measured requests per route')
+    parser.add_argument('--warmup', type=int, default=10, help='unmeasured requests per route')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--tasks', type=int, default=300)
+    parser.add_argument('--projects', type=int, default=10)
+    parser.add_argument('--contacts', type=int, default=500)
+    parser.add_argument('--lines-per-task', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.005, help='seconds added to every Odoo RPC')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--compare', help='fail when a route regressed compared to this results file')
+    parser.add_argument('--max-regression', type=float, default=0.2)
+    parser.add_argument('--accept-encoding', help='Accept-Encoding header sent with every request, e.g. gzip')
+    parser.add_argument('--env', action='append', default=[], metavar='NAME=VALUE',
+                        help='environment variable of the proxy, e.g. JSON_BACKEND=json (repeatable)')
+    parser.add_argument('--server', choices=['werkzeug', 'gunicorn'], default='werkzeug',
+                        help='development server (threaded) or gunicorn with gunicorn.conf.py')
+    parser.add_argument('--workers', type=int, default=1, help='gunicorn worker processes')
+    parser.add_argument('--threads', type=int, default=32, help='gunicorn threads per worker')
+    parser.add_argument('--server-log', action='store_true', help="show the proxy's output")
+    options = parser.parse_args()
+
+    scenarios = SCENARIOS
+    if options.routes:
+        wanted = options.routes.split(',')
+        scenarios = [scenario for scenario in SCENARIOS if scenario[0] in wanted]
+
+    odoo = mock_odoo.MockOdoo(options.tasks, options.projects, options.contacts, options.lines_per_task,
+                              latency=options.latency)
+    odoo_port = free_port()
+    odoo_server = mock_odoo.serve(odoo, port=odoo_port)
+    options.odoo_url = f'http://127.0.0.1:{odoo_port}'
+
+    env = dict(value.split('=', 1) for value in options.env)
+    if options.server == 'gunicorn' and options.workers > 1 and 'SESSION_REDIS_URL' not in env:
+        # Workers must share the sessions
+        env.setdefault('SESSION_SQLITE_PATH', os.path.join(tempfile.mkdtemp(prefix='bench-sessions-'), 'sessions.db'))
+    port = free_port()
+    proxy = Proxy(server_command(options, port), port, log=options.server_log, env=env)
+    try:
+        proxy.wait_ready()
+        status, data = proxy.request('POST', '/store-data', {'url': options.odoo_url, 'db': 'test',
+                                                             'username': 'admin', 'password': 'admin'})
+        if status != 200:
+            raise RuntimeError(f'/store-data failed: {status} {data[:200]}')
+        headers = {'X-Session-Token': json.loads(data)['token']}
+        if options.accept_encoding:
+            headers['Accept-Encoding'] = options.accept_encoding
+
+        results = []
+        for scenario in scenarios:
+            results.append(run_scenario(proxy, odoo, options, headers, scenario))
+            print(f"{scenario[0]}: p50 {results[-1]['p50_ms']} ms", file=sys.stderr)
+    finally:
+        proxy.stop()
+        odoo_server.shutdown()
+
+    print_table(results)
+    if options.json:
+        with open(options.json, 'w') as f:
+            json.dump({'options': {key: value for key, value in vars(options).items() if key != 'odoo_url'},
+                       'results': results}, f, indent=2)
+    if options.compare:
+        with open(options.compare) as f:
+            regressions = compare(results, json.load(f)['results'], options.max_regression)
+        if regressions:
+            print('Regressions:\n' + '\n'.join(regressions))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
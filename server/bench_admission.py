@@ -0,0 +1,137 @@
+# Latency of one user's small requests while another user floods the proxy
+# with bulk reads, with and without the admission control of admission.py.
+# The synthetic Odoo of mock_odoo.py serves a few ORM calls at once, like
+# Odoo's workers, and takes longer for larger responses. Unless --env says
+# otherwise, the proxy sends Odoo as many calls at once as it has workers:
+#   python bench_admission.py --heavy 16 --seconds 20 --odoo-workers 4
+#   python bench_admission.py --env ADMISSION_USER_RATE=20 --env ADMISSION_MAX_IN_FLIGHT=4
+import argparse
+import json
+import sys
+import threading
+import time
+
+import mock_odoo
+from bench import STAGES, Proxy, free_port, percentile, server_command
+
+
+def login(proxy, url, username):
+    status, data = proxy.request('POST', '/store-data', {'url': url, 'db': 'test', 'username': username,
+                                                         'password': username})
+    if status != 200:
+        raise RuntimeError(f'/store-data failed: {status} {data[:200]}')
+    return {'X-Session-Token': json.loads(data)['token']}
+
+
+def run(options, odoo_url, env):
+    port = free_port()
+    proxy = Proxy(server_command(options, port), port, log=options.server_log, env=env)
+    stop = threading.Event()
+    heavy = {'requests': 0, 'rejected': 0}
+    light = {'latencies': [], 'errors': 0}
+    lock = threading.Lock()
+    try:
+        proxy.wait_ready()
+        heavy_headers = login(proxy, odoo_url, 'admin')
+        light_headers = login(proxy, odoo_url, 'demo')
+
+        def flood(n):
+            # Contact lists, a different search each time so that the reads
+            # are not coalesced
+            i = n
+            while not stop.is_set():
+                try:
+                    status, _ = proxy.request('GET', f'/fetch-contacts?q=contact{i % 100}', None, heavy_headers)
+                except Exception:
+                    status = None
+                with lock:
+                    heavy['requests'] += 1
+                    heavy['rejected'] += status in (429, 503)
+                i += options.heavy
+
+        def interact():
+            i = 0
+            while not stop.is_set():
+                if i % 2:
+                    method, path, body = 'GET', '/isadmin', None
+                else:
+                    method, path, body = 'POST', '/update-stage', {'task_id': 1 + i % options.tasks,
+                                                                   'new_stage_name': STAGES[i % 4]}
+                start = time.perf_counter()
+                try:
+                    status, _ = proxy.request(method, path, body, light_headers)
+                except Exception:
+                    status = None
+                with lock:
+                    light['latencies'].append(time.perf_counter() - start)
+                    light['errors'] += status is None or status >= 400
+                i += 1
+                time.sleep(options.think)
+
+        threads = [threading.Thread(target=flood, args=(n,)) for n in range(options.heavy)]
+        threads.append(threading.Thread(target=interact))
+        for thread in threads:
+            thread.start()
+        time.sleep(options.seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+    finally:
+        stop.set()
+        proxy.stop()
+
+    latencies = light['latencies']
+    return {
+        'light_requests': len(latencies),
+        'light_errors': light['errors'],
+        'light_p50_ms': round(percentile(latencies, 0.5) * 1000, 1),
+        'light_p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+        'heavy_rps': round(heavy['requests'] / options.seconds, 1),
+        'heavy_rejected': heavy['rejected'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the admission control under a heavy user')
+    parser.add_argument('--heavy', type=int, default=16, help='concurrent bulk reads of the heavy user')
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--think', type=float, default=0.05, help='pause between the light user\'s requests')
+    parser.add_argument('--tasks', type=int, default=300)
+    parser.add_argument('--contacts', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.005, help='seconds added to every Odoo RPC')
+    parser.add_argument('--record-latency', type=float, default=0.002, help='seconds added per record returned')
+    parser.add_argument('--odoo-workers', type=int, default=4, help='ORM calls the synthetic Odoo serves at once')
+    parser.add_argument('--env', action='append', default=[], metavar='NAME=VALUE',
+                        help='environment variable of the proxy with admission control (repeatable)')
+    parser.add_argument('--server', choices=['werkzeug', 'gunicorn'], default='werkzeug')
+    parser.add_argument('--workers', type=int, default=1, help='gunicorn worker processes')
+    parser.add_argument('--threads', type=int, default=64, help='gunicorn threads per worker')
+    parser.add_argument('--server-log', action='store_true', help="show the proxy's output")
+    options = parser.parse_args()
+
+    odoo = mock_odoo.MockOdoo(options.tasks, contacts=options.contacts, latency=options.latency,
+                              workers=options.odoo_workers, record_latency=options.record_latency)
+    odoo_port = free_port()
+    odoo_server = mock_odoo.serve(odoo, port=odoo_port)
+    odoo_url = f'http://127.0.0.1:{odoo_port}'
+
+    env = dict(value.split('=', 1) for value in options.env)
+    env.setdefault('ADMISSION_MAX_IN_FLIGHT', str(options.odoo_workers))
+    configurations = [('off', {'ADMISSION': '0'}), ('on', env)]
+    results = []
+    try:
+        for name, env in configurations:
+            results.append(dict({'admission': name}, **run(options, odoo_url, env)))
+            print(f"admission {name}: light p99 {results[-1]['light_p99_ms']} ms", file=sys.stderr)
+    finally:
+        odoo_server.shutdown()
+
+    columns = list(results[0])
+    widths = [max(len(column), *(len(str(result[column])) for result in results)) for column in columns]
+    print('  '.join(column.ljust(width) for column, width in zip(columns, widths)))
+    for result in results:
+        print('  '.join(str(result[column]).ljust(width) for column, width in zip(columns, widths)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+# Compares the XML-RPC and JSON-RPC protocols on the large Odoo reads of the
+# proxy: CPU time and peak memory spent by this process per MB of records (their
+# JSON size, the same for both protocols; the wire size depends on the protocol
+# and on compression). The
+# synthetic Odoo of mock_odoo.py runs in a subprocess so that only the client
+# side (request encoding, response decoding) is measured:
+#   python bench_protocols.py --tasks 1000 --contacts 500
+import argparse
+import sys
+import time
+import tracemalloc
+
+import metrics
+import serialization
+import transport
+from bench import Proxy, free_port
+
+MB = 1024 * 1024
+
+# (name, model, method, args, kwargs) of the calls, as the routes make them
+CALLS = [
+    ('tasks', 'project.task', 'search_read', [[]],
+     {'fields': ['id', 'name', 'project_id', 'stage_id', 'user_ids', 'date_deadline', 'description']}),
+    ('contacts', 'res.partner', 'search_read', [[]],
+     {'fields': ['id', 'name', 'email', 'phone', 'image_1920']}),
+    ('timesheet', 'account.analytic.line', 'search_read', [[]],
+     {'fields': ['id', 'date', 'name', 'unit_amount', 'task_id', 'project_id', 'employee_id']}),
+]
+
+
+def measure(proxy, uid, model, method, args, kwargs, repeat):
+    # Best CPU time, peak traced memory, wire and records size of one call
+    before = metrics.RPC_RESPONSE_BYTES.total(model, method)
+
+    def call():
+        with metrics.label(model, method):
+            return proxy.execute_kw('test', uid, 'admin', model, method, args, kwargs)
+
+    records = call()
+    best = None
+    for _ in range(repeat):
+        start = time.process_time()
+        call()
+        elapsed = time.process_time() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    try:
+        call()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    wire = (metrics.RPC_RESPONSE_BYTES.total(model, method) - before) / (repeat + 2)
+    return best, peak, wire, len(serialization.dumps(records))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark XML-RPC against JSON-RPC on large Odoo reads')
+    parser.add_argument('--tasks', type=int, default=1000)
+    parser.add_argument('--contacts', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=10)
+    options = parser.parse_args()
+
+    port = free_port()
+    odoo = Proxy([sys.executable, 'mock_odoo.py', '--port', str(port), '--tasks', str(options.tasks),
+                  '--contacts', str(options.contacts)], port)
+    url = f'http://127.0.0.1:{port}'
+    try:
+        odoo.wait_ready()
+        uid = transport.get_proxy(url, '/xmlrpc/2/common').authenticate('test', 'admin', 'admin', {})
+        print(f"{'call':10} {'protocol':8} {'MB':>6} {'wire MB':>8} {'CPU ms':>8} {'CPU ms/MB':>10} "
+              f"{'peak MB':>8} {'peak/MB':>8}")
+        for name, model, method, args, kwargs in CALLS:
+            for protocol in transport.PROTOCOLS:
+                proxy = transport.get_proxy(url, '/xmlrpc/2/object', protocol)
+                cpu, peak, wire, size = measure(proxy, uid, model, method, args, kwargs, options.repeat)
+                size /= MB
+                print(f'{name:10} {protocol:8} {size:>6.2f} {wire / MB:>8.2f} {cpu * 1000:>8.1f} '
+                      f'{cpu * 1000 / size:>10.1f} {peak / MB:>8.1f} {peak / MB / size:>8.2f}')
+    finally:
+        transport.close()
+        odoo.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+# Compares the JSON encoders and the response compressions on the payloads of
+# the large routes, built from the synthetic Odoo of mock_odoo.py:
+#   python bench_serialization.py --tasks 1000 --contacts 500
+import argparse
+import gzip
+import json
+import os
+import tempfile
+import time
+
+import mock_odoo
+
+os.environ.setdefault('CONTACT_IMAGE_CACHE_DIR', tempfile.mkdtemp(prefix='bench-images-'))
+
+import compression  # noqa: E402
+import serialization  # noqa: E402
+from bench import free_port  # noqa: E402
+
+ROUTES = ['/fetch-tasks', '/fetch-contacts', '/fetch-contacts?images=thumbnail', '/fetch-contacts?images=full',
+          '/fetch-timesheet']
+
+
+def best_time(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def encoders():
+    # What Flask's default provider does, and the orjson backend
+    yield 'json', lambda obj: json.dumps(obj, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    if serialization.orjson is not None:
+        yield 'orjson', lambda obj: serialization.orjson.dumps(obj, option=serialization.ORJSON_OPTIONS)
+
+
+def compressors():
+    yield 'gzip', lambda data: gzip.compress(data, compresslevel=compression.GZIP_LEVEL, mtime=0)
+    if compression.brotli is not None:
+        yield 'br', lambda data: compression.brotli.compress(data, quality=compression.BROTLI_QUALITY)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark JSON encoders and compression on real payloads')
+    parser.add_argument('--tasks', type=int, default=1000)
+    parser.add_argument('--contacts', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=20)
+    options = parser.parse_args()
+
+    odoo = mock_odoo.MockOdoo(options.tasks, contacts=options.contacts)
+    port = free_port()
+    odoo_server = mock_odoo.serve(odoo, port=port)
+
+    import server
+    client = server.create_app().test_client()
+    response = client.post('/store-data', json={'url': f'http://127.0.0.1:{port}', 'db': 'test',
+                                                'username': 'admin', 'password': 'admin'})
+    headers = {'X-Session-Token': response.get_json()['token']}
+
+    print(f"{'route':34} {'encoder':8} {'bytes':>10} {'encode ms':>10}   compression")
+    try:
+        for route in ROUTES:
+            payload = client.get(route, headers=headers).get_json()
+            for name, encode in encoders():
+                data = encode(payload)
+                encode_time = best_time(lambda: encode(payload), options.repeat)
+                compressed = []
+                for encoding, compress in compressors():
+                    size = len(compress(data))
+                    compress_time = best_time(lambda: compress(data), max(1, options.repeat // 4))
+                    compressed.append(f'{encoding} {size} B ({size / len(data):.0%}) in {compress_time * 1000:.1f} ms')
+                print(f"{route:34} {name:8} {len(data):>10} {encode_time * 1000:>10.2f}   {', '.join(compressed)}")
+    finally:
+        odoo_server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+import http.client
+import os
+import xmlrpc.client
+
+# Largest number of items accepted by one bulk request
+MAX_BULK_ITEMS = int(os.environ.get('MAX_BULK_ITEMS', 500))
+
+
+# Errors of one Odoo call that fail its items rather than the whole request.
+# Odoo rejecting the values, or values XML-RPC cannot send: nothing was
+# written, so the items are sent again one by one to fail the faulty ones only
+REJECTED_ERRORS = (xmlrpc.client.Fault, TypeError, ValueError)
+# The call failing on the way to or from Odoo: Odoo may have written the
+# items already, so they all fail and none is sent again
+TRANSPORT_ERRORS = (xmlrpc.client.ProtocolError, OSError, http.client.HTTPException)
+ITEM_ERRORS = REJECTED_ERRORS + TRANSPORT_ERRORS
+
+
+class BulkError(ValueError):
+    pass
+
+
+def parse_items(data):
+    # Accept either a JSON array or {"items": [...]}, each item being an object
+    items = data.get('items') if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        raise BulkError('Expected a list of items or {"items": [...]}')
+    if len(items) > MAX_BULK_ITEMS:
+        raise BulkError(f'At most {MAX_BULK_ITEMS} items can be sent at once')
+    if not all(isinstance(item, dict) for item in items):
+        raise BulkError('Every item must be an object')
+    return items
+
+
+def ok(index, **values):
+    return dict({'index': index, 'success': True}, **values)
+
+
+def failed(index, error):
+    return {'index': index, 'success': False, 'error': error}
+
+
+def summary(results):
+    return {'success': all(result['success'] for result in results), 'results': results}
+
+
+def outcome(index, result, **values):
+    # Per-item result from an id/True returned by create_records or write_groups, or an exception
+    if isinstance(result, Exception):
+        return failed(index, error_message(result))
+    return ok(index, **values)
+
+
+def error_message(error):
+    return error.faultString if isinstance(error, xmlrpc.client.Fault) else str(error)
+
+
+def create_records(client, model, values):
+    # Create all records with one multi-record create and return, in order, the
+    # new id or the exception of each record. Odoo rolls the whole call back when
+    # one record is rejected, in which case the records are created one by one so
+    # that only the faulty ones fail. A call failing in transit fails all its
+    # records: creating them again could create them twice.
+    if not values:
+        return []
+    try:
+        return client.execute_kw(model, 'create', [values])
+    except TRANSPORT_ERRORS as e:
+        return [e] * len(values)
+    except REJECTED_ERRORS as e:
+        if len(values) == 1:
+            return [e]
+    results = []
+    for record_values in values:
+        try:
+            results.append(client.execute_kw(model, 'create', [record_values]))
+        except ITEM_ERRORS as e:
+            results.append(e)
+    return results
+
+
+def write_groups(client, model, groups):
+    # groups maps a hashable key to (ids, values); records sharing the same
+    # values are written with one call. Returns {record id: True or exception},
+    # falling back to one write per record when Odoo rejects a group; a group
+    # failing in transit fails all its records, writes are not sent again.
+    results = {}
+    for ids, values in groups.values():
+        try:
+            client.execute_kw(model, 'write', [ids, values])
+            results.update((record_id, True) for record_id in ids)
+        except TRANSPORT_ERRORS as e:
+            results.update((record_id, e) for record_id in ids)
+        except REJECTED_ERRORS as e:
+            if len(ids) == 1:
+                results[ids[0]] = e
+                continue
+            for record_id in ids:
+                try:
+                    client.execute_kw(model, 'write', [[record_id], values])
+                    results[record_id] = True
+                except ITEM_ERRORS as e:
+                    results[record_id] = e
+    return results
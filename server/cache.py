@@ -0,0 +1,130 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Maximum number of entries kept by the reference-data cache
+CACHE_MAX_ENTRIES = int(os.environ.get('REFERENCE_CACHE_MAX_ENTRIES', 2048))
+
+# Seconds each reference model stays cached; models not listed are not cached
+MODEL_TTLS = {
+    'ir.module.module': 600,
+    'res.groups': 3600,
+    'project.task.type': 300,
+    'project.tags': 300,
+    'project.project': 120,
+    'res.users': 300,
+}
+
+# Models whose content does not depend on the reading user's access rights,
+# cached once per database instead of once per user
+SHARED_MODELS = {'ir.module.module', 'res.groups', 'project.task.type', 'project.tags'}
+
+
+class TTLCache:
+    # Thread-safe LRU cache whose entries also expire after a per-entry TTL
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = {}
+        self.misses = {}
+
+    def get(self, key, group):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits[group] = self.hits.get(group, 0) + 1
+                return entry[0]
+            if entry is not None:
+                del self._data[key]
+            self.misses[group] = self.misses.get(group, 0) + 1
+            return None
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def invalidate(self, match):
+        with self._lock:
+            for key in [key for key in self._data if match(key)]:
+                del self._data[key]
+
+    def stats(self):
+        with self._lock:
+            groups = set(self.hits) | set(self.misses)
+            entries = {}
+            for key in self._data:
+                entries[key[2]] = entries.get(key[2], 0) + 1
+            result = {}
+            for group in sorted(groups | set(entries)):
+                hits = self.hits.get(group, 0)
+                misses = self.misses.get(group, 0)
+                result[group] = {
+                    'hits': hits,
+                    'misses': misses,
+                    'hit_ratio': round(hits / (hits + misses), 3) if hits + misses else None,
+                    'entries': entries.get(group, 0),
+                }
+            return result
+
+
+class ReferenceCache:
+    # Cached reads of rarely changing Odoo models (stages, tags, groups,
+    # installed apps...) with name -> id lookups. Keys are
+    # (url, db, model, uid or None, query), so shared models are reused by
+    # every user of a database.
+
+    def __init__(self, ttls=None, max_entries=CACHE_MAX_ENTRIES):
+        self.ttls = dict(MODEL_TTLS, **(ttls or {}))
+        self._cache = TTLCache(max_entries)
+
+    def _key(self, client, model, query):
+        uid = None if model in SHARED_MODELS else client.uid
+        return (client.url, client.db, model, uid, query)
+
+    def search_read(self, client, model, domain, fields, force=False):
+        ttl = self.ttls.get(model)
+        if not ttl:
+            return client.execute_kw(model, 'search_read', [domain], {'fields': fields})
+        key = self._key(client, model, repr((domain, fields)))
+        records = None if force else self._cache.get(key, model)
+        if records is None:
+            records = client.execute_kw(model, 'search_read', [domain], {'fields': fields})
+            self._cache.set(key, records, ttl)
+        # Callers receive copies so they can enrich records without touching the cache
+        return [dict(record) for record in records]
+
+    def name_index(self, client, model, domain=None, force=False):
+        # {name: [ids in Odoo's default order]} for the records matching domain
+        index = {}
+        for record in self.search_read(client, model, domain or [], ['id', 'name'], force):
+            index.setdefault(record['name'], []).append(record['id'])
+        return index
+
+    def ids_by_name(self, client, model, name, domain=None):
+        # Look a name up in the cached index; a miss reloads the index once in
+        # case the record was created after it was cached
+        ids = self.name_index(client, model, domain).get(name)
+        if not ids:
+            ids = self.name_index(client, model, domain, force=True).get(name)
+        return ids or []
+
+    def ids_by_names(self, client, model, names, domain=None):
+        # Bulk variant of ids_by_name returning {name: ids}, with at most one reload
+        index = self.name_index(client, model, domain)
+        if any(not index.get(name) for name in names):
+            index = self.name_index(client, model, domain, force=True)
+        return {name: index.get(name, []) for name in names}
+
+    def invalidate(self, url=None, db=None, model=None):
+        self._cache.invalidate(lambda key: (url is None or key[0] == url) and (db is None or key[1] == db)
+                               and (model is None or key[2] == model))
+
+    def stats(self):
+        return self._cache.stats()
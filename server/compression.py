@@ -0,0 +1,53 @@
+import gzip
+import os
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, responses are then only gzipped
+    brotli = None
+
+# Responses smaller than this (in bytes) are sent uncompressed
+MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', 6))
+BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', 5))
+
+# Content types worth compressing; images are already compressed
+COMPRESSIBLE_TYPES = {'application/json', 'application/x-ndjson', 'image/svg+xml'}
+
+
+def available_encodings():
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def compress_response(request, response):
+    # Compress the body with the best encoding the client accepts. Streamed
+    # responses are sent as they are produced and left uncompressed.
+    if response.direct_passthrough or response.is_streamed or 'Content-Encoding' in response.headers \
+            or response.status_code < 200 or response.status_code in (204, 304) or request.method == 'HEAD':
+        return response
+    mimetype = response.mimetype or ''
+    if mimetype not in COMPRESSIBLE_TYPES and not mimetype.startswith('text/'):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = request.accept_encodings.best_match(available_encodings())
+    if encoding is None:
+        return response
+    data = response.get_data()
+    if len(data) < MIN_SIZE:
+        return response
+
+    response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    # The compressed body is another representation of the same resource:
+    # keep the ETag usable for If-None-Match but mark it weak
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
@@ -0,0 +1,17 @@
+import hashlib
+import json
+
+
+def version(records):
+    # Summary of records read with ['write_date']: count, newest write_date and a
+    # digest of every (id, write_date), which also catches a record replaced by
+    # another one or an older record updated to the same second as the newest
+    stamps = ','.join(f"{record['id']}:{record.get('write_date')}" for record in records)
+    dates = [record['write_date'] for record in records if record.get('write_date')]
+    return [len(records), max(dates) if dates else None, hashlib.sha1(stamps.encode('utf-8')).hexdigest()]
+
+
+def make(*parts):
+    # ETag of a response from what it depends on (request path, versions, cached data)
+    raw = json.dumps(parts, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
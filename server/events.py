@@ -0,0 +1,266 @@
+import json
+import os
+import queue
+import threading
+import time
+import xmlrpc.client
+
+import watermarks
+
+# Seconds between two polls of an Odoo database for changes
+POLL_INTERVAL = float(os.environ.get('EVENTS_POLL_INTERVAL', 5))
+# Seconds between keep-alive comments on idle event streams
+KEEPALIVE_INTERVAL = float(os.environ.get('EVENTS_KEEPALIVE_INTERVAL', 15))
+# Events buffered per client before it is told to resync instead
+QUEUE_SIZE = int(os.environ.get('EVENTS_QUEUE_SIZE', 100))
+# Streams open at once in this process. Each one holds a request thread of
+# the gthread worker, so by default half of them stay free for the other
+# routes; 0 does not limit the streams
+MAX_STREAMS = int(os.environ.get('EVENTS_MAX_STREAMS', int(os.environ.get('GUNICORN_THREADS', 32)) // 2))
+# Seconds the clients refused a stream are told to wait, polling meanwhile
+RETRY_AFTER = int(os.environ.get('EVENTS_RETRY_AFTER', 30))
+
+TASK_EVENT_FIELDS = ['name', 'stage_id', 'project_id', 'user_ids', 'write_date']
+
+
+class StreamLimitError(Exception):
+    # Raised instead of opening a stream when MAX_STREAMS are already open
+
+    def __init__(self, max_streams, retry_after=RETRY_AFTER):
+        self.retry_after = retry_after
+        super().__init__(f"Too many event streams open ({max_streams}), retry in {retry_after}s")
+
+
+def format_event(event, data):
+    # One Server-Sent Events message
+    return f'event: {event}\ndata: {json.dumps(data, separators=(",", ":"), default=str)}\n\n'
+
+
+class Subscription:
+    # Events for one connected client, filtered on the tasks assigned to its user
+
+    def __init__(self, client):
+        self.client = client
+        self.uid = client.uid
+        self.queue = queue.Queue(QUEUE_SIZE)
+
+    def close(self):
+        # Ends the stream after the events already queued
+        while True:
+            try:
+                self.queue.put_nowait(None)
+                return
+            except queue.Full:
+                # Make room by dropping the oldest event
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def push(self, event, data):
+        try:
+            self.queue.put_nowait((event, data))
+        except queue.Full:
+            # The client is not keeping up: drop what is buffered and ask it to refetch
+            while True:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            self.queue.put_nowait(('resync', {}))
+
+    def stream(self, keepalive=KEEPALIVE_INTERVAL):
+        # Yields SSE messages until the client disconnects
+        yield f'retry: {int(POLL_INTERVAL * 1000)}\n\n'
+        yield format_event('ready', {'poll_interval': POLL_INTERVAL})
+        while True:
+            try:
+                item = self.queue.get(timeout=keepalive)
+            except queue.Empty:
+                yield ': keepalive\n\n'
+                continue
+            if item is None:
+                return
+            yield format_event(*item)
+
+
+class _Watermark:
+    # Newest change already notified to one user
+
+    def __init__(self):
+        self.since = None
+        # (model, id, write_date) already notified at the watermark second
+        self.seen = set()
+
+
+class DatabasePoller:
+    # Background thread polling one Odoo database for task and activity changes
+    # and fanning them out to the subscribers. Each user is polled with the
+    # credentials of one of their own subscriptions, so that the changes are
+    # read under that user's record rules; Odoo sees the same load whatever
+    # the number of streams each user opens.
+
+    def __init__(self, hub, key, interval=POLL_INTERVAL):
+        self.hub = hub
+        self.key = key
+        self.interval = interval
+        self.subscriptions = []
+        # uid -> _Watermark
+        self.watermarks = {}
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self.run, name=f'events-{key[1]}', daemon=True)
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                self.hub.log_error(f"Error while polling {self.key[0]} for changes: {e}")
+            self._stop.wait(self.interval)
+
+    def stop(self):
+        self._stop.set()
+
+    def poll(self):
+        with self.hub.lock:
+            subscriptions = list(self.subscriptions)
+        by_uid = {}
+        for subscription in subscriptions:
+            by_uid.setdefault(subscription.uid, []).append(subscription)
+        for uid in [uid for uid in self.watermarks if uid not in by_uid]:
+            del self.watermarks[uid]
+
+        for uid, user_subscriptions in by_uid.items():
+            watermark = self.watermarks.setdefault(uid, _Watermark())
+            # Any session of the user will do: when Odoo rejects one, e.g. its
+            # password changed, the next one is tried
+            error = None
+            for subscription in user_subscriptions:
+                try:
+                    self.poll_user(subscription.client, uid, watermark, user_subscriptions)
+                    error = None
+                    break
+                except xmlrpc.client.Fault as e:
+                    error = e
+                except Exception as e:
+                    # Odoo unreachable: the other users are polled all the same
+                    error = e
+                    break
+            if error is not None:
+                self.hub.log_error(f"Error while polling {self.key[0]} for the changes of user {uid}: {error}")
+
+    def start(self, client, uid, watermark):
+        # Start from the newest change so that only later ones are notified
+        domains = (('project.task', [['user_ids', 'in', [uid]]]),
+                   ('mail.activity', [['res_model', '=', 'project.task']]))
+        latest = []
+        for model, domain in domains:
+            latest += client.execute_kw(model, 'search_read', [domain],
+                                        {'fields': ['write_date'], 'order': 'write_date desc', 'limit': 1})
+        watermark.since = watermarks.latest(latest, time.strftime(watermarks.ODOO_DATETIME_FORMAT, time.gmtime()))
+        for model, domain in domains:
+            for record in client.execute_kw(model, 'search_read', [domain + [['write_date', '=', watermark.since]]],
+                                            {'fields': ['write_date']}):
+                watermark.seen.add((model, record['id'], record['write_date']))
+
+    def poll_user(self, client, uid, watermark, subscriptions):
+        # Changes to the tasks of the user uid since its watermark, read as that user
+        if watermark.since is None:
+            self.start(client, uid, watermark)
+            return
+
+        # >= since: Odoo write dates have a one second resolution, so records
+        # written in the same second as the watermark are read again and
+        # filtered out with watermark.seen
+        tasks = client.execute_kw('project.task', 'search_read',
+                                  [[['write_date', '>=', watermark.since], ['user_ids', 'in', [uid]]]],
+                                  {'fields': TASK_EVENT_FIELDS})
+        activities = client.execute_kw('mail.activity', 'search_read',
+                                       [[['write_date', '>=', watermark.since], ['res_model', '=', 'project.task']]],
+                                       {'fields': ['res_id', 'write_date']})
+        tasks = [task for task in tasks if ('project.task', task['id'], task['write_date']) not in watermark.seen]
+        activities = [activity for activity in activities
+                      if ('mail.activity', activity['id'], activity['write_date']) not in watermark.seen]
+        if not tasks and not activities:
+            return
+
+        # Which of the tasks whose activities changed are assigned to the user
+        activity_task_ids = {activity['res_id'] for activity in activities}
+        user_task_ids = {task['id'] for task in tasks}
+        missing = list(activity_task_ids - user_task_ids)
+        if missing:
+            user_task_ids.update(client.execute_kw('project.task', 'search',
+                                                   [[['id', 'in', missing], ['user_ids', 'in', [uid]]]]))
+
+        since = watermarks.latest(tasks + activities, watermark.since)
+        if since != watermark.since:
+            watermark.seen = set()
+        watermark.since = since
+        watermark.seen.update(('project.task', task['id'], task['write_date'])
+                              for task in tasks if task['write_date'] == since)
+        watermark.seen.update(('mail.activity', activity['id'], activity['write_date'])
+                              for activity in activities if activity['write_date'] == since)
+
+        for task in tasks:
+            del task['user_ids']
+        task_ids = sorted(activity_task_ids & user_task_ids)
+        for subscription in subscriptions:
+            if tasks:
+                subscription.push('tasks', {'tasks': [dict(task) for task in tasks]})
+            if task_ids:
+                subscription.push('activities', {'task_ids': task_ids})
+
+
+class EventHub:
+    # Registry of the database pollers, started with their first subscriber
+    # and stopped with their last one
+
+    def __init__(self, log_error=print, interval=POLL_INTERVAL, max_streams=MAX_STREAMS):
+        self.log_error = log_error
+        self.interval = interval
+        self.max_streams = max_streams
+        self.lock = threading.Lock()
+        self.pollers = {}
+
+    def subscribe(self, client):
+        # Raises StreamLimitError when max_streams streams are already open
+        subscription = Subscription(client)
+        key = (client.url, client.db)
+        with self.lock:
+            if self.max_streams and self.streams() >= self.max_streams:
+                raise StreamLimitError(self.max_streams)
+            poller = self.pollers.get(key)
+            if poller is None:
+                poller = self.pollers[key] = DatabasePoller(self, key, self.interval)
+                poller.thread.start()
+            poller.subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        key = (subscription.client.url, subscription.client.db)
+        with self.lock:
+            poller = self.pollers.get(key)
+            if poller is None:
+                return
+            if subscription in poller.subscriptions:
+                poller.subscriptions.remove(subscription)
+            if not poller.subscriptions:
+                poller.stop()
+                del self.pollers[key]
+
+    def streams(self):
+        # Streams open, with the lock held
+        return sum(len(poller.subscriptions) for poller in self.pollers.values())
+
+    def close(self):
+        # Stop every poller and end the open streams, on shutdown
+        with self.lock:
+            pollers, self.pollers = list(self.pollers.values()), {}
+        for poller in pollers:
+            poller.stop()
+            for subscription in poller.subscriptions:
+                subscription.close()
+
+    def stats(self):
+        with self.lock:
+            return {f'{url}/{db}': len(poller.subscriptions) for (url, db), poller in self.pollers.items()}
@@ -0,0 +1,116 @@
+import re
+
+# Longest text accepted by the ?q= searches
+MAX_SEARCH_LENGTH = 100
+
+DATE_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+
+class FilterError(ValueError):
+    pass
+
+
+def _ids_arg(args, name):
+    # Comma separated ids such as ?project_id=3,7
+    value = args.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        ids = [int(part) for part in value.split(',') if part.strip()]
+    except ValueError:
+        raise FilterError(f'{name} must be a comma separated list of ids')
+    if not ids or min(ids) <= 0:
+        raise FilterError(f'{name} must be a comma separated list of ids')
+    return ids
+
+
+def _date_arg(args, name):
+    value = args.get(name)
+    if value in (None, ''):
+        return None
+    if not DATE_PATTERN.match(value):
+        raise FilterError(f'{name} must be a YYYY-MM-DD date')
+    return value
+
+
+def _search_arg(args):
+    value = (args.get('q') or '').strip()
+    if len(value) > MAX_SEARCH_LENGTH:
+        raise FilterError(f'q must be at most {MAX_SEARCH_LENGTH} characters')
+    return value or None
+
+
+def parse_fields(args, allowed, default):
+    # ?fields=name,stage_id validated against a whitelist; the default list when absent.
+    # The order of default is kept so that the read stays the same for a given set.
+    value = args.get('fields')
+    if value in (None, ''):
+        return list(default)
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise FilterError(f"Unknown fields: {', '.join(unknown)}")
+    if not fields:
+        raise FilterError('fields must not be empty')
+    return list(dict.fromkeys(fields))
+
+
+def task_domain(args):
+    # Filters of /fetch-tasks: project_id, stage_id, deadline_from, deadline_to, q (name)
+    domain = []
+    project_ids = _ids_arg(args, 'project_id')
+    if project_ids:
+        domain.append(['project_id', 'in', project_ids])
+    stage_ids = _ids_arg(args, 'stage_id')
+    if stage_ids:
+        domain.append(['stage_id', 'in', stage_ids])
+    deadline_from = _date_arg(args, 'deadline_from')
+    if deadline_from:
+        domain.append(['date_deadline', '>=', deadline_from])
+    deadline_to = _date_arg(args, 'deadline_to')
+    if deadline_to:
+        domain.append(['date_deadline', '<=', deadline_to])
+    if deadline_from and deadline_to and deadline_from > deadline_to:
+        raise FilterError('deadline_from must not be after deadline_to')
+    search = _search_arg(args)
+    if search:
+        domain.append(['name', 'ilike', search])
+    return domain
+
+
+def contact_domain(args):
+    # Filters of /fetch-contacts: q (name or email)
+    search = _search_arg(args)
+    if search:
+        return ['|', ['name', 'ilike', search], ['email', 'ilike', search]]
+    return []
+
+
+def parse_group_by(args, allowed, default):
+    # ?group_by=project,week validated against a whitelist
+    value = args.get('group_by')
+    if value in (None, ''):
+        return list(default)
+    group_by = [group.strip() for group in value.split(',') if group.strip()]
+    unknown = [group for group in group_by if group not in allowed]
+    if unknown or not group_by:
+        raise FilterError(f"group_by must be a comma separated list of: {', '.join(sorted(allowed))}")
+    return list(dict.fromkeys(group_by))
+
+
+def timesheet_domain(args):
+    # Filters of /timesheet-report: date_from, date_to, project_id, task_id, employee_id
+    domain = []
+    date_from = _date_arg(args, 'date_from')
+    if date_from:
+        domain.append(['date', '>=', date_from])
+    date_to = _date_arg(args, 'date_to')
+    if date_to:
+        domain.append(['date', '<=', date_to])
+    if date_from and date_to and date_from > date_to:
+        raise FilterError('date_from must not be after date_to')
+    for name in ('project_id', 'task_id', 'employee_id'):
+        ids = _ids_arg(args, name)
+        if ids:
+            domain.append([name, 'in', ids])
+    return domain
@@ -0,0 +1,87 @@
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+import admission
+
+# Maximum number of fanned-out RPCs in flight at once against one Odoo backend,
+# for each admission priority
+MAX_CONCURRENCY = int(os.environ.get('ODOO_MAX_CONCURRENCY', 8))
+# Threads shared by all requests of an app to run independent Odoo calls, for
+# each admission priority
+WORKERS = int(os.environ.get('ODOO_GATEWAY_WORKERS', 32))
+
+# Set in the gateway threads while they run a call
+_local = threading.local()
+
+
+def _limited(semaphore, call):
+    with semaphore:
+        _local.in_gateway = True
+        try:
+            return call()
+        finally:
+            _local.in_gateway = False
+
+
+class Gateway:
+    # Threads of one app running independent Odoo calls side by side, for each
+    # admission priority: the calls of the bulk reads waiting for their turn
+    # cannot hold up the threads and slots of the others
+
+    def __init__(self, workers=WORKERS, max_concurrency=MAX_CONCURRENCY):
+        self.max_concurrency = max_concurrency
+        self._executors = {priority: ThreadPoolExecutor(max_workers=workers,
+                                                        thread_name_prefix=f'odoo-gateway-{priority}')
+                           for priority in admission.PRIORITIES}
+        self._semaphores = {}
+        self._semaphores_lock = threading.Lock()
+
+    def _semaphore(self, backend, priority):
+        with self._semaphores_lock:
+            semaphore = self._semaphores.get((backend, priority))
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(self.max_concurrency)
+                self._semaphores[(backend, priority)] = semaphore
+        return semaphore
+
+    def shutdown(self, wait=True):
+        # Wait for the calls in flight to finish, then stop the gateway threads
+        for executor in self._executors.values():
+            executor.shutdown(wait=wait)
+
+    def run_concurrently(self, backend, calls):
+        # Run zero-argument callables concurrently, at most max_concurrency at a
+        # time per backend, and return their results in order. The first
+        # exception raised by a call is re-raised once all of them have finished.
+        # Calls fanned out by a call already running in the gateway (e.g. the
+        # sections of /bootstrap) run in its thread: waiting on the pool from
+        # one of its threads could use up every thread and deadlock
+        if len(calls) <= 1 or getattr(_local, 'in_gateway', False):
+            return [call() for call in calls]
+
+        priority = admission.priority()
+        semaphore = self._semaphore(backend, priority)
+        # Each call runs in a copy of the caller's context so request-scoped state follows it
+        futures = [self._executors[priority].submit(contextvars.copy_context().run, _limited, semaphore, call)
+                   for call in calls]
+
+        results = []
+        error = None
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(None)
+                error = error or e
+        if error is not None:
+            raise error
+        return results
+
+
+def run_concurrently(backend, calls):
+    # Gateway.run_concurrently with the gateway of the current app
+    return current_app.gateway.run_concurrently(backend, calls)
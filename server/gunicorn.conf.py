@@ -0,0 +1,55 @@
+# Gunicorn settings for the proxy, all overridable from the environment:
+#   gunicorn -c gunicorn.conf.py wsgi:app
+#
+# The proxy mostly waits on Odoo, so each worker serves many requests at once
+# with threads (gthread). Open /events streams hold one thread each, so at
+# most EVENTS_MAX_STREAMS of them (half the threads by default) are accepted.
+# With more than one worker, sessions must be shared between the workers:
+# set SESSION_REDIS_URL, or SESSION_SQLITE_PATH on a single host.
+import os
+import signal
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS', 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 32))
+
+# Seconds an idle keep-alive connection is kept open for the next request of
+# the same client; phones reuse it across their successive polls
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 15))
+# A worker silent for this long is restarted; above ODOO_READ_TIMEOUT so
+# that a slow Odoo call fails on its own first
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 150))
+# On SIGTERM, in-flight requests (and their Odoo calls) get this long to finish
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+
+# Bound the request line and headers, bodies are read by Flask
+limit_request_line = 8190
+limit_request_fields = 100
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG') or None
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def post_worker_init(worker):
+    # Open /events streams never finish on their own: end them as soon as the
+    # worker is asked to stop, so that graceful_timeout is spent on real requests
+    app = worker.wsgi
+    previous = signal.getsignal(signal.SIGTERM)
+
+    def handle_term(signum, frame):
+        app.event_hub.close()
+        if callable(previous):
+            previous(signum, frame)
+
+    signal.signal(signal.SIGTERM, handle_term)
+
+
+def worker_exit(server, worker):
+    # Runs in the worker once it stopped accepting requests and its in-flight
+    # requests finished (or graceful_timeout expired)
+    app = getattr(worker, 'wsgi', None)
+    if hasattr(app, 'event_hub'):
+        import server as proxy
+        proxy.shutdown(app)
@@ -0,0 +1,149 @@
+import base64
+import hashlib
+import os
+import tempfile
+import threading
+from io import BytesIO
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional, images are then served at Odoo's stored sizes
+    Image = None
+
+# Directory and size limit (in MB) of the on-disk cache of resized images
+CACHE_DIR = os.environ.get('CONTACT_IMAGE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'odoo-proxy-images'))
+CACHE_MAX_MB = int(os.environ.get('CONTACT_IMAGE_CACHE_MB', 256))
+
+# Sizes Odoo stores for image mixin fields (image_128 ... image_1920)
+ODOO_IMAGE_SIZES = (128, 256, 512, 1024, 1920)
+MIN_SIZE = 16
+
+
+def clamp_size(size):
+    return max(MIN_SIZE, min(size, ODOO_IMAGE_SIZES[-1]))
+
+
+def source_field(size):
+    # Smallest stored Odoo image that is at least as large as the requested size
+    for odoo_size in ODOO_IMAGE_SIZES:
+        if odoo_size >= size:
+            return f'image_{odoo_size}'
+    return 'image_1920'
+
+
+def image_etag(record_id, write_date, size=None):
+    stamp = ''.join(c for c in str(write_date) if c.isdigit())
+    return f'{record_id}-{stamp}' if size is None else f'{record_id}-{stamp}-{size}'
+
+
+def resize(data, size):
+    # Returns (bytes, mimetype) of the image scaled to fit in a size x size box
+    if Image is None:
+        return data, guess_mimetype(data)
+    with Image.open(BytesIO(data)) as image:
+        if max(image.size) > size:
+            image.thumbnail((size, size))
+        output = BytesIO()
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image.save(output, format='PNG', optimize=True)
+            return output.getvalue(), 'image/png'
+        image.convert('RGB').save(output, format='JPEG', quality=85, optimize=True)
+        return output.getvalue(), 'image/jpeg'
+
+
+def guess_mimetype(data):
+    if data.startswith(b'\x89PNG'):
+        return 'image/png'
+    if data.startswith(b'\xff\xd8'):
+        return 'image/jpeg'
+    if data.startswith(b'GIF8'):
+        return 'image/gif'
+    if data.lstrip().startswith(b'<'):
+        return 'image/svg+xml'
+    return 'application/octet-stream'
+
+
+def decode(value):
+    if not value:
+        return None
+    if isinstance(value, bytes):
+        return value
+    return base64.b64decode(value)
+
+
+class ImageCache:
+    # Bounded on-disk cache of resized images; the least recently used files
+    # are removed once the cache grows past max_bytes
+
+    # Images of another type are stored and served as application/octet-stream
+    EXTENSIONS = {'image/png': '.png', 'image/jpeg': '.jpg', 'image/gif': '.gif', 'image/svg+xml': '.svg',
+                  'application/octet-stream': '.bin'}
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_MB * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._size = sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+
+    def _key(self, *parts):
+        return hashlib.sha1('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+    def get(self, *parts):
+        key = self._key(*parts)
+        for mimetype, extension in self.EXTENSIONS.items():
+            path = os.path.join(self.directory, key + extension)
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                continue
+            os.utime(path)  # Mark as recently used
+            return data, mimetype
+        return None
+
+    def put(self, data, mimetype, *parts):
+        key = self._key(*parts)
+        path = os.path.join(self.directory, key + self.EXTENSIONS.get(mimetype, '.bin'))
+        temp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        with self._lock:
+            # The entry replaced, with this type or another, stops counting
+            for extension in self.EXTENSIONS.values():
+                old_path = os.path.join(self.directory, key + extension)
+                try:
+                    self._size -= os.stat(old_path).st_size
+                    if old_path != path:
+                        os.remove(old_path)
+                except FileNotFoundError:
+                    pass
+            os.replace(temp_path, path)
+            self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def stats(self):
+        with self._lock:
+            files = sum(1 for entry in os.scandir(self.directory) if entry.is_file())
+            return {'files': files, 'bytes': self._size, 'max_bytes': self.max_bytes}
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        # Evict down to 90% of the limit so that we do not rescan on every write
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._size = total
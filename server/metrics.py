@@ -0,0 +1,270 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# (model, method) of the Odoo call in progress, set by OdooClient around execute_kw
+_rpc_label = contextvars.ContextVar('rpc_label', default=None)
+# RequestStats of the Flask request being served; the gateway threads see the
+# same object because they run in a copy of the request's context
+_request_stats = contextvars.ContextVar('request_stats', default=None)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+
+    def __init__(self, name, description, labels):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labels, label_values)} {value}')
+        return lines
+
+
+class Gauge:
+
+    def __init__(self, name, description, labels):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def add(self, amount, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} gauge']
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labels, label_values)} {value}')
+        return lines
+
+
+class Histogram:
+
+    def __init__(self, name, description, labels, buckets):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> [count per bucket..., count in +Inf, sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            counts = self._values.get(label_values)
+            if counts is None:
+                counts = self._values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[len(self.buckets)] += 1
+            counts[-1] += value
+
+    def total(self, *label_values):
+        # Sum of the values observed with these label values
+        with self._lock:
+            counts = self._values.get(label_values)
+            return counts[-1] if counts else 0
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for label_values, counts in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), counts):
+                    cumulative += count
+                    labels = _format_labels(self.labels, label_values, f'le="{bound}"')
+                    lines.append(f'{self.name}_bucket{labels} {cumulative}')
+                labels = _format_labels(self.labels, label_values)
+                lines.append(f'{self.name}_sum{labels} {round(counts[-1], 6)}')
+                lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+RPC_DURATION = Histogram('odoo_rpc_duration_seconds', 'Duration of the RPC calls to Odoo',
+                         ('model', 'method'), LATENCY_BUCKETS)
+RPC_REQUEST_BYTES = Histogram('odoo_rpc_request_bytes', 'Size of the RPC requests sent to Odoo',
+                              ('model', 'method'), SIZE_BUCKETS)
+RPC_RESPONSE_BYTES = Histogram('odoo_rpc_response_bytes', 'Size of the RPC responses received from Odoo',
+                               ('model', 'method'), SIZE_BUCKETS)
+RPC_ERRORS = Counter('odoo_rpc_errors_total', 'RPC calls to Odoo that failed or returned a fault, by exception class',
+                     ('model', 'method', 'error'))
+RPC_RETRIES = Counter('odoo_rpc_retries_total', 'Reads sent again after a transient failure', ())
+BREAKER_OPENED = Counter('odoo_breaker_opened_total', 'Times the circuit breaker of a backend opened', ('backend',))
+STALE_RESPONSES = Counter('http_stale_responses_total', 'Last good responses served instead of a fresh one',
+                          ('route', 'reason'))
+RPC_COALESCED = Counter('odoo_rpc_coalesced_total', 'Reads answered by an identical call already in flight',
+                        ('model', 'method'))
+WRITES_QUEUED = Counter('write_queue_operations_total', 'Writes queued to be flushed to Odoo in the background',
+                        ('model', 'method'))
+WRITES_COLLAPSED = Counter('write_queue_collapsed_total', 'Queued writes merged into a pending write of the same record',
+                           ('model', 'method'))
+WRITES_RETRIED = Counter('write_queue_retries_total', 'Queued writes sent again after Odoo could not be reached',
+                         ('model', 'method'))
+WRITES_FAILED = Counter('write_queue_failed_total', 'Queued writes that Odoo rejected or that ran out of retries',
+                        ('model', 'method'))
+REPLICA_READS = Counter('replica_reads_total', 'Reads of replicated models: hit, or sent to Odoo (stale, unsupported)',
+                        ('model', 'method', 'outcome'))
+REPLICA_SYNCS = Counter('replica_syncs_total', 'Syncs of a replicated model from Odoo', ('model', 'outcome'))
+ADMISSION_QUEUED = Gauge('odoo_admission_queued', 'Odoo calls waiting for their turn', ('backend', 'priority'))
+ADMISSION_IN_FLIGHT = Gauge('odoo_admission_in_flight', 'Odoo calls running', ('backend',))
+ADMISSION_WAIT = Histogram('odoo_admission_wait_seconds', 'Time Odoo calls waited for their turn', ('priority',),
+                           LATENCY_BUCKETS)
+ADMISSION_REJECTED = Counter('odoo_admission_rejected_total',
+                             'Odoo calls refused: user over their rate, queue full or wait timed out',
+                             ('backend', 'priority', 'reason'))
+HTTP_DURATION = Histogram('http_request_duration_seconds', 'Time spent handling requests, streamed bodies excluded',
+                          ('route', 'method'), LATENCY_BUCKETS)
+HTTP_REQUESTS = Counter('http_requests_total', 'Requests handled', ('route', 'method', 'status'))
+HTTP_RPC_CALLS = Histogram('http_request_odoo_calls', 'Odoo calls made per request', ('route',), COUNT_BUCKETS)
+HTTP_ODOO_SECONDS = Histogram('http_request_odoo_seconds', 'Time spent in Odoo calls per request',
+                              ('route',), LATENCY_BUCKETS)
+HTTP_SERIALIZE_SECONDS = Histogram('http_request_serialize_seconds', 'Time spent encoding JSON per request',
+                                   ('route',), LATENCY_BUCKETS)
+
+REGISTRY = [RPC_DURATION, RPC_REQUEST_BYTES, RPC_RESPONSE_BYTES, RPC_ERRORS, RPC_COALESCED, RPC_RETRIES, BREAKER_OPENED, STALE_RESPONSES,
+            WRITES_QUEUED, WRITES_COLLAPSED, WRITES_RETRIED, WRITES_FAILED,
+            REPLICA_READS, REPLICA_SYNCS, ADMISSION_QUEUED, ADMISSION_IN_FLIGHT, ADMISSION_WAIT, ADMISSION_REJECTED,
+            HTTP_DURATION, HTTP_REQUESTS, HTTP_RPC_CALLS, HTTP_ODOO_SECONDS, HTTP_SERIALIZE_SECONDS]
+
+
+class RequestStats:
+    # Odoo calls and timings of one Flask request
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.rpc_calls = 0
+        self.timings = {'odoo': 0.0, 'serialize': 0.0}
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds, rpc=False):
+        with self._lock:
+            self.timings[name] = self.timings.get(name, 0.0) + seconds
+            if rpc:
+                self.rpc_calls += 1
+
+    def server_timing(self):
+        # Value of the Server-Timing header. odoo is the sum of the call
+        # durations, so it can exceed total when calls run concurrently.
+        total = (time.perf_counter() - self.start) * 1000
+        parts = [f'odoo;dur={self.timings["odoo"] * 1000:.1f};desc="{self.rpc_calls} calls"']
+        parts += [f'{name};dur={seconds * 1000:.1f}' for name, seconds in self.timings.items() if name != 'odoo']
+        parts.append(f'total;dur={total:.1f}')
+        return ', '.join(parts)
+
+
+@contextmanager
+def label(model, method):
+    token = _rpc_label.set((model, method))
+    try:
+        yield
+    finally:
+        _rpc_label.reset(token)
+
+
+class _Call:
+    __slots__ = ('response_bytes',)
+
+    def __init__(self):
+        self.response_bytes = 0
+
+
+def _method_name(request_body):
+    start = request_body.find(b'<methodName>')
+    end = request_body.find(b'</methodName>', start)
+    if start < 0 or end < 0:
+        return 'unknown'
+    return request_body[start + len(b'<methodName>'):end].decode('utf-8', 'replace')
+
+
+@contextmanager
+def rpc(handler, request_body, label=None):
+    # Measure one XML-RPC or JSON-RPC round trip. Calls made through OdooClient
+    # are labelled with their model and method, others with the service and RPC
+    # method (e.g. common/authenticate), given as label or read from the XML-RPC
+    # request. The transport sets response_bytes.
+    model, method = _rpc_label.get() or label or (handler.rstrip('/').rsplit('/', 1)[-1], _method_name(request_body))
+    call = _Call()
+    start = time.perf_counter()
+    try:
+        yield call
+    except Exception as e:
+        RPC_ERRORS.inc(model, method, type(e).__name__)
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        RPC_DURATION.observe(seconds, model, method)
+        RPC_REQUEST_BYTES.observe(len(request_body), model, method)
+        RPC_RESPONSE_BYTES.observe(call.response_bytes, model, method)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.add('odoo', seconds, rpc=True)
+
+
+@contextmanager
+def timed(name):
+    # Add the duration of the block to the current request's Server-Timing entry name
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.add(name, time.perf_counter() - start)
+
+
+def start_request():
+    _request_stats.set(RequestStats())
+
+
+def finish_request(route, method, status):
+    # Record the request in the aggregate metrics and return its Server-Timing value
+    stats = _request_stats.get()
+    if stats is None:
+        return None
+    HTTP_DURATION.observe(time.perf_counter() - stats.start, route, method)
+    HTTP_REQUESTS.inc(route, method, str(status))
+    HTTP_RPC_CALLS.observe(stats.rpc_calls, route)
+    HTTP_ODOO_SECONDS.observe(stats.timings['odoo'], route)
+    HTTP_SERIALIZE_SECONDS.observe(stats.timings['serialize'], route)
+    return stats.server_timing()
+
+
+def render():
+    # Prometheus text exposition format
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
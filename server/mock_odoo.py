@@ -0,0 +1,439 @@
+# Stand-in Odoo 16 XML-RPC and JSON-RPC server with synthetic data, used to
+# benchmark the proxy without a real Odoo instance:
+#   python mock_odoo.py --tasks 300 --contacts 500 --latency 0.01
+#   python mock_odoo.py --workers 4 --record-latency 0.0005
+import argparse
+import base64
+import contextlib
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from io import BytesIO
+from socketserver import ThreadingMixIn
+from xmlrpc.server import SimpleXMLRPCRequestHandler, SimpleXMLRPCServer
+import xmlrpc.client
+
+# Field types of the synthetic models, used to render many2one fields as [id, name]
+# and to evaluate domains on many2many fields
+MANY2ONE = {
+    'project.task': {'project_id': 'project.project', 'stage_id': 'project.task.type'},
+    'project.project': {'user_id': 'res.users'},
+    'mail.activity': {'activity_type_id': 'mail.activity.type', 'user_id': 'res.users'},
+    'account.analytic.line': {'task_id': 'project.task', 'project_id': 'project.project',
+                              'account_id': 'account.analytic.account', 'employee_id': 'hr.employee'},
+}
+MANY2MANY = {
+    'project.task': {'user_ids', 'tag_ids'},
+    'project.task.type': {'project_ids'},
+    'res.users': {'groups_id'},
+}
+
+
+def make_image(seed, size=512):
+    try:
+        from PIL import Image
+    except ImportError:
+        return base64.b64encode(bytes([seed % 256]) * 1024).decode('ascii')
+    image = Image.new('RGB', (size, size), ((seed * 37) % 256, (seed * 91) % 256, (seed * 53) % 256))
+    buffer = BytesIO()
+    image.save(buffer, format='PNG')
+    return base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+class MockOdoo:
+    # In-memory Odoo answering the ORM methods used by the proxy. calls counts
+    # every RPC received and latency (seconds) is added to each of them.
+    # Like Odoo's workers, at most workers ORM calls are served at once when
+    # set, each taking record_latency more seconds per record returned.
+
+    def __init__(self, tasks=300, projects=10, contacts=500, lines_per_task=5, latency=0.0, seed=0,
+                 workers=None, record_latency=0.0):
+        self.latency = latency
+        self.record_latency = record_latency
+        self.workers = threading.BoundedSemaphore(workers) if workers else contextlib.nullcontext()
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.data = {}
+        self.next_id = {}
+        self.generate(tasks, projects, contacts, lines_per_task, random.Random(seed))
+
+    def generate(self, n_tasks, n_projects, n_contacts, lines_per_task, rnd):
+        now = datetime(2024, 1, 1)
+        stamp = now.strftime('%Y-%m-%d %H:%M:%S')
+        self.add('res.groups', [{'name': name} for name in ('Administrator', 'User', 'Manager')])
+        self.add('res.users', [{'name': 'Mitchell Admin', 'login': 'admin', 'password': 'admin', 'active': True, 'groups_id': [1, 2]},
+                               {'name': 'Marc Demo', 'login': 'demo', 'password': 'demo', 'active': True, 'groups_id': [2]}])
+        self.add('ir.module.module', [{'name': name, 'state': 'installed'} for name in ('project', 'hr_timesheet', 'contacts', 'mail')]
+                 + [{'name': 'sale', 'state': 'uninstalled'}])
+        self.add('mail.activity.type', [{'name': 'Call'}, {'name': 'Email'}, {'name': 'To Do'}])
+        self.add('account.analytic.account', [{'name': 'Internal'}])
+        self.add('hr.employee', [{'name': 'Mitchell Admin', 'user_id': 1}, {'name': 'Marc Demo', 'user_id': 2}])
+        self.add('project.tags', [{'name': f'Tag {i}'} for i in range(1, 11)])
+        self.add('project.project', [{'name': f'Project {i}', 'user_id': 1 + i % 2} for i in range(1, n_projects + 1)])
+        stages = []
+        for name in ('New', 'In Progress', 'Done', 'Cancelled'):
+            stages.append({'name': name, 'project_ids': list(range(1, n_projects + 1))})
+        self.add('project.task.type', stages)
+        tasks = []
+        for i in range(1, n_tasks + 1):
+            tasks.append({
+                'name': f'Task {i}',
+                'description': '<p>' + 'Lorem ipsum dolor sit amet. ' * rnd.randint(1, 20) + '</p>',
+                'project_id': rnd.randint(1, n_projects),
+                'stage_id': rnd.randint(1, 4),
+                'tag_ids': rnd.sample(range(1, 11), rnd.randint(0, 3)),
+                'user_ids': [1] if i % 3 else [1, 2],
+                'date_deadline': (now + timedelta(days=rnd.randint(0, 90))).strftime('%Y-%m-%d'),
+                'planned_hours': float(rnd.randint(1, 40)),
+                'remaining_hours': float(rnd.randint(0, 40)),
+                'create_date': stamp,
+                'priority': str(rnd.randint(0, 1)),
+                'kanban_state': 'normal',
+                'active': True,
+            })
+        self.add('project.task', tasks)
+        activities = []
+        for task_id in range(1, n_tasks + 1):
+            for _ in range(rnd.randint(0, 2)):
+                activities.append({'res_model': 'project.task', 'res_id': task_id, 'summary': 'Follow up',
+                                   'activity_type_id': rnd.randint(1, 3), 'user_id': 1, 'note': '<p>Note</p>',
+                                   'date_deadline': (now + timedelta(days=rnd.randint(0, 30))).strftime('%Y-%m-%d')})
+        self.add('mail.activity', activities)
+        images = [make_image(i) for i in range(8)]
+        self.add('res.partner', [{'name': f'Contact {i}', 'email': f'contact{i}@example.com', 'phone': f'+1 555 {i:04d}',
+                                  'mobile': False, 'image_1920': images[i % len(images)] if i % 4 else False, 'active': True}
+                                 for i in range(1, n_contacts + 1)])
+        lines = []
+        for task_id in range(1, n_tasks + 1):
+            for _ in range(lines_per_task):
+                lines.append({'name': 'Work', 'unit_amount': float(rnd.randint(1, 8)), 'task_id': task_id,
+                              'project_id': tasks[task_id - 1]['project_id'], 'account_id': 1, 'employee_id': rnd.randint(1, 2),
+                              'date': (now + timedelta(days=rnd.randint(0, 365))).strftime('%Y-%m-%d')})
+        self.add('account.analytic.line', lines)
+
+    def add(self, model, records):
+        table = self.data.setdefault(model, {})
+        stamp = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        ids = []
+        for values in records:
+            record_id = self.next_id.get(model, 1)
+            self.next_id[model] = record_id + 1
+            record = {'id': record_id, 'write_date': stamp, 'create_date': stamp}
+            record.update(values)
+            table[record_id] = record
+            ids.append(record_id)
+        return ids
+
+    # XML-RPC services
+
+    def version(self):
+        self.tick()
+        return {'server_version': '16.0', 'server_version_info': [16, 0, 0, 'final', 0, ''], 'protocol_version': 1}
+
+    def authenticate(self, db, login, password, user_agent_env):
+        self.tick()
+        for user in self.data['res.users'].values():
+            if user['login'] == login and user['password'] == password:
+                return user['id']
+        return False
+
+    def list(self):
+        self.tick()
+        return ['test']
+
+    def start(self):
+        self.tick()
+        return {'host': 'localhost', 'database': 'test', 'user': 'admin', 'password': 'admin'}
+
+    def execute_kw(self, db, uid, password, model, method, args, kwargs=None):
+        with self.workers:
+            self.tick()
+            user = self.data['res.users'].get(uid)
+            if not user or user['password'] != password:
+                raise xmlrpc.client.Fault(3, 'odoo.exceptions.AccessDenied: Access Denied')
+            kwargs = kwargs or {}
+            with self.lock:
+                handler = getattr(self, 'rpc_' + method, None)
+                if handler is None:
+                    raise xmlrpc.client.Fault(1, f'Method {method} not supported by the mock')
+                result = handler(model, *args, **kwargs)
+            if self.record_latency and isinstance(result, list):
+                time.sleep(self.record_latency * len(result))
+            return result
+
+    def tick(self):
+        with self.lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    # ORM methods
+
+    def rpc_search(self, model, domain, offset=0, limit=None, order=None, context=None):
+        records = [r for r in self.data.get(model, {}).values() if self.match(model, r, domain)]
+        records = self.sort(records, order)
+        records = records[offset:offset + limit if limit else None]
+        return [r['id'] for r in records]
+
+    def rpc_search_count(self, model, domain, context=None):
+        return len(self.rpc_search(model, domain))
+
+    def rpc_read(self, model, ids, fields=None, context=None):
+        if isinstance(ids, int):
+            ids = [ids]
+        table = self.data.get(model, {})
+        return [self.render(model, table[i], fields, context) for i in ids if i in table]
+
+    def rpc_search_read(self, model, domain=None, fields=None, offset=0, limit=None, order=None, context=None):
+        return self.rpc_read(model, self.rpc_search(model, domain or [], offset, limit, order), fields, context)
+
+    def rpc_write(self, model, ids, values, context=None):
+        stamp = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        missing = [record_id for record_id in ids if record_id not in self.data.get(model, {})]
+        if missing:
+            raise xmlrpc.client.Fault(2, f'odoo.exceptions.MissingError: Records {missing} of {model} do not exist')
+        for record_id in ids:
+            record = self.data[model][record_id]
+            for field, value in values.items():
+                record[field] = self.convert(model, field, value, record.get(field))
+            record['write_date'] = stamp
+        return True
+
+    def rpc_create(self, model, values, context=None):
+        many = isinstance(values, list)
+        records = []
+        for vals in (values if many else [values]):
+            records.append({field: self.convert(model, field, value, None) for field, value in vals.items()})
+        ids = self.add(model, records)
+        return ids if many else ids[0]
+
+    def rpc_unlink(self, model, ids, context=None):
+        for record_id in ids:
+            self.data[model].pop(record_id, None)
+        return True
+
+    def rpc_read_group(self, model, domain, fields, groupby, offset=0, limit=None, orderby=False, lazy=True, context=None):
+        if isinstance(groupby, str):
+            groupby = [groupby]
+        if lazy:
+            groupby = groupby[:1]
+        sums = [f.split(':')[0] for f in fields if f.split(':')[0] not in groupby and f.split(':')[0] != '__count']
+        groups = {}
+        for record in self.data.get(model, {}).values():
+            if not self.match(model, record, domain):
+                continue
+            key = tuple(self.group_key(model, record, spec) for spec in groupby)
+            group = groups.setdefault(key, {'__count': 0, **{f: 0.0 for f in sums}})
+            group['__count'] += 1
+            for field in sums:
+                group[field] += record.get(field) or 0.0
+        result = []
+        for key, group in sorted(groups.items(), key=lambda item: str(item[0])):
+            row = {}
+            for spec, value in zip(groupby, key):
+                row[spec] = value
+            row.update(group)
+            if len(groupby) == 1:
+                row[groupby[0].split(':')[0] + '_count'] = group['__count']
+            result.append(row)
+        return result[offset:offset + limit if limit else None]
+
+    def group_key(self, model, record, spec):
+        field, _, interval = spec.partition(':')
+        value = record.get(field)
+        if field in MANY2ONE.get(model, {}):
+            # A tuple to be usable as a key, marshalled as an array like a list
+            name = self.name_of(MANY2ONE[model][field], value)
+            return tuple(name) if name else name
+        if interval and value:
+            day = datetime.strptime(value[:10], '%Y-%m-%d')
+            if interval == 'week':
+                return f'W{day.isocalendar()[1]:02d} {day.isocalendar()[0]}'
+            if interval == 'month':
+                return day.strftime('%B %Y')
+            return day.strftime('%d %b %Y')
+        return value
+
+    # Helpers
+
+    def name_of(self, model, record_id):
+        if not record_id:
+            return False
+        record = self.data.get(model, {}).get(record_id)
+        return [record_id, record['name'] if record else str(record_id)]
+
+    def render(self, model, record, fields, context=None):
+        fields = fields or [f for f in record]
+        row = {'id': record['id']}
+        for field in fields:
+            value = record.get(field, False)
+            if field.startswith('image_') and 'image_1920' in record:
+                # Every stored image size is served from the same synthetic picture
+                value = record['image_1920']
+                if value and context and context.get('bin_size'):
+                    value = f'{len(value) * 3 / 4 / 1024:.2f} Kb'
+            elif field in MANY2ONE.get(model, {}):
+                value = self.name_of(MANY2ONE[model][field], value)
+            elif isinstance(value, list):
+                value = list(value)
+            row[field] = value
+        return row
+
+    def convert(self, model, field, value, current):
+        if field in MANY2MANY.get(model, set()) and isinstance(value, list):
+            result = list(current or [])
+            for command in value:
+                if isinstance(command, (list, tuple)):
+                    if command[0] == 6:
+                        result = list(command[2])
+                    elif command[0] == 4:
+                        result.append(command[1])
+                    elif command[0] == 3:
+                        result = [i for i in result if i != command[1]]
+                else:
+                    result.append(command)
+            return result
+        return value
+
+    def sort(self, records, order):
+        if not order:
+            return sorted(records, key=lambda r: r['id'])
+        for part in reversed(order.split(',')):
+            bits = part.split()
+            field = bits[0]
+            reverse = len(bits) > 1 and bits[1].lower() == 'desc'
+            records = sorted(records, key=lambda r: (r.get(field) is False, r.get(field) or 0) if not isinstance(r.get(field), str) else (False, r.get(field)), reverse=reverse)
+        return records
+
+    def match(self, model, record, domain):
+        stack = []
+        for term in reversed(domain):
+            if term == '&':
+                a, b = stack.pop(), stack.pop()
+                stack.append(a and b)
+            elif term == '|':
+                a, b = stack.pop(), stack.pop()
+                stack.append(a or b)
+            elif term == '!':
+                stack.append(not stack.pop())
+            else:
+                stack.append(self.match_term(model, record, term))
+        return all(stack)
+
+    def match_term(self, model, record, term):
+        field, operator, value = term
+        if field == 'active' and field not in record:
+            current = True
+        else:
+            current = record.get(field, False)
+        if field in MANY2MANY.get(model, set()):
+            values = value if isinstance(value, list) else [value]
+            hit = bool(set(current or []) & set(values))
+            if operator in ('in', '='):
+                return hit
+            if operator in ('not in', '!='):
+                return not hit
+        if isinstance(value, list) and operator == '=':
+            operator = 'in'
+        if operator == '=':
+            return current == value
+        if operator == '!=':
+            return current != value
+        if operator == 'in':
+            return current in (value if isinstance(value, list) else [value])
+        if operator == 'not in':
+            return current not in value
+        if operator in ('ilike', 'like'):
+            return isinstance(current, str) and str(value).lower() in current.lower()
+        if current is False or current is None:
+            return False
+        if operator == '>':
+            return current > value
+        if operator == '>=':
+            return current >= value
+        if operator == '<':
+            return current < value
+        if operator == '<=':
+            return current <= value
+        raise xmlrpc.client.Fault(1, f'Operator {operator} not supported by the mock')
+
+
+# Odoo exceptions by the XML-RPC fault code the mock raises them with
+FAULT_EXCEPTIONS = {2: 'odoo.exceptions.UserError', 3: 'odoo.exceptions.AccessDenied', 4: 'odoo.exceptions.AccessError'}
+
+
+class RequestHandler(SimpleXMLRPCRequestHandler):
+    rpc_paths = ('/xmlrpc/2/common', '/xmlrpc/2/object', '/xmlrpc/2/db', '/start')
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        if self.path != '/jsonrpc':
+            return super().do_POST()
+        # Odoo's /jsonrpc: {"method": "call", "params": {"service", "method", "args"}}
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        params = request['params']
+        reply = {'jsonrpc': '2.0', 'id': request.get('id')}
+        try:
+            reply['result'] = self.server.instance_method(params['method'])(*params['args'])
+        except Exception as e:
+            # Odoo answers errors with HTTP 200 and an error object
+            if isinstance(e, xmlrpc.client.Fault):
+                name, _, message = e.faultString.partition(': ')
+                if not name.startswith('odoo.'):
+                    name, message = FAULT_EXCEPTIONS.get(e.faultCode, 'builtins.Exception'), e.faultString
+            else:
+                name, message = f'builtins.{type(e).__name__}', str(e)
+            reply['error'] = {'code': 200, 'message': 'Odoo Server Error',
+                              'data': {'name': name, 'message': message, 'debug': f'{name}: {message}',
+                                       'arguments': [message]}}
+        body = json.dumps(reply).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ThreadedXMLRPCServer(ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+
+    def instance_method(self, name):
+        # Method of the registered MockOdoo serving an RPC, as the XML-RPC dispatcher finds it
+        if name.startswith('_'):
+            raise xmlrpc.client.Fault(1, f'Method {name} not supported by the mock')
+        return getattr(self.instance, name)
+
+
+def serve(odoo, host='127.0.0.1', port=8069):
+    # Serve odoo from a background thread and return the server (call shutdown() to stop it)
+    server = ThreadedXMLRPCServer((host, port), requestHandler=RequestHandler, allow_none=True, logRequests=False)
+    server.register_instance(odoo)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Synthetic Odoo XML-RPC and JSON-RPC server')
+    parser.add_argument('--port', type=int, default=8069)
+    parser.add_argument('--tasks', type=int, default=300)
+    parser.add_argument('--projects', type=int, default=10)
+    parser.add_argument('--contacts', type=int, default=500)
+    parser.add_argument('--lines-per-task', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every RPC')
+    parser.add_argument('--workers', type=int, help='ORM calls served at once (default: unlimited)')
+    parser.add_argument('--record-latency', type=float, default=0.0, help='seconds added per record returned')
+    options = parser.parse_args()
+    server = serve(MockOdoo(options.tasks, options.projects, options.contacts, options.lines_per_task,
+                            latency=options.latency, workers=options.workers,
+                            record_latency=options.record_latency), port=options.port)
+    print(f'Mock Odoo listening on http://127.0.0.1:{options.port} (db test, login admin / admin)')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
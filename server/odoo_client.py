@@ -0,0 +1,153 @@
+import os
+import threading
+import time
+import xmlrpc.client
+
+import metrics
+import resilience
+import utils
+from gateway import run_concurrently
+from singleflight import SingleFlight
+from transport import get_proxy
+
+# How long (in seconds) an authenticated uid is reused before logging in again
+AUTH_TTL = int(os.environ.get('ODOO_AUTH_TTL', 600))
+
+# Odoo reports AccessDenied as an XML-RPC fault with this code
+ACCESS_DENIED_FAULT_CODE = 3
+
+# ORM methods that modify records, reported to the write listeners
+WRITE_METHODS = {'create', 'write', 'unlink'}
+
+# Callbacks run as listener(client, model) after a successful write, e.g. to
+# invalidate cached reference data
+write_listeners = []
+
+# ORM methods without side effects, whose identical concurrent calls share one RPC
+READ_METHODS = {'search_read', 'read', 'search', 'search_count', 'name_search', 'name_get', 'fields_get',
+                'read_group', 'has_group', 'check_access_rights', 'default_get'}
+# Set RPC_COALESCING=0 to send every read to Odoo
+COALESCING = os.environ.get('RPC_COALESCING', '1') == '1'
+
+# Reads in flight keyed by (url, db, uid, password digest, model, method, args, kwargs)
+_reads = SingleFlight()
+
+# Cached uids keyed by (url, db, login) -> (uid, password digest, expiry)
+_uid_cache = {}
+_uid_lock = threading.Lock()
+
+
+def is_access_denied(fault):
+    return fault.faultCode == ACCESS_DENIED_FAULT_CODE or 'AccessDenied' in str(fault.faultString) \
+        or 'Access Denied' in str(fault.faultString)
+
+
+def authenticate(url, db, login, password, force=False, protocol=None):
+    key = (url, db, login)
+    digest = utils.digest(password)
+    now = time.monotonic()
+
+    if not force:
+        with _uid_lock:
+            cached = _uid_cache.get(key)
+        # The password digest guards against serving a cached uid to a wrong password
+        if cached and cached[1] == digest and cached[2] > now:
+            return cached[0]
+
+    common = get_proxy(url, '/xmlrpc/2/common', protocol)
+    uid = resilience.retry(lambda: common.authenticate(db, login, password, {}))
+
+    with _uid_lock:
+        if uid:
+            _uid_cache[key] = (uid, digest, now + AUTH_TTL)
+        else:
+            _uid_cache.pop(key, None)
+    return uid
+
+
+def invalidate(url, db, login):
+    with _uid_lock:
+        _uid_cache.pop((url, db, login), None)
+
+
+class OdooClient:
+    # Authenticated access to one Odoo database, shared by all routes
+
+    def __init__(self, url, db, username, password, uid=None, protocol=None):
+        self.url = url
+        self.db = db
+        self.username = username
+        self.password = password
+        # 'xmlrpc' or 'jsonrpc', transport.ODOO_PROTOCOL when None
+        self.protocol = protocol
+        # ReplicaReader answering the reads it can from the local replica, see replica.py
+        self.replica = None
+        self._uid = uid
+        self._models = None
+
+    @property
+    def uid(self):
+        if self._uid is None:
+            self._uid = authenticate(self.url, self.db, self.username, self.password, protocol=self.protocol)
+        return self._uid
+
+    @property
+    def models(self):
+        if self._models is None:
+            self._models = get_proxy(self.url, '/xmlrpc/2/object', self.protocol)
+        return self._models
+
+    def execute_kw(self, model, method, args, kwargs=None):
+        if self.replica is not None and method in READ_METHODS:
+            found, result = self.replica.execute_kw(model, method, args, kwargs)
+            if found:
+                return result
+        if COALESCING and method in READ_METHODS:
+            return self._coalesced_read(model, method, args, kwargs)
+        result = self._execute_kw(model, method, args, kwargs)
+        if method in WRITE_METHODS:
+            # Reads started before the write must not be shared with later callers
+            _reads.forget(lambda key: key[:2] == (self.url, self.db))
+            for listener in write_listeners:
+                listener(self, model)
+        return result
+
+    def _coalesced_read(self, model, method, args, kwargs):
+        # The uid and the password are part of the key: a result is only shared
+        # between callers with the same access rights and credentials
+        key = (self.url, self.db, self.uid, utils.digest(self.password), model, method,
+               repr(args), repr(sorted((kwargs or {}).items())))
+        result, shared = _reads.do(key, lambda: self._execute_kw(model, method, args, kwargs))
+        if shared:
+            metrics.RPC_COALESCED.inc(model, method)
+        return result
+
+    def _execute_kw(self, model, method, args, kwargs=None):
+        try:
+            uid = self.uid
+            with metrics.label(model, method):
+                return self._call(uid, model, method, args, kwargs)
+        except xmlrpc.client.Fault as fault:
+            if not is_access_denied(fault):
+                raise
+            # The cached uid is no longer valid (password changed, user archived...):
+            # drop it, log in again and retry the call once
+            invalidate(self.url, self.db, self.username)
+            self._uid = authenticate(self.url, self.db, self.username, self.password, force=True,
+                                     protocol=self.protocol)
+            if not self._uid:
+                raise
+            with metrics.label(model, method):
+                return self._call(self._uid, model, method, args, kwargs)
+
+    def _call(self, uid, model, method, args, kwargs):
+        def call():
+            return self.models.execute_kw(self.db, uid, self.password, model, method, args, kwargs or {})
+        # Reads are safe to send again after a transient failure, writes are not
+        return resilience.retry(call) if method in READ_METHODS else call()
+
+    def execute_many(self, calls):
+        # Run independent (model, method, args[, kwargs]) calls concurrently and
+        # return their results in the same order
+        self.uid  # Log in once before fanning out
+        return run_concurrently(self.url, [lambda call=call: self.execute_kw(*call) for call in calls])
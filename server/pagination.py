@@ -0,0 +1,131 @@
+import os
+from collections import namedtuple
+
+import serialization
+
+# Largest page a client may ask for with ?limit=
+MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', 1000))
+# Number of records read from Odoo per call when streaming NDJSON
+STREAM_BATCH_SIZE = int(os.environ.get('STREAM_BATCH_SIZE', 200))
+
+Page = namedtuple('Page', ['limit', 'offset', 'after_id', 'order', 'stream'])
+
+
+class PaginationError(ValueError):
+    pass
+
+
+def _int_arg(args, name):
+    value = args.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        value = int(value)
+    except ValueError:
+        raise PaginationError(f'{name} must be an integer')
+    if value < 0:
+        raise PaginationError(f'{name} must be positive')
+    return value
+
+
+def parse_order(order, order_fields):
+    # Validate an Odoo order clause such as "date_deadline desc, id" against a whitelist
+    if not order:
+        return None
+    parts = []
+    for part in order.split(','):
+        bits = part.split()
+        if not bits or len(bits) > 2 or bits[0] not in order_fields \
+                or (len(bits) == 2 and bits[1].lower() not in ('asc', 'desc')):
+            raise PaginationError(f'Invalid order: {order}')
+        parts.append(' '.join(bits))
+    return ', '.join(parts)
+
+
+def parse_page(args, order_fields):
+    # Returns None when the client asked for neither a page nor a stream, so that
+    # routes keep their original full-list behaviour
+    limit = _int_arg(args, 'limit')
+    offset = _int_arg(args, 'offset')
+    after_id = _int_arg(args, 'after_id')
+    order = parse_order(args.get('order'), order_fields)
+    stream = args.get('stream') in ('1', 'true', 'ndjson')
+
+    if limit is None and offset is None and after_id is None and order is None and not stream:
+        return None
+    if after_id is not None and (offset or order):
+        raise PaginationError('after_id cannot be combined with offset or order')
+    if limit is not None:
+        limit = min(limit, MAX_PAGE_SIZE) or MAX_PAGE_SIZE
+    return Page(limit, offset or 0, after_id, order, stream)
+
+
+def _kwargs(fields, context, **kwargs):
+    kwargs['fields'] = fields
+    if context:
+        kwargs['context'] = context
+    return kwargs
+
+
+def read_page(client, model, domain, fields, page, context=None):
+    # Read one page and return it with the headers pointing to the next one.
+    # Cursor pages (after_id, use 0 for the first page) are always ordered by id.
+    if page.after_id is not None:
+        records = client.execute_kw(model, 'search_read', [domain + [['id', '>', page.after_id]]],
+                                    _kwargs(fields, context, limit=page.limit or MAX_PAGE_SIZE, order='id'))
+    else:
+        kwargs = _kwargs(fields, context, offset=page.offset, limit=page.limit or MAX_PAGE_SIZE)
+        if page.order:
+            kwargs['order'] = page.order
+        records = client.execute_kw(model, 'search_read', [domain], kwargs)
+
+    headers = {}
+    if len(records) == (page.limit or MAX_PAGE_SIZE):
+        if page.after_id is not None:
+            headers['X-Next-Cursor'] = str(records[-1]['id'])
+        else:
+            headers['X-Next-Offset'] = str(page.offset + len(records))
+    return records, headers
+
+
+def iter_batches(client, model, domain, fields, page, context=None, batch_size=STREAM_BATCH_SIZE):
+    # Yield successive batches of records. Without an explicit order the batches
+    # follow an id cursor, which stays consistent while records are added.
+    remaining = page.limit
+    after_id = page.after_id or 0
+    offset = page.offset
+    use_cursor = not page.order and not page.offset
+    while remaining is None or remaining > 0:
+        size = batch_size if remaining is None else min(batch_size, remaining)
+        if not use_cursor:
+            kwargs = _kwargs(fields, context, offset=offset, limit=size)
+            if page.order:
+                kwargs['order'] = page.order
+            batch = client.execute_kw(model, 'search_read', [domain], kwargs)
+            offset += len(batch)
+        else:
+            batch = client.execute_kw(model, 'search_read', [domain + [['id', '>', after_id]]],
+                                      _kwargs(fields, context, limit=size, order='id'))
+            if batch:
+                after_id = batch[-1]['id']
+        if not batch:
+            return
+        yield batch
+        if remaining is not None:
+            remaining -= len(batch)
+        if len(batch) < size:
+            return
+
+
+def ndjson(batches, transform=None, log_error=print):
+    # Encode batches of records as newline-delimited JSON, one record per line.
+    # The status code is already sent once streaming starts, so a failure is
+    # reported as a last {"error": ...} line.
+    try:
+        for batch in batches:
+            if transform is not None:
+                batch = transform(batch)
+            yield b''.join(serialization.dumps(record) + b'\n' for record in batch)
+    except Exception as e:
+        log_error(f"Error while streaming records: {e}")
+        yield serialization.dumps({'error': str(e)}) + b'\n'
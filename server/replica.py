@@ -0,0 +1,519 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import admission
+import metrics
+import pagination
+import serialization
+import utils
+import watermarks
+from odoo_client import OdooClient
+
+# When set, the hot models are mirrored into this SQLite file and the read
+# routes are answered from it
+REPLICA_PATH = os.environ.get('REPLICA_PATH', '')
+# Seconds between two syncs of a user's replica from Odoo
+SYNC_INTERVAL = float(os.environ.get('REPLICA_SYNC_INTERVAL', 10))
+# Reads fall back to Odoo when the last sync of the model started longer ago
+MAX_STALENESS = float(os.environ.get('REPLICA_MAX_STALENESS', 60))
+# A user's replica stops syncing after this many seconds without reads
+IDLE_TIMEOUT = float(os.environ.get('REPLICA_IDLE_TIMEOUT', 900))
+
+# Replicated models: the records kept (domain, and the context they are read
+# with), the fields stored, the ones also kept in columns for filtering and
+# sorting, the many2one fields (compared by id), the fields holding lists of
+# ids, the binary fields (kept as sizes, bin_size reads only), the indexed
+# columns and Odoo's default order of the model
+MODELS = {
+    'project.task': {
+        'domain': [],
+        'fields': ['name', 'description', 'project_id', 'tag_ids', 'date_deadline', 'user_ids', 'planned_hours',
+                   'create_date', 'priority', 'stage_id', 'remaining_hours', 'kanban_state', 'sequence', 'write_date'],
+        'columns': ['name', 'project_id', 'stage_id', 'date_deadline', 'priority', 'sequence', 'create_date',
+                    'write_date'],
+        'many2one': {'project_id', 'stage_id'},
+        'x2many': {'user_ids', 'tag_ids'},
+        'indexes': ['project_id', 'stage_id', 'date_deadline'],
+        'order': 'priority desc, sequence, id desc',
+    },
+    'project.task.type': {
+        'domain': [],
+        'fields': ['name', 'project_ids', 'sequence', 'write_date'],
+        'columns': ['name', 'sequence', 'write_date'],
+        'x2many': {'project_ids'},
+        'order': 'sequence, id',
+    },
+    'mail.activity': {
+        'domain': [['res_model', '=', 'project.task']],
+        'fields': ['summary', 'activity_type_id', 'date_deadline', 'user_id', 'note', 'res_id', 'res_model',
+                   'write_date'],
+        'columns': ['res_model', 'res_id', 'date_deadline', 'user_id', 'write_date'],
+        'many2one': {'activity_type_id', 'user_id'},
+        'indexes': ['res_id'],
+        'order': 'date_deadline, id',
+    },
+    'res.partner': {
+        'domain': [],
+        'context': {'bin_size': True},
+        'fields': ['name', 'email', 'phone', 'mobile', 'function', 'street', 'city', 'zip', 'country_id', 'parent_id',
+                   'is_company', 'website', 'complete_name', 'image_1920', 'create_date', 'write_date'],
+        'columns': ['name', 'email', 'complete_name', 'parent_id', 'is_company', 'create_date', 'write_date'],
+        'many2one': {'country_id', 'parent_id'},
+        'binary': {'image_1920'},
+        'indexes': ['name'],
+        'order': 'complete_name, id desc',
+    },
+    'account.analytic.line': {
+        'domain': [['task_id', '!=', False]],
+        'fields': ['name', 'unit_amount', 'date', 'account_id', 'employee_id', 'task_id', 'project_id', 'write_date'],
+        'columns': ['date', 'task_id', 'project_id', 'employee_id', 'unit_amount', 'write_date'],
+        'many2one': {'account_id', 'employee_id', 'task_id', 'project_id'},
+        'indexes': ['task_id', 'date'],
+        'order': 'date desc, id desc',
+    },
+}
+
+# Positional arguments of the ORM methods answered from the replica
+SIGNATURES = {
+    'search_read': ('domain', 'fields', 'offset', 'limit', 'order'),
+    'search': ('domain', 'offset', 'limit', 'order'),
+    'search_count': ('domain',),
+    'read': ('ids', 'fields'),
+}
+
+COMPARISONS = {'=': '=', '<': '<', '<=': '<=', '>': '>', '>=': '>='}
+
+
+class Unsupported(Exception):
+    # The call cannot be answered from the replica exactly as Odoo would
+    pass
+
+
+def _table(model):
+    return model.replace('.', '_')
+
+
+def _signature(spec):
+    # Replicas stored with other fields or columns are synced again from scratch
+    return hashlib.sha256(json.dumps(spec, sort_keys=True, default=sorted).encode('utf-8')).hexdigest()
+
+
+def _column_value(spec, field, value):
+    # Column values follow Postgres: empty fields are NULL, many2one fields their id
+    if value is False or value is None:
+        return None
+    if field in spec.get('many2one', ()):
+        return value[0]
+    if value is True:
+        return 1
+    return value
+
+
+def _value(spec, field, value):
+    # A value compared in SQL; False (empty) and name searches are left to Odoo
+    if value is True:
+        return 1
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise Unsupported(f'{field} compared with {value!r}')
+    if isinstance(value, str) and field in spec.get('many2one', ()):
+        raise Unsupported(f'{field} compared with a name')
+    return value
+
+
+def _values(spec, field, value):
+    values = value if isinstance(value, (list, tuple)) else [value]
+    return [_value(spec, field, item) for item in values]
+
+
+def _leaf(spec, term, params):
+    if not isinstance(term, (list, tuple)) or len(term) != 3:
+        raise Unsupported(f'Domain term {term!r}')
+    field, operator, value = term
+    placeholders = lambda values: ', '.join('?' * len(values))
+
+    if field in spec.get('x2many', ()):
+        if operator not in ('in', '=', 'not in', '!='):
+            raise Unsupported(f'{field} {operator}')
+        values = _values(spec, field, value)
+        negate = 'NOT ' if operator in ('not in', '!=') else ''
+        if not values:
+            return '1' if negate else '0'
+        params.extend(values)
+        return f"{negate}EXISTS (SELECT 1 FROM json_each(data, '$.{field}') WHERE value IN ({placeholders(values)}))"
+
+    if field != 'id' and field not in spec['columns']:
+        raise Unsupported(f'{field} is not a column')
+    column = f'"{field}"'
+    if operator in ('in', 'not in'):
+        values = _values(spec, field, value)
+        if not values:
+            return '0' if operator == 'in' else '1'
+        params.extend(values)
+        if operator == 'in':
+            return f'{column} IN ({placeholders(values)})'
+        return f'({column} IS NULL OR {column} NOT IN ({placeholders(values)}))'
+    if operator == '!=':
+        params.append(_value(spec, field, value))
+        return f'({column} IS NULL OR {column} != ?)'
+    if operator == 'ilike':
+        # SQLite's LIKE only folds the case of ASCII letters
+        if field in spec.get('many2one', ()) or not isinstance(value, str) or not value.isascii():
+            raise Unsupported(f'{field} ilike {value!r}')
+        params.append(f'%{value}%')
+        return f'{column} LIKE ?'
+    if operator in COMPARISONS:
+        params.append(_value(spec, field, value))
+        return f'{column} {COMPARISONS[operator]} ?'
+    raise Unsupported(f'Operator {operator}')
+
+
+def _where(spec, domain, params):
+    # SQL condition of an Odoo domain in prefix notation, the terms being
+    # implicitly joined with AND
+    domain = list(domain or [])
+    position = 0
+
+    def parse():
+        nonlocal position
+        if position >= len(domain):
+            raise Unsupported('Incomplete domain')
+        term = domain[position]
+        position += 1
+        if term in ('&', '|'):
+            left = parse()
+            right = parse()
+            return f"({left} {'AND' if term == '&' else 'OR'} {right})"
+        if term == '!':
+            return f'(NOT {parse()})'
+        return _leaf(spec, term, params)
+
+    conditions = []
+    while position < len(domain):
+        conditions.append(parse())
+    return ' AND '.join(conditions) or '1'
+
+
+def _order_by(spec, order):
+    # Postgres sorts NULLs last in ascending order, first in descending order.
+    # Many2one fields sort by the related model's order, left to Odoo.
+    parts = []
+    for part in (order or spec['order']).split(','):
+        bits = part.split()
+        if not bits or len(bits) > 2 or (len(bits) == 2 and bits[1].lower() not in ('asc', 'desc')):
+            raise Unsupported(f'Order {order}')
+        field = bits[0]
+        if field != 'id' and (field not in spec['columns'] or field in spec.get('many2one', ())):
+            raise Unsupported(f'Order by {field}')
+        if len(bits) == 2 and bits[1].lower() == 'desc':
+            parts.append(f'"{field}" IS NULL DESC, "{field}" DESC')
+        else:
+            parts.append(f'"{field}" IS NULL, "{field}"')
+    return ', '.join(parts)
+
+
+def _check_fields(spec, fields, context):
+    if fields is None:
+        raise Unsupported('All fields')
+    if set(context or {}) - {'bin_size'}:
+        raise Unsupported(f'Context {context}')
+    for field in fields:
+        if field != 'id' and field not in spec['fields']:
+            raise Unsupported(f'{field} is not replicated')
+        if field in spec.get('binary', ()) and not (context or {}).get('bin_size'):
+            raise Unsupported(f'{field} content')
+    return [field for field in fields if field != 'id']
+
+
+class _Owner:
+    # The replica of one user of one database, synced from Odoo with the
+    # user's credentials, so that Odoo's access rules decide what it holds
+
+    def __init__(self, replica, key, session):
+        self.replica = replica
+        self.key = key
+        self.session = session
+        self.verified = None  # Digest of the password the last successful sync used
+        self.failing = False  # Whether the last sync failed for some model
+        self.last_read = time.monotonic()
+        # since: write_date watermark; synced_at: start of the last successful
+        # sync; generation: bumped by the proxy's own writes, synced_generation:
+        # the generation the last successful sync started at
+        self.models = {model: {'since': replica.stored_since(key, model), 'synced_at': None,
+                               'generation': 0, 'synced_generation': -1} for model in MODELS}
+        self._sync_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self.run, name=f'replica-{key[1]}', daemon=True)
+
+    def run(self):
+        while not self._stop.is_set():
+            if time.monotonic() - self.last_read > IDLE_TIMEOUT:
+                self.replica.retire(self)
+                return
+            self.sync()
+            self._wake.wait(SYNC_INTERVAL)
+            self._wake.clear()
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def sync(self):
+        with self._sync_lock, admission.scope(self.session, admission.BULK):
+            session = self.session
+            client = OdooClient(session['url'], session['db'], session['username'], session['password'],
+                                uid=session.get('uid'), protocol=session.get('protocol'))
+            failing = False
+            for model, state in self.models.items():
+                generation = state['generation']
+                started = time.time()
+                try:
+                    state['since'] = self.replica.sync_model(self.key, client, model, state['since'])
+                except Exception as e:
+                    metrics.REPLICA_SYNCS.inc(model, 'error')
+                    self.replica.log_error(f"Error syncing the {model} replica of {self.key[2]}: {e}")
+                    failing = True
+                    continue
+                metrics.REPLICA_SYNCS.inc(model, 'ok')
+                state['synced_at'] = started
+                state['synced_generation'] = generation
+                self.verified = utils.digest(session['password'])
+            self.failing = failing
+
+    def is_fresh(self, model):
+        state = self.models[model]
+        return (state['synced_at'] is not None and time.time() - state['synced_at'] <= MAX_STALENESS
+                and state['synced_generation'] == state['generation'])
+
+
+class Replica:
+    # Local SQLite copy of the hot Odoo models, one partition per user, kept
+    # up to date by polling write_date. The read routes get a ReplicaReader
+    # that answers the calls it can from the copy and lets the others go to Odoo.
+
+    def __init__(self, path=REPLICA_PATH, log_error=print):
+        self.path = path
+        self.log_error = log_error
+        self._local = threading.local()
+        self._owners = {}
+        self._lock = threading.Lock()
+        connection = self._connection()
+        connection.execute('CREATE TABLE IF NOT EXISTS replica_models (model TEXT PRIMARY KEY, signature TEXT)')
+        connection.execute('CREATE TABLE IF NOT EXISTS replica_syncs '
+                           '(owner TEXT, model TEXT, since TEXT, PRIMARY KEY (owner, model))')
+        for model, spec in MODELS.items():
+            self._create_table(connection, model, spec)
+
+    def _connection(self):
+        return utils.sqlite_connection(self._local, self.path)
+
+    def _create_table(self, connection, model, spec):
+        table = _table(model)
+        signature = _signature(spec)
+        row = connection.execute('SELECT signature FROM replica_models WHERE model = ?', (model,)).fetchone()
+        if row is not None and row[0] != signature:
+            connection.execute(f'DROP TABLE IF EXISTS "{table}"')
+            connection.execute('DELETE FROM replica_syncs WHERE model = ?', (model,))
+        columns = ''.join(f', "{column}"' for column in spec['columns'])
+        connection.execute(f'CREATE TABLE IF NOT EXISTS "{table}" '
+                           f'(owner TEXT NOT NULL, id INTEGER NOT NULL, data TEXT NOT NULL{columns}, '
+                           'PRIMARY KEY (owner, id))')
+        for column in spec.get('indexes', ()):
+            connection.execute(f'CREATE INDEX IF NOT EXISTS "{table}_{column}" ON "{table}" (owner, "{column}")')
+        connection.execute('INSERT OR REPLACE INTO replica_models (model, signature) VALUES (?, ?)',
+                           (model, signature))
+
+    def stored_since(self, key, model):
+        # Watermark of a replica synced before a restart, None for a full sync
+        row = self._connection().execute('SELECT since FROM replica_syncs WHERE owner = ? AND model = ?',
+                                         (utils.owner(*key), model)).fetchone()
+        return row[0] if row else None
+
+    def sync_model(self, key, client, model, since):
+        # Bring the user's copy of model up to date and return the new watermark.
+        # The first sync reads every record in batches; the next ones read the
+        # records written since the watermark (>=, write dates have a one second
+        # resolution), drop the ids Odoo no longer returns and read the ones the
+        # user can now see without them having been written.
+        spec = MODELS[model]
+        domain, fields, context = spec['domain'], spec['fields'], spec.get('context')
+        kwargs = {'fields': fields, 'context': context} if context else {'fields': fields}
+        owner = utils.owner(*key)
+        table = _table(model)
+
+        if since is None:
+            page = pagination.Page(None, 0, None, None, True)
+            records = [record for batch in pagination.iter_batches(client, model, domain, fields, page, context)
+                       for record in batch]
+            ids = None
+        else:
+            records = client.execute_kw(model, 'search_read', [domain + [['write_date', '>=', since]]], kwargs)
+            ids = set(client.execute_kw(model, 'search', [domain]))
+            stored = {row[0] for row in self._connection().execute(f'SELECT id FROM "{table}" WHERE owner = ?',
+                                                                     (owner,))}
+            missing = list(ids - stored - {record['id'] for record in records})
+            if missing:
+                records += client.execute_kw(model, 'read', [missing], kwargs)
+
+        columns = spec['columns']
+        rows = [(owner, record['id'], serialization.dumps(record).decode('utf-8'),
+                 *(_column_value(spec, column, record.get(column)) for column in columns)) for record in records]
+        new_since = watermarks.latest(records, since)
+
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            if ids is None:
+                connection.execute(f'DELETE FROM "{table}" WHERE owner = ?', (owner,))
+            else:
+                stored = [row[0] for row in connection.execute(f'SELECT id FROM "{table}" WHERE owner = ?', (owner,))]
+                connection.executemany(f'DELETE FROM "{table}" WHERE owner = ? AND id = ?',
+                                       [(owner, record_id) for record_id in stored if record_id not in ids])
+            names = ''.join(f', "{column}"' for column in columns)
+            connection.executemany(f'INSERT OR REPLACE INTO "{table}" (owner, id, data{names}) '
+                                   f'VALUES (?, ?, ?{", ?" * len(columns)})', rows)
+            connection.execute('INSERT OR REPLACE INTO replica_syncs (owner, model, since) VALUES (?, ?, ?)',
+                               (owner, model, new_since))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return new_since
+
+    def query(self, key, model, method, args, kwargs):
+        # Answer an ORM call from the user's copy, or raise Unsupported
+        spec = MODELS[model]
+        if len(args) > len(SIGNATURES[method]):
+            raise Unsupported('Arguments')
+        call = dict(zip(SIGNATURES[method], args))
+        for name, value in (kwargs or {}).items():
+            if name != 'context' and (name not in SIGNATURES[method] or name in call):
+                raise Unsupported(f'Argument {name}')
+            call[name] = value
+        context = call.get('context')
+        owner = utils.owner(*key)
+        table = _table(model)
+        connection = self._connection()
+
+        if method == 'read':
+            fields = _check_fields(spec, call.get('fields'), context)
+            ids = call['ids'] if isinstance(call['ids'], list) else [call['ids']]
+            ids = list(dict.fromkeys(ids))
+            rows = {} if not ids else dict(connection.execute(
+                f'SELECT id, data FROM "{table}" WHERE owner = ? AND id IN ({", ".join("?" * len(ids))})',
+                [owner] + ids).fetchall())
+            if len(rows) != len(ids):
+                raise Unsupported('Records not in the replica')
+            return [self._record(record_id, rows[record_id], fields) for record_id in ids]
+
+        params = [owner]
+        where = _where(spec, call.get('domain'), params)
+        if method == 'search_count':
+            return connection.execute(f'SELECT COUNT(*) FROM "{table}" WHERE owner = ? AND {where}',
+                                      params).fetchone()[0]
+
+        fields = _check_fields(spec, call.get('fields'), context) if method == 'search_read' else None
+        sql = f'SELECT id, data FROM "{table}" WHERE owner = ? AND {where} ORDER BY {_order_by(spec, call.get("order"))}'
+        if call.get('limit') or call.get('offset'):
+            sql += ' LIMIT ? OFFSET ?'
+            params += [call.get('limit') or -1, call.get('offset') or 0]
+        rows = connection.execute(sql, params).fetchall()
+        if method == 'search':
+            return [record_id for record_id, _ in rows]
+        return [self._record(record_id, data, fields) for record_id, data in rows]
+
+    def _record(self, record_id, data, fields):
+        record = serialization.loads(data)
+        return dict({'id': record_id}, **{field: record.get(field, False) for field in fields})
+
+    def reader(self, session, refresh=False):
+        # ReplicaReader for the session's user, whose replica starts syncing in
+        # the background if it was not. refresh syncs it before reading. None
+        # while Odoo has not accepted the session's login: its calls go to Odoo.
+        if not session.get('uid'):
+            return None
+        key = (session['url'], session['db'], session['username'])
+        digest = utils.digest(session['password'])
+        with self._lock:
+            owner = self._owners.get(key)
+            if owner is None:
+                owner = self._owners[key] = _Owner(self, key, session)
+                owner.thread.start()
+            elif owner.verified in (digest, None) or owner.failing:
+                # Syncs go on with credentials that work: the session takes
+                # over when it has the same password, or when the syncs with
+                # the owner's fail (e.g. the password was changed)
+                owner.session = session
+            owner.last_read = time.monotonic()
+        if refresh:
+            owner.sync()
+        return ReplicaReader(self, owner, digest)
+
+    def retire(self, owner):
+        # Stop syncing an idle user's replica; its records stay on disk for the next sync
+        with self._lock:
+            if self._owners.get(owner.key) is owner:
+                del self._owners[owner.key]
+
+    def invalidate(self, url, db, model):
+        # The proxy wrote to model: reads of it go to Odoo until the next sync
+        if model not in MODELS:
+            return
+        with self._lock:
+            owners = [owner for key, owner in self._owners.items() if key[:2] == (url, db)]
+        for owner in owners:
+            owner.models[model]['generation'] += 1
+            owner.wake()
+
+    def close(self):
+        with self._lock:
+            owners, self._owners = list(self._owners.values()), {}
+        for owner in owners:
+            owner.stop()
+
+    def stats(self, key=None):
+        # Size and age of the users' copies, or of the copy of key (url, db, username) only
+        with self._lock:
+            owners = [owner for owner in self._owners.values() if key in (None, owner.key)]
+        connection = self._connection()
+        result = {}
+        for owner in owners:
+            models = {}
+            for model, state in owner.models.items():
+                count = connection.execute(f'SELECT COUNT(*) FROM "{_table(model)}" WHERE owner = ?',
+                                           (utils.owner(*owner.key),)).fetchone()[0]
+                models[model] = {'records': count, 'fresh': owner.is_fresh(model),
+                                 'age': round(time.time() - state['synced_at'], 1) if state['synced_at'] else None}
+            result[utils.owner(*owner.key)] = models
+        return result
+
+
+class ReplicaReader:
+    # Set as OdooClient.replica for the read routes
+
+    def __init__(self, replica, owner, digest):
+        self.replica = replica
+        self.owner = owner
+        self.digest = digest
+
+    def execute_kw(self, model, method, args, kwargs=None):
+        # (True, result) when the replica answered, (False, None) when the call must go to Odoo
+        if model not in MODELS or method not in SIGNATURES:
+            return False, None
+        # Only a password the replica was synced with reads from it
+        if self.digest != self.owner.verified or not self.owner.is_fresh(model):
+            metrics.REPLICA_READS.inc(model, method, 'stale')
+            return False, None
+        try:
+            result = self.replica.query(self.owner.key, model, method, args, kwargs)
+        except Unsupported:
+            metrics.REPLICA_READS.inc(model, method, 'unsupported')
+            return False, None
+        metrics.REPLICA_READS.inc(model, method, 'hit')
+        return True, result
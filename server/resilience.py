@@ -0,0 +1,139 @@
+import http.client
+import os
+import random
+import threading
+import time
+import xmlrpc.client
+from urllib.parse import urlsplit
+
+import metrics
+
+# Consecutive failed calls to an Odoo backend before its circuit opens
+BREAKER_FAILURES = int(os.environ.get('ODOO_BREAKER_FAILURES', 5))
+# Seconds an open circuit rejects calls before letting one through to probe Odoo
+BREAKER_RESET_TIMEOUT = float(os.environ.get('ODOO_BREAKER_RESET_TIMEOUT', 30))
+# Extra attempts for reads failing with a transient error, and the first delay
+# between attempts (doubled on each attempt, with jitter)
+RETRY_ATTEMPTS = int(os.environ.get('ODOO_RETRY_ATTEMPTS', 2))
+RETRY_BACKOFF = float(os.environ.get('ODOO_RETRY_BACKOFF', 0.2))
+
+# HTTP statuses of a reverse proxy in front of an Odoo that is down or restarting
+UNAVAILABLE_STATUSES = {502, 503, 504}
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+
+class CircuitOpenError(ConnectionError):
+    # Raised instead of calling a backend whose circuit is open
+
+    def __init__(self, backend, retry_after):
+        super().__init__(f"Odoo at {backend} is unavailable, retry in {retry_after:.0f}s")
+        self.backend = backend
+        self.retry_after = retry_after
+
+
+def is_failure(error):
+    # Errors showing that Odoo did not answer; faults are answers
+    if isinstance(error, xmlrpc.client.ProtocolError):
+        return error.errcode in UNAVAILABLE_STATUSES
+    return isinstance(error, (OSError, http.client.HTTPException)) and not isinstance(error, CircuitOpenError)
+
+
+def is_transient(error):
+    # Failures worth retrying right away: refused or reset connections and
+    # gateway errors. Timeouts are not retried, they already took long.
+    return is_failure(error) and not isinstance(error, TimeoutError)
+
+
+class CircuitBreaker:
+    # Fails fast while a backend is down: after `failures` consecutive failures
+    # calls are rejected for `reset_timeout` seconds, then a single call is let
+    # through and its outcome closes or reopens the circuit
+
+    def __init__(self, backend, failures=BREAKER_FAILURES, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.backend = backend
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            retry_after = self.opened_at + self.reset_timeout - time.monotonic()
+            if self.state == OPEN and retry_after <= 0:
+                self.state = HALF_OPEN
+                return
+            # Open, or half open with the probe still running
+            raise CircuitOpenError(self.backend, max(retry_after, 1))
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.consecutive_failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failures:
+                if self.state != OPEN:
+                    metrics.BREAKER_OPENED.inc(self.backend)
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def retry_after(self):
+        # Seconds before the circuit lets a call through, 0 when it is closed
+        with self._lock:
+            if self.state == CLOSED:
+                return 0
+            return max(self.opened_at + self.reset_timeout - time.monotonic(), 0)
+
+    def stats(self):
+        with self._lock:
+            return {'state': self.state, 'consecutive_failures': self.consecutive_failures}
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker(backend):
+    # Circuit breaker of an Odoo backend, such as http://odoo:8069
+    with _breakers_lock:
+        circuit = _breakers.get(backend)
+        if circuit is None:
+            circuit = _breakers[backend] = CircuitBreaker(backend)
+    return circuit
+
+
+def backend_of(url):
+    # The key used by the transport: scheme://host[:port]
+    parts = urlsplit(url)
+    return f'{parts.scheme}://{parts.netloc.rpartition("@")[2]}'
+
+
+def is_available(url):
+    return breaker(backend_of(url)).retry_after() == 0
+
+
+def stats(backend=None):
+    # State of the breakers, or of the one of backend only
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {circuit.backend: circuit.stats() for circuit in breakers if backend in (None, circuit.backend)}
+
+
+def retry(call, attempts=RETRY_ATTEMPTS, backoff=RETRY_BACKOFF):
+    # Run call(), trying again after a transient failure with exponential
+    # backoff. Only for calls without side effects.
+    for attempt in range(attempts + 1):
+        try:
+            return call()
+        except Exception as e:
+            if attempt == attempts or not is_transient(e):
+                raise
+        metrics.RPC_RETRIES.inc()
+        time.sleep(backoff * 2 ** attempt * random.uniform(0.5, 1.5))
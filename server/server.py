@@ -1,61 +1,287 @@
+import os
 import xmlrpc.client
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, Response, current_app, has_app_context, request, jsonify, g, stream_with_context
 from flask_cors import CORS
 from datetime import datetime
 import base64
-
-app = Flask(__name__)
-CORS(app)
-
-url = ''
-db = ''
-username = ''
-password = ''
+import admission
+import bulk
+import cache
+import compression
+import etags
+import events
+import filters
+import gateway
+import images
+import metrics
+import pagination
+import replica
+import resilience
+import serialization
+import sessions
+import stale
+import transport
+import watermarks
+import writequeue
+from gateway import run_concurrently
+from odoo_client import OdooClient, write_listeners
+from sessions import SessionStore
+from transport import get_proxy
+
+api = Blueprint('api', __name__)
+
+def create_app(config=None):
+    # Application factory, used by wsgi.py and the development server below
+    app = Flask(__name__)
+    # Settings of the app, by default those of the environment variables of the same name
+    app.config.from_mapping(
+        SESSION_MAX=sessions.SESSION_MAX,
+        SESSION_TTL=sessions.SESSION_TTL,
+        SESSION_REDIS_URL=sessions.SESSION_REDIS_URL,
+        SESSION_SQLITE_PATH=sessions.SESSION_SQLITE_PATH,
+        CONTACT_IMAGE_CACHE_DIR=images.CACHE_DIR,
+        CONTACT_IMAGE_CACHE_MB=images.CACHE_MAX_MB,
+        REFERENCE_CACHE_MAX_ENTRIES=cache.CACHE_MAX_ENTRIES,
+        SYNC_SNAPSHOT_MAX_ENTRIES=SYNC_SNAPSHOT_MAX_ENTRIES,
+        STALE_DEADLINE=stale.STALE_DEADLINE,
+        STALE_MAX_AGE=stale.STALE_MAX_AGE,
+        STALE_MAX_BYTES=stale.STALE_MAX_BYTES,
+        STALE_REFRESH_WORKERS=stale.REFRESH_WORKERS,
+        ODOO_MAX_CONCURRENCY=gateway.MAX_CONCURRENCY,
+        ODOO_GATEWAY_WORKERS=gateway.WORKERS,
+        EVENTS_POLL_INTERVAL=events.POLL_INTERVAL,
+        EVENTS_MAX_STREAMS=events.MAX_STREAMS,
+        WRITE_QUEUE=writequeue.WRITE_QUEUE,
+        REPLICA_PATH=replica.REPLICA_PATH,
+    )
+    app.config.from_mapping(config or {})
+    CORS(app, expose_headers=['X-Session-Token', 'X-Next-Cursor', 'X-Next-Offset', 'Server-Timing', 'ETag',
+                              'Age', 'Warning', 'X-Stale-Reason', 'Retry-After', 'Location', 'Preference-Applied'])
+    app.json = serialization.JSONProvider(app)
+
+    # Per-client credentials, addressed by the token issued by /store-data
+    app.sessions = SessionStore(sessions.default_backend(app.config['SESSION_REDIS_URL'],
+                                                         app.config['SESSION_SQLITE_PATH'],
+                                                         app.config['SESSION_MAX'], app.config['SESSION_TTL']))
+    # Resized contact images served by /contact-image
+    app.image_cache = images.ImageCache(app.config['CONTACT_IMAGE_CACHE_DIR'],
+                                        app.config['CONTACT_IMAGE_CACHE_MB'] * 1024 * 1024)
+    # Stages, tags, groups, installed apps and other rarely changing records
+    app.reference_cache = cache.ReferenceCache(max_entries=app.config['REFERENCE_CACHE_MAX_ENTRIES'])
+    # Ids of the records each /sync client holds, keyed by session token, model
+    # and watermark; a client served by another worker gets the full id list
+    app.sync_snapshots = cache.TTLCache(app.config['SYNC_SNAPSHOT_MAX_ENTRIES'])
+    # Threads running the independent Odoo calls of a request side by side
+    app.gateway = gateway.Gateway(app.config['ODOO_GATEWAY_WORKERS'], app.config['ODOO_MAX_CONCURRENCY'])
+    # Last good responses of the read endpoints, served while Odoo is down or slow
+    app.stale_responses = stale.ResponseStore(app.config['STALE_MAX_BYTES'], app.config['STALE_MAX_AGE'],
+                                              app.config['STALE_DEADLINE'], app.config['STALE_REFRESH_WORKERS'])
+    # Task and activity changes pushed to the clients connected to /events
+    app.event_hub = events.EventHub(app.logger.error, app.config['EVENTS_POLL_INTERVAL'],
+                                    app.config['EVENTS_MAX_STREAMS'])
+    # Writes acknowledged right away and flushed to Odoo in the background
+    app.write_queue = writequeue.WriteQueue(app.logger.error, app.app_context, writequeue.default_store(
+        app.config['SESSION_REDIS_URL'], app.config['SESSION_SQLITE_PATH']))
+    # Optional local copy of the hot models the read routes are answered from
+    app.replica = (replica.Replica(app.config['REPLICA_PATH'], log_error=app.logger.error)
+                   if app.config['REPLICA_PATH'] else None)
+
+    if invalidate_reference_data not in write_listeners:
+        write_listeners.append(invalidate_reference_data)
+    if invalidate_replica not in write_listeners:
+        write_listeners.append(invalidate_replica)
+
+    # after_request functions run in reverse order of registration:
+    # registered before the blueprint, compression runs after its hooks
+    app.after_request(compress_response)
+    app.register_blueprint(api)
+    return app
+
+def shutdown(app):
+    # Graceful shutdown, once the server stopped handing requests to the app:
+    # ends the event streams, flushes the queued writes, waits for the Odoo
+    # calls still in flight and closes the pooled connections
+    app.event_hub.close()
+    app.write_queue.close()
+    if app.replica is not None:
+        app.replica.close()
+    app.stale_responses.shutdown()
+    app.gateway.shutdown()
+    transport.close()
+
+def compress_response(response):
+    return compression.compress_response(request, response)
+
+# Drop cached reference data as soon as the proxy itself writes to it
+def invalidate_reference_data(client, model):
+    if has_app_context() and model in current_app.reference_cache.ttls:
+        current_app.reference_cache.invalidate(client.url, client.db, model)
+
+# Reads of the replicated models go to Odoo until the replica synced the proxy's write
+def invalidate_replica(client, model):
+    if has_app_context() and current_app.replica is not None:
+        current_app.replica.invalidate(client.url, client.db, model)
+
+# Routes that can be called without a session token
+PUBLIC_ENDPOINTS = {'api.store_data', 'api.login_api', 'api.prometheus_metrics', 'static'}
+# Routes whose reads may be answered from the local replica
+REPLICA_ENDPOINTS = {'api.fetch_tasks', 'api.fetch_contacts', 'api.fetch_timesheet', 'api.fetch_new_task',
+                     'api.bootstrap', 'api.sync'}
+# Routes reading many records at once, whose Odoo calls wait behind the other
+# routes' when Odoo is busy
+BULK_ENDPOINTS = {'api.fetch_contacts', 'api.fetch_timesheet', 'api.timesheet_report', 'api.bootstrap', 'api.sync'}
 
 # Helper function to log errors
 def log_error(message):
-    app.logger.error(message)
+    current_app.logger.error(message)
     print(message)  # Also print to console for debugging purposes
 
-@app.route('/store-data', methods=['POST'])
+# Helper function to read the session token sent by the client
+def get_session_token():
+    return request.headers.get('X-Session-Token') or request.args.get('token')
+
+@api.before_app_request
+def start_request_metrics():
+    metrics.start_request()
+
+@api.before_app_request
+def start_admission():
+    # Writes go first, then the interactive reads, then the bulk reads
+    if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+        admission.start_request(admission.WRITE)
+    elif request.endpoint in BULK_ENDPOINTS:
+        admission.start_request(admission.BULK)
+    else:
+        admission.start_request(admission.READ)
+
+@api.after_app_request
+def add_server_timing(response):
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    server_timing = metrics.finish_request(route, request.method, response.status_code)
+    if server_timing:
+        response.headers['Server-Timing'] = server_timing
+        response.headers['Timing-Allow-Origin'] = '*'
+    return response
+
+@api.before_app_request
+def load_session():
+    if request.method == 'OPTIONS' or request.endpoint in PUBLIC_ENDPOINTS:
+        return None
+    g.token = get_session_token()
+    g.session = current_app.sessions.get(g.token)
+    if g.session is None:
+        return jsonify({'error': 'Invalid or expired session, call /store-data first'}), 401
+    # The Odoo calls of the request count against the user's rate
+    admission.set_user(g.session)
+
+@api.after_app_request
+def reject_overload(response):
+    # A request whose Odoo call was refused by the admission control answers
+    # 429 (the user is over their rate) or 503 (Odoo is overloaded) instead of 500
+    error = admission.rejection()
+    if error is not None and response.status_code >= 500:
+        response.status_code = error.status
+        response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+@api.app_errorhandler(admission.RejectedError)
+def handle_rejected(error):
+    # Refused calls the route did not catch, e.g. the login of client.uid
+    return jsonify({'error': str(error)}), error.status, {'Retry-After': str(error.retry_after)}
+
+@api.after_app_request
+def save_session_uid(response):
+    # Remember the uid obtained during the request so the next one skips the login
+    client = g.get('client')
+    if client is not None and client._uid and client._uid != g.session.get('uid'):
+        current_app.sessions.update(g.token, uid=client._uid)
+    return response
+
+# Helper function to get an Odoo client for the session of the current request
+def get_client():
+    if g.get('client') is None:
+        session = g.session
+        g.client = OdooClient(session['url'], session['db'], session['username'], session['password'],
+                              uid=session.get('uid'), protocol=session.get('protocol'))
+        # The read routes are answered from the replica when it is on; ?refresh=1 syncs it first
+        if current_app.replica is not None and request.endpoint in REPLICA_ENDPOINTS:
+            g.client.replica = current_app.replica.reader(session, refresh=request.args.get('refresh') in ('1', 'true'))
+    return g.client
+
+# Helper function for conditional GETs: computes the ETag of the response from
+# what it depends on and returns a 304 response when the client already has it
+def not_modified(*parts):
+    client = get_client()
+    g.etag = etags.make(request.full_path, client.url, client.db, client.uid, *parts)
+    if request.if_none_match.contains_weak(g.etag):
+        return Response(status=304)
+    return None
+
+@api.after_app_request
+def add_etag(response):
+    etag = g.get('etag')
+    if etag and response.status_code in (200, 304):
+        # Weak: it stands for the data, sent compressed or not, so that the
+        # 304 and the 200 carry the same validator
+        response.set_etag(etag, weak=True)
+        # Clients may keep the response but must revalidate it before reuse
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@api.route('/store-data', methods=['POST'])
 def store_data():
-    global url, db, username, password
     try:
         data = request.json
-        url = data['url']
-        db = data['db']
-        username = data['username']
-        password = data['password']
-
-        print (url)
-        print (db)
-        print (username)
-        print (password)
-
-        return 'Data stored successfully', 200
+        session = {
+            'url': data['url'],
+            'db': data['db'],
+            'username': data['username'],
+            'password': data['password'],
+        }
+        # Optional protocol of the Odoo calls, the server default otherwise
+        if data.get('protocol'):
+            if data['protocol'] not in transport.PROTOCOLS:
+                return jsonify({'error': f"protocol must be one of: {', '.join(transport.PROTOCOLS)}"}), 400
+            session['protocol'] = data['protocol']
+
+        # Replace the caller's previous session instead of leaving it behind
+        previous_token = get_session_token()
+        if previous_token:
+            current_app.sessions.delete(previous_token)
+        token = current_app.sessions.create(session)
+
+        current_app.logger.info(f"Stored session for {session['username']} on {session['url']} ({session['db']})")
+
+        response = jsonify({'message': 'Data stored successfully', 'token': token})
+        response.headers['X-Session-Token'] = token
+        return response, 200
     except Exception as e:
         log_error(f"Error storing data: {e}")
         return jsonify({'error': 'Error storing data', 'message': str(e)}), 500
 
-@app.route('/get-data', methods=['GET'])
+@api.route('/get-data', methods=['GET'])
 def get_data():
-    global url, db, username, password
     data = {
-        'url': url,
-        'db': db,
-        'username': username,
-        'password': password,
+        'url': g.session['url'],
+        'db': g.session['db'],
+        'username': g.session['username'],
+        'password': g.session['password'],
     }
     return jsonify(data), 200
 
-@app.route('/test-database-api', methods=['GET'])
+@api.route('/logout', methods=['POST'])
+def logout():
+    current_app.sessions.delete(g.token)
+    return jsonify({'message': 'Session closed'}), 200
+
+@api.route('/test-database-api', methods=['GET'])
 def test_database_api():
-    global url
+    url = g.session['url']
     try:
         if not url:
             raise ValueError("URL is not set or invalid")
 
-        info = xmlrpc.client.ServerProxy(f'{url}/start').start()
+        info = get_proxy(url, '/start').start()
         return jsonify(info), 200
     except xmlrpc.client.ProtocolError as e:
         log_error(f"ProtocolError connecting to {url}/start: {e}")
@@ -70,36 +296,35 @@ def test_database_api():
         log_error(f"Unexpected error connecting to {url}/start: {e}")
         return jsonify({'error': 'UnexpectedError', 'message': str(e)}), 500
 
-@app.route('/login-api', methods=['POST'])
+@api.route('/login-api', methods=['POST'])
 def login_api():
-    global url
     data = request.json
     url = data['url']
+    protocol = data.get('protocol')
     
     try:
-        common = xmlrpc.client.ServerProxy(f'{url}/xmlrpc/2/common')
+        common = get_proxy(url, '/xmlrpc/2/common', protocol)
         version = common.version()
 
-        db_methods = xmlrpc.client.ServerProxy(f'{url}/xmlrpc/2/db')
+        db_methods = get_proxy(url, '/xmlrpc/2/db', protocol)
         dbs = db_methods.list()
 
         return jsonify({'version': version, 'databases': dbs}), 200
     
     except xmlrpc.client.ProtocolError as e:
-        app.logger.error(f"ProtocolError connecting to {url}/xmlrpc/2/common: {e}")
+        current_app.logger.error(f"ProtocolError connecting to {url}/xmlrpc/2/common: {e}")
         return jsonify({'error': 'ProtocolError', 'message': str(e)}), 500
     
     except Exception as e:
-        app.logger.error(f"Error verifying server URL: {e}")
+        current_app.logger.error(f"Error verifying server URL: {e}")
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/authenticate-api', methods=['GET'])
+@api.route('/authenticate-api', methods=['GET'])
 def authenticate_api():
-    global url, db, username, password
+    url = g.session['url']
     try:
-        common = xmlrpc.client.ServerProxy(f'{url}/xmlrpc/2/common')
-        uid = common.authenticate(db, username, password, {})
+        uid = get_client().uid
         print(type(uid))
         print(uid)
         if uid:
@@ -113,57 +338,157 @@ def authenticate_api():
         log_error(f"Error connecting to {url}/xmlrpc/2/common: {e}")
         return jsonify({'status': 'failed', 'message': str(e)}), 500
 
-@app.route('/fetch-tasks', methods=['GET'])
+STAGE_FIELDS = ['id', 'name', 'project_ids']
+
+# Helper function returning every task stage, from the reference-data cache
+def get_stages(client, force=False):
+    return current_app.reference_cache.search_read(client, 'project.task.type', [], STAGE_FIELDS, force)
+
+def match_stage_ids(stages, stage_name, project_id=None):
+    return [stage['id'] for stage in stages
+            if stage['name'] == stage_name and (project_id is None or project_id in stage['project_ids'])]
+
+# Helper function to find stage ids by name, optionally within one project
+def find_stage_ids(client, stage_name, project_id=None):
+    return find_many_stage_ids(client, [(stage_name, project_id)])[(stage_name, project_id)]
+
+# Helper function resolving many (stage name, project id or None) pairs to stage ids at once
+def find_many_stage_ids(client, keys):
+    # A miss reloads the stages once in case the stage was created after they were cached
+    stages = get_stages(client)
+    if any(not match_stage_ids(stages, *key) for key in keys):
+        stages = get_stages(client, force=True)
+    return {key: match_stage_ids(stages, *key) for key in keys}
+
+# Helper function returning {tag id: tag name} for the given tags, from the cache
+def get_tag_names(client, tag_ids):
+    tags = current_app.reference_cache.search_read(client, 'project.tags', [], ['id', 'name'])
+    if any(tag_id not in {tag['id'] for tag in tags} for tag_id in tag_ids):
+        tags = current_app.reference_cache.search_read(client, 'project.tags', [], ['id', 'name'], force=True)
+    return {tag['id']: tag['name'] for tag in tags}
+
+# Helper function returning what the task lists depend on, read with light
+# search_reads over ids and write dates, for their ETag
+def task_list_version(client, domain):
+    tasks = client.execute_kw('project.task', 'search_read', [domain], {'fields': ['write_date']})
+    activities = client.execute_kw('mail.activity', 'search_read',
+                                   [[['res_id', 'in', [task['id'] for task in tasks]], ['res_model', '=', 'project.task']]],
+                                   {'fields': ['write_date']})
+    tags = current_app.reference_cache.search_read(client, 'project.tags', [], ['id', 'name'])
+    return etags.version(tasks), etags.version(activities), get_stages(client), tags
+
+TASK_FIELDS = ['name', 'description', 'project_id', 'tag_ids', 'date_deadline', 'user_ids', 'planned_hours', 'create_date', 'priority', 'stage_id', 'remaining_hours', 'kanban_state']
+TASK_ORDER_FIELDS = {'id', 'name', 'date_deadline', 'create_date', 'write_date', 'priority', 'sequence', 'stage_id', 'project_id'}
+
+# Fields computed by enrich_tasks, and the task field each one is computed from
+TASK_EXTRA_FIELDS = {'activities': None, 'stages': 'project_id', 'tag_names': 'tag_ids'}
+# Fields a client may ask for with ?fields=
+TASK_ALLOWED_FIELDS = set(TASK_FIELDS) | {'write_date'} | set(TASK_EXTRA_FIELDS)
+
+# Helper function splitting the fields asked for into the ones read from Odoo,
+# the computed ones, and the ones read only to compute the others
+def task_read_fields(requested):
+    extras = [field for field in requested if field in TASK_EXTRA_FIELDS]
+    fields = [field for field in requested if field not in TASK_EXTRA_FIELDS]
+    helpers = [TASK_EXTRA_FIELDS[extra] for extra in extras
+               if TASK_EXTRA_FIELDS[extra] and TASK_EXTRA_FIELDS[extra] not in fields]
+    # Odoo reads every field for an empty list: only computed fields were asked for
+    return (fields + helpers) or ['id'], extras, helpers
+
+# Helper function to add activities, project stages and tag names to tasks
+def enrich_tasks(client, tasks, extras=tuple(TASK_EXTRA_FIELDS), helpers=()):
+    if not tasks or not extras:
+        return tasks
+
+    # Fetch the activities of all tasks, the stages of all projects and the tags
+    # in one concurrent round of calls, then join them in memory
+    task_ids = [task['id'] for task in tasks]
+    project_ids = list(set(task['project_id'][0] for task in tasks if task.get('project_id')))
+    tag_ids = list(set(tag_id for task in tasks for tag_id in task.get('tag_ids', [])))
+    calls = {
+        'activities': lambda: client.execute_kw('mail.activity', 'search_read',
+                                                [[['res_id', 'in', task_ids], ['res_model', '=', 'project.task']]],
+                                                {'fields': ['id', 'summary', 'activity_type_id', 'date_deadline', 'user_id', 'note', 'res_id']}),
+        'stages': lambda: get_stages(client),
+        'tag_names': lambda: get_tag_names(client, tag_ids),
+    }
+    extras = [extra for extra in calls if extra in extras]
+    client.uid  # Log in once before fanning out
+    results = dict(zip(extras, run_concurrently(client.url, [calls[extra] for extra in extras])))
+
+    if 'activities' in results:
+        activities_by_task = {}
+        for activity in results['activities']:
+            activities_by_task.setdefault(activity.pop('res_id'), []).append(activity)
+
+        for task in tasks:
+            task['activities'] = activities_by_task.get(task['id'], [])
+
+    if 'stages' in results:
+        stages_by_project = {project_id: [] for project_id in project_ids}
+        for stage in results['stages']:
+            for project_id in stage['project_ids']:
+                if project_id in stages_by_project:
+                    stages_by_project[project_id].append(stage['name'])
+
+        for task in tasks:
+            if task['project_id']:
+                task['stages'] = stages_by_project[task['project_id'][0]]
+
+    for task in tasks:
+        if 'tag_names' in results:
+            task['tag_names'] = [results['tag_names'][tag_id] for tag_id in task['tag_ids']]
+        for field in helpers:
+            del task[field]
+
+    return tasks
+
+@api.route('/fetch-tasks', methods=['GET'])
+@stale.serve_stale
 def fetch_tasks():
-    global url, db, username, password
+    url = g.session['url']
     try:
-        if not url or not db:
-            raise ValueError("URL or DB is not set or invalid")
-
-        common = xmlrpc.client.ServerProxy(f'{url}/xmlrpc/2/common')
-        models = xmlrpc.client.ServerProxy(f'{url}/xmlrpc/2/object')
+        # Optional paging (limit, offset or after_id, order) or NDJSON streaming (stream=1)
+        page = pagination.parse_page(request.args, TASK_ORDER_FIELDS)
+        # Optional filters (project_id, stage_id, deadline_from, deadline_to, q) and ?fields= projection
+        filter_domain = filters.task_domain(request.args)
+        fields, extras, helpers = task_read_fields(
+            filters.parse_fields(request.args, TASK_ALLOWED_FIELDS, TASK_FIELDS + list(TASK_EXTRA_FIELDS)))
+    except (pagination.PaginationError, filters.FilterError) as e:
+        return jsonify({'error': str(e)}), 400
 
-        user_id = common.authenticate(db, username, password, {})
+    try:
+        client = get_client()
+        user_id = client.uid
         if not user_id:
             return jsonify({'error': 'Authentication failed'}), 401
 
-        task_ids = models.execute_kw(db, user_id, password, 'project.task', 'search', [[['user_ids', 'in', [user_id]]]])
-        tasks = models.execute_kw(db, user_id, password, 'project.task', 'read', [task_ids],
-                                  {'fields': ['name', 'description', 'project_id', 'tag_ids', 'date_deadline', 'user_ids', 'planned_hours', 'create_date', 'priority', 'stage_id', 'remaining_hours', 'kanban_state']})
+        domain = [['user_ids', 'in', [user_id]]] + filter_domain
+        enrich = lambda tasks: enrich_tasks(client, tasks, extras, helpers)
 
-        if not tasks:
-            return jsonify({'message': 'No tasks found for the authenticated user'}), 404
+        if page is None or not page.stream:
+            # Skip reading and enriching the tasks when the client's copy is current
+            response = not_modified(*task_list_version(client, domain))
+            if response is not None:
+                return response
 
-        for task in tasks:
-            activity_ids = models.execute_kw(db, user_id, password, 'mail.activity', 'search',
-                                             [[['res_id', '=', task['id']], ['res_model', '=', 'project.task']]])
-            activities = models.execute_kw(db, user_id, password, 'mail.activity', 'read', [activity_ids],
-                                           {'fields': ['id', 'summary', 'activity_type_id', 'date_deadline', 'user_id', 'note']})
-
-            task['activities'] = activities
-
-        project_ids = list(set(task['project_id'][0] for task in tasks))
-        stages_by_project = {}
-        for project_id in project_ids:
-            stages = models.execute_kw(db, user_id, password,
-                                       'project.task.type', 'search_read',
-                                       [[['project_ids', 'in', [project_id]]]],
-                                       {'fields': ['id', 'name']}
-                                       )
-            stages_by_project[project_id] = [stage['name'] for stage in stages]
-
-        tag_ids = list(set(tag_id for task in tasks for tag_id in task['tag_ids']))
-        tags = models.execute_kw(db, user_id, password, 'project.tags', 'read', [tag_ids], {'fields': ['name']})
-        tag_map = {tag['id']: tag['name'] for tag in tags}
+        if page is not None and page.stream:
+            batches = pagination.iter_batches(client, 'project.task', domain, fields, page)
+            rows = pagination.ndjson(batches, enrich, log_error)
+            return Response(stream_with_context(rows), mimetype='application/x-ndjson')
 
-        for task in tasks:
-            project_id = task['project_id'][0]
-            if project_id in stages_by_project:
-                task['stages'] = stages_by_project[project_id]
+        if page is not None:
+            tasks, headers = pagination.read_page(client, 'project.task', domain, fields, page)
+            return jsonify(enrich(tasks)), 200, headers
+
+        tasks = client.execute_kw('project.task', 'search_read', [domain], {'fields': fields})
+
+        if not tasks:
+            return jsonify({'message': 'No tasks found for the authenticated user'}), 404
 
-            task['tag_names'] = [tag_map[tag_id] for tag_id in task['tag_ids']]
+        enrich(tasks)
 
-        app.logger.info(f"Tasks fetched successfully: {tasks}")
+        current_app.logger.info(f"Tasks fetched successfully: {len(tasks)} tasks")
         return jsonify(tasks), 200
 
     except xmlrpc.client.ProtocolError as e:
@@ -174,25 +499,27 @@ def fetch_tasks():
         log_error(f"Error fetching tasks: {e}")
         return jsonify({'error': 'Error fetching tasks', 'message': str(e)}), 500
 
-@app.route('/fetch-apps', methods=['GET'])
+# Helper function returning the names of the installed modules, from the reference-data cache
+def get_active_apps(client):
+    module_ids = current_app.reference_cache.search_read(client, 'ir.module.module',
+                                                         [('state', '=', 'installed')],
+                                                         ['name'])
+    return [module['name'] for module in module_ids]
+
+@api.route('/fetch-apps', methods=['GET'])
+@stale.serve_stale
 def fetch_apps():
-    global url, db, username, password
     try:
         # Connect to Odoo XML-RPC
-        common_endpoint = '{}/xmlrpc/2/common'.format(url)
-        object_endpoint = '{}/xmlrpc/2/object'.format(url)
-        common = xmlrpc.client.ServerProxy(common_endpoint)
-        uid = common.authenticate(db, username, password, {})
+        client = get_client()
+        uid = client.uid
         
         if uid:
-            models = xmlrpc.client.ServerProxy(object_endpoint)
-            module_ids = models.execute_kw(db, uid, password,
-                                           'ir.module.module', 'search_read',
-                                           [[('state', '=', 'installed')]],
-                                           {'fields': ['name']}
-                                           )
-            active_apps = [module['name'] for module in module_ids]
+            active_apps = get_active_apps(client)
             print (active_apps)
+            response = not_modified(active_apps)
+            if response is not None:
+                return response
             return jsonify({'active_apps': active_apps}), 200
         else:
             return jsonify({'error': 'Authentication failed'}), 401
@@ -200,15 +527,27 @@ def fetch_apps():
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/update-stage', methods=['POST'])
+# Helper function telling whether the client asked for the write to be queued
+# (Prefer: respond-async) and the write queue is on
+def wants_async():
+    preferences = request.headers.get('Prefer', '')
+    return current_app.config['WRITE_QUEUE'] and any(preference.split(';')[0].strip() == 'respond-async'
+                                          for preference in preferences.split(','))
+
+# Helper function queueing a write with the credentials of the session and
+# answering 202 with the operation to poll
+def queue_write(model, method, values, record_id=None):
+    session = dict(g.session, uid=get_client().uid)
+    operation_id = current_app.write_queue.submit(session, model, method, values, record_id)
+    response = jsonify({'success': True, 'operation_id': operation_id, 'status': writequeue.QUEUED})
+    response.status_code = 202
+    response.headers['Location'] = f'/operations/{operation_id}'
+    response.headers['Preference-Applied'] = 'respond-async'
+    return response
+
+@api.route('/update-stage', methods=['POST'])
 def update_stage():
-
-    global url, db, username, password
-
-    common = xmlrpc.client.ServerProxy('{}/xmlrpc/2/common'.format(url))
-    uid = common.authenticate(db, username, password, {})
-
-    models = xmlrpc.client.ServerProxy('{}/xmlrpc/2/object'.format(url))
+    client = get_client()
 
     try:
         data = request.get_json()
@@ -219,16 +558,20 @@ def update_stage():
             return jsonify({'success': False, 'error': 'Missing task_id or new_stage_name'}), 400
 
         # Fetch the stage ID based on the stage name
-        stage_ids = models.execute_kw(db, uid, password,
-            'project.task.type', 'search', [[['name', '=', new_stage_name]]])
+        stage_ids = find_stage_ids(client, new_stage_name)
         
         if not stage_ids:
             return jsonify({'success': False, 'error': 'Stage not found'}), 404
 
         new_stage_id = stage_ids[0]
 
+        if wants_async():
+            if not isinstance(task_id, int):
+                return jsonify({'success': False, 'error': 'task_id must be an integer'}), 400
+            return queue_write('project.task', 'write', {'stage_id': new_stage_id}, record_id=task_id)
+
         # Update the task stage
-        result = models.execute_kw(db, uid, password, 'project.task', 'write', [[task_id], {'stage_id': new_stage_id}])
+        result = client.execute_kw('project.task', 'write', [[task_id], {'stage_id': new_stage_id}])
 
         if result:
             return jsonify({'success': True}), 200
@@ -238,14 +581,69 @@ def update_stage():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/isadmin', methods=['GET'])
-def isadmin():
-    global url, db, username, password
+@api.route('/update-stage/bulk', methods=['POST'])
+def update_stage_bulk():
+    # Batch variant of /update-stage for clients replaying queued edits. Takes
+    # [{"task_id": ..., "new_stage_name": ...}, ...], resolves all stage names
+    # with one lookup and moves the tasks headed for the same stage with one write.
+    client = get_client()
+
+    try:
+        items = bulk.parse_items(request.get_json(silent=True))
+    except bulk.BulkError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    try:
+        # Each item is checked on its own, so that a malformed one fails alone
+        results = [None] * len(items)
+        for index, item in enumerate(items):
+            task_id = item.get('task_id')
+            new_stage_name = item.get('new_stage_name')
+            if not isinstance(task_id, int) or isinstance(task_id, bool) or not new_stage_name:
+                results[index] = bulk.failed(index, 'Missing task_id or new_stage_name')
+            elif not isinstance(new_stage_name, str):
+                results[index] = bulk.failed(index, 'new_stage_name must be a string')
+        valid = [item for index, item in enumerate(items) if results[index] is None]
+        stage_ids = find_many_stage_ids(client, {(item['new_stage_name'], None) for item in valid})
+
+        targets = {}  # task id -> stage id, the last item wins when a task is sent twice
+        for index, item in enumerate(items):
+            if results[index] is not None:
+                continue
+            if not stage_ids[(item['new_stage_name'], None)]:
+                results[index] = bulk.failed(index, 'Stage not found')
+            else:
+                targets[item['task_id']] = stage_ids[(item['new_stage_name'], None)][0]
+
+        groups = {}
+        for task_id, stage_id in targets.items():
+            groups.setdefault(stage_id, ([], {'stage_id': stage_id}))[0].append(task_id)
+        written = bulk.write_groups(client, 'project.task', groups)
+
+        for index, item in enumerate(items):
+            if results[index] is None:
+                results[index] = bulk.outcome(index, written[item['task_id']])
+        return jsonify(bulk.summary(results)), 200
 
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+# Helper function telling whether the user is in an Administrator group, None when the user is not found
+def user_is_admin(client, uid):
+    user = client.execute_kw('res.users', 'read', [uid], {'fields': ['id', 'groups_id']})
+    if not user:
+        return None
+    # Look the administrator groups up in the cached group names
+    admin_group_ids = current_app.reference_cache.name_index(client, 'res.groups').get('Administrator', [])
+    return any(admin_group_id in user[0]['groups_id'] for admin_group_id in admin_group_ids)
+
+@api.route('/isadmin', methods=['GET'])
+@stale.serve_stale
+def isadmin():
     try:
         # Authenticate user
-        common = xmlrpc.client.ServerProxy('{}/xmlrpc/2/common'.format(url))
-        uid = common.authenticate(db, username, password, {})
+        client = get_client()
+        uid = client.uid
 
         if uid is None:
             print('Failed to authenticate user')
@@ -253,93 +651,73 @@ def isadmin():
 
         print(f'Authenticated user with uid: {uid}')
 
-        # Initialize the object connection
-        models = xmlrpc.client.ServerProxy('{}/xmlrpc/2/object'.format(url))
-
-        # Fetch the user details
-        user = models.execute_kw(db, uid, password, 'res.users', 'read', [uid], {'fields': ['id', 'groups_id']})
-        if not user:
+        # Check if the user is in any of the Administrator groups
+        is_admin = user_is_admin(client, uid)
+        if is_admin is None:
             print('User not found')
             return jsonify({'error': 'User not found'}), 404
-
-        user = user[0]
-        group_ids = user['groups_id']
-        print(f'User group IDs: {group_ids}')
-
-        # Fetch all groups to find the correct administrator group name
-        all_groups = models.execute_kw(db, uid, password, 'res.groups', 'search_read', [[], ['name']])
-        admin_group_ids = [group['id'] for group in all_groups if group['name'] == 'Administrator']
-
-        if not admin_group_ids:
-            print('Administrator group not found')
-            return jsonify({'is_admin': False})
-
-        print(f'Administrator group IDs: {admin_group_ids}')
-
-        # Check if the user is in any of the Administrator groups
-        is_admin = any(admin_group_id in group_ids for admin_group_id in admin_group_ids)
         print(f'The user {"is" if is_admin else "is not"} an administrator')
+        response = not_modified(is_admin)
+        if response is not None:
+            return response
         return jsonify({'is_admin': is_admin}), 200
 
     except Exception as e:
         print(f'An error occurred: {str(e)}')
         return jsonify({'error': 'An error occurred'}), 500
     
-@app.route('/fetch-new-task', methods=['GET'])
+# Helper function returning the user's projects with their tasks and stages, and the active users
+def get_new_task_data(client, uid):
+    # Fetch projects related to the authenticated user and the active users concurrently
+    projects, users = run_concurrently(client.url, [
+        lambda: client.execute_kw('project.project', 'search_read', [[('user_id', '=', uid)]], {'fields': ['name']}),
+        lambda: current_app.reference_cache.search_read(client, 'res.users', [('active', '=', True)], ['name']),
+    ])
+    project_ids = [project['id'] for project in projects]
+
+    # Fetch the tasks of all projects at once, the stages come from the cache
+    tasks, stages = run_concurrently(client.url, [
+        lambda: client.execute_kw('project.task', 'search_read', [[('project_id', 'in', project_ids)]], {'fields': ['name', 'project_id']}),
+        lambda: get_stages(client),
+    ])
+
+    task_names = {project_id: [] for project_id in project_ids}
+    for task in tasks:
+        if task['project_id'] and task['project_id'][0] in task_names:
+            task_names[task['project_id'][0]].append(task['name'])
+
+    stage_names = {project_id: [] for project_id in project_ids}
+    for stage in stages:
+        for project_id in stage['project_ids']:
+            if project_id in stage_names:
+                stage_names[project_id].append(stage['name'])
+
+    project_data = []
+    for project in projects:
+        project_data.append({
+            'Project': project['name'],
+            'Tasks': task_names[project['id']],
+            'Stages': stage_names[project['id']]
+        })
+
+    user_data = [{'name': user['name']} for user in users]
+    return {'projects': project_data, 'users': user_data}
+
+@api.route('/fetch-new-task', methods=['GET'])
+@stale.serve_stale
 def fetch_new_task():
-    global url, db, username, password
-
     try:
         # Authenticate the user
-        common = xmlrpc.client.ServerProxy('{}/xmlrpc/2/common'.format(url))
-        uid = common.authenticate(db, username, password, {})
+        client = get_client()
+        uid = client.uid
 
         if uid:
-            models = xmlrpc.client.ServerProxy('{}/xmlrpc/2/object'.format(url))
-
-            # Fetch projects related to the authenticated user
-            projects = models.execute_kw(db, uid, password,
-                                         'project.project', 'search_read',
-                                         [[('user_id', '=', uid)]],
-                                         {'fields': ['name']})
-
-            project_data = []
-            for project in projects:
-                project_name = project['name']
-                project_id = project['id']
-                
-                # Fetch tasks for the project
-                tasks = models.execute_kw(db, uid, password,
-                                          'project.task', 'search_read',
-                                          [[('project_id', '=', project_id)]],
-                                          {'fields': ['name']})
-                task_names = [task['name'] for task in tasks]
-
-                # Fetch stages for the project
-                stages = models.execute_kw(db, uid, password,
-                                           'project.task.type', 'search_read',
-                                           [[('project_ids', 'in', project_id)]],
-                                           {'fields': ['name']})
-                stage_names = [stage['name'] for stage in stages]
-
-                project_data.append({
-                    'Project': project_name,
-                    'Tasks': task_names,
-                    'Stages': stage_names
-                })
-
-            # Fetch users related to the Odoo instance
-            users = models.execute_kw(db, uid, password,
-                                      'res.users', 'search_read',
-                                      [[('active', '=', True)]],
-                                      {'fields': ['name']})
-
-            user_data = [{'name': user['name']} for user in users]
-
-            print('Projects:', project_data)
-            print('Users:', user_data)
-
-            return jsonify({'projects': project_data, 'users': user_data})
+            data = get_new_task_data(client, uid)
+
+            print('Projects:', data['projects'])
+            print('Users:', data['users'])
+
+            return jsonify(data)
         else:
             print('Failed to authenticate user')
             return jsonify({'error': 'Failed to authenticate user'})
@@ -349,8 +727,6 @@ def fetch_new_task():
         return jsonify({'error': str(e)})
     
 def create_task_in_odoo(task_data):
-    global url, username, password
-
     data = request.json
 
     task_name = data.get('task_name')
@@ -361,30 +737,28 @@ def create_task_in_odoo(task_data):
     deadline = data.get('deadline')
 
     # Authenticate
-    common = xmlrpc.client.ServerProxy('{}/xmlrpc/2/common'.format(url))
-    uid = common.authenticate(db, username, password, {})
+    client = get_client()
+    uid = client.uid
     print(uid)
     if uid:
-        models = xmlrpc.client.ServerProxy('{}/xmlrpc/2/object'.format(url))
-        
         # Fetch project ID
-        project_id = models.execute_kw(db, uid, password, 'project.project', 'search', [[['name', '=', project_name]]])
+        project_id = current_app.reference_cache.ids_by_name(client, 'project.project', project_name)
         if not project_id:
             print(f"Project '{project_name}' not found.")
-            exit()
+            return False
         
         # Fetch stage ID
-        stage_id = models.execute_kw(db, uid, password, 'project.task.type', 'search', [[['name', '=', stage_name], ['project_ids', 'in', project_id[0]]]])
+        stage_id = find_stage_ids(client, stage_name, project_id[0])
         if not stage_id:
             print(f"Stage '{stage_name}' not found in project '{project_name}'.")
-            exit()
+            return False
         
         # Fetch user ID by user name
-        user_ids = models.execute_kw(db, uid, password, 'res.users', 'search_read', [[['name', '=', user_name]]], {'fields': ['id']})
+        user_ids = current_app.reference_cache.ids_by_name(client, 'res.users', user_name)
         if not user_ids:
             print(f"User '{user_name}' not found.")
-            exit()
-        user_id = user_ids[0]['id']
+            return False
+        user_id = user_ids[0]
         
         # Task details dictionary
         task_details = {
@@ -397,7 +771,7 @@ def create_task_in_odoo(task_data):
         }
 
         # Create task
-        task_id = models.execute_kw(db, uid, password, 'project.task', 'create', [task_details])
+        task_id = client.execute_kw('project.task', 'create', [task_details])
         
         if task_id:
             print(f"Task created successfully with ID: {task_id}")
@@ -408,10 +782,8 @@ def create_task_in_odoo(task_data):
     else:
         print("Failed to authenticate.")
     
-@app.route('/add-task', methods=['POST'])
+@api.route('/add-task', methods=['POST'])
 def add_task():
-    global url, username, password
-
     data = request.json
 
     task_name = data.get('task_name')
@@ -448,42 +820,107 @@ def add_task():
         print(f'Error adding task: {e}')
         return jsonify({'success': False, 'error': 'Error adding task'}), 500
 
-@app.route('/fetch-contacts', methods=['GET'])
-def fetch_contacts():
-    global url, username, password
+CONTACT_ORDER_FIELDS = {'id', 'name', 'email', 'create_date', 'write_date'}
+CONTACT_FIELDS = ['name', 'email', 'phone', 'mobile']
+# Fields a client may ask for with ?fields=, images are chosen with ?images=
+CONTACT_ALLOWED_FIELDS = set(CONTACT_FIELDS) | {'function', 'street', 'city', 'zip', 'country_id', 'parent_id',
+                                                'is_company', 'website'}
+
+# Helper function giving the fields and context to read contacts with
+def contact_read_options(image_mode, fields=CONTACT_FIELDS):
+    if image_mode == 'none':
+        return list(fields), None
+    if image_mode == 'url':
+        # With bin_size Odoo returns the size of each image instead of its content
+        return list(fields) + ['image_1920', 'write_date'], {'bin_size': True}
+    image_field = 'image_128' if image_mode == 'thumbnail' else 'image_1920'
+    return list(fields) + [image_field], None
+
+# Helper function to turn contact images into URLs or base64 strings
+def format_contacts(contacts, image_mode, size=128):
+    if image_mode == 'none':
+        return contacts
+    if image_mode == 'url':
+        for contact in contacts:
+            has_image = bool(contact.pop('image_1920'))
+            write_date = contact.pop('write_date')
+            contact['image_url'] = f"/contact-image/{contact['id']}?size={size}" if has_image else None
+            contact['image_etag'] = images.image_etag(contact['id'], write_date, size) if has_image else None
+        return contacts
+
+    image_field = 'image_128' if image_mode == 'thumbnail' else 'image_1920'
+
+    # Process contact images
+    for contact in contacts:
+        if contact.get(image_field):
+            if isinstance(contact[image_field], bytes):
+                # If image is in bytes, encode it to base64
+                contact[image_field] = base64.b64encode(contact[image_field]).decode('utf-8')
+            elif isinstance(contact[image_field], str):
+                # If image is already a base64 string, no need to encode again
+                contact[image_field] = contact[image_field]
+            else:
+                # Handle unexpected data type
+                contact[image_field] = None
+        else:
+            contact[image_field] = None
+    return contacts
 
-    # Set up XML-RPC connections
-    common = xmlrpc.client.ServerProxy('{}/xmlrpc/2/common'.format(url))
-    models = xmlrpc.client.ServerProxy('{}/xmlrpc/2/object'.format(url))
+@api.route('/fetch-contacts', methods=['GET'])
+@stale.serve_stale
+def fetch_contacts():
+    # Set up the Odoo connection
+    client = get_client()
 
     # Authenticate and get user ID
-    uid = common.authenticate(db, username, password, {})
+    uid = client.uid
     if not uid:
         return jsonify({'error': 'Authentication failed'}), 401
 
+    # How contact images are returned: 'url' (link to /contact-image, the default),
+    # 'thumbnail' (inline image_128), 'full' (inline image_1920) or 'none'
+    image_mode = request.args.get('images', 'url')
+    if image_mode not in ('url', 'thumbnail', 'full', 'none'):
+        return jsonify({'error': 'Invalid images value'}), 400
+
     try:
-        # Fetch contacts
-        contacts = models.execute_kw(db, uid, password,
-            'res.partner', 'search_read',
-            [[]],  # domain, empty list means no filter
-            {'fields': ['name', 'email', 'phone', 'mobile', 'image_1920']})  # fields to fetch
+        # Optional paging (limit, offset or after_id, order) or NDJSON streaming (stream=1)
+        page = pagination.parse_page(request.args, CONTACT_ORDER_FIELDS)
+        # Optional search on name and email (q) and ?fields= projection
+        domain = filters.contact_domain(request.args)
+        contact_fields = filters.parse_fields(request.args, CONTACT_ALLOWED_FIELDS, CONTACT_FIELDS)
+    except (pagination.PaginationError, filters.FilterError) as e:
+        return jsonify({'error': str(e)}), 400
 
-        # Process contact images
-        for contact in contacts:
-            if contact.get('image_1920'):
-                if isinstance(contact['image_1920'], bytes):
-                    # If image is in bytes, encode it to base64
-                    contact['image_1920'] = base64.b64encode(contact['image_1920']).decode('utf-8')
-                elif isinstance(contact['image_1920'], str):
-                    # If image is already a base64 string, no need to encode again
-                    contact['image_1920'] = contact['image_1920']
-                else:
-                    # Handle unexpected data type
-                    contact['image_1920'] = None
-            else:
-                contact['image_1920'] = None
+    try:
+        size = images.clamp_size(request.args.get('size', 128, type=int))
+
+        fields, context = contact_read_options(image_mode, contact_fields)
+        format_page = lambda contacts: format_contacts(contacts, image_mode, size)
+
+        if page is None or not page.stream:
+            # Skip reading and encoding the contacts when the client's copy is current
+            versions = client.execute_kw('res.partner', 'search_read', [domain], {'fields': ['write_date']})
+            response = not_modified(etags.version(versions))
+            if response is not None:
+                return response
+
+        if page is not None and page.stream:
+            batches = pagination.iter_batches(client, 'res.partner', domain, fields, page, context)
+            rows = pagination.ndjson(batches, format_page, log_error)
+            return Response(stream_with_context(rows), mimetype='application/x-ndjson')
 
-        return jsonify(contacts)
+        if page is not None:
+            contacts, headers = pagination.read_page(client, 'res.partner', domain, fields, page, context)
+            return jsonify(format_page(contacts)), 200, headers
+
+        # Fetch contacts
+        kwargs = {'fields': fields}
+        if context:
+            kwargs['context'] = context
+        contacts = client.execute_kw('res.partner', 'search_read', [domain], kwargs)
+
+        return jsonify(format_page(contacts))
 
     except xmlrpc.client.Fault as fault:
         print(f"XML-RPC Fault: {fault}")
@@ -492,57 +929,248 @@ def fetch_contacts():
         print(f"An error occurred: {e}")
         return jsonify({'error': str(e)}), 500
     
-@app.route('/fetch-timesheet', methods=['GET'])
-def fetch_timesheet():
-    global url, username, password
+@api.route('/contact-image/<int:partner_id>', methods=['GET'])
+def contact_image(partner_id):
+    # Set up the Odoo connection
+    client = get_client()
 
-    # Set up XML-RPC connections
-    common = xmlrpc.client.ServerProxy('{}/xmlrpc/2/common'.format(url))
-    models = xmlrpc.client.ServerProxy('{}/xmlrpc/2/object'.format(url))
+    # Authenticate and get user ID
+    uid = client.uid
+    if not uid:
+        return jsonify({'error': 'Authentication failed'}), 401
+
+    try:
+        size = images.clamp_size(request.args.get('size', 128, type=int))
+
+        # A cheap read checks access to the contact and gives the version of its image
+        partners = client.execute_kw('res.partner', 'read', [[partner_id]], {'fields': ['write_date']})
+        if not partners:
+            return jsonify({'error': 'Contact not found'}), 404
+        write_date = partners[0]['write_date']
+
+        etag = images.image_etag(partner_id, write_date, size)
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+
+        cache_key = (client.url, client.db, partner_id, write_date, size)
+        cached = current_app.image_cache.get(*cache_key)
+        if cached:
+            data, mimetype = cached
+        else:
+            # Download the smallest image Odoo stores that is large enough, then resize it
+            field = images.source_field(size)
+            partners = client.execute_kw('res.partner', 'read', [[partner_id]], {'fields': [field]})
+            data = images.decode(partners[0][field]) if partners else None
+            if not data:
+                return jsonify({'error': 'Contact has no image'}), 404
+            data, mimetype = images.resize(data, size)
+            current_app.image_cache.put(data, mimetype, *cache_key)
+
+        response = Response(data, mimetype=mimetype)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, max-age=86400'
+        return response
+
+    except xmlrpc.client.Fault as fault:
+        print(f"XML-RPC Fault: {fault}")
+        return jsonify({'error': str(fault)}), 500
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        return jsonify({'error': str(e)}), 500
+
+# Helper function returning why an item of /add-task/bulk is malformed, None when it is not
+def bulk_task_error(item):
+    if item.get('priority') not in ['0', '1']:
+        return 'Invalid priority value'
+    for field in ('task_name', 'project_name', 'stage_name', 'user_name'):
+        if not isinstance(item.get(field), str):
+            return f'{field} must be a string'
+    if item.get('deadline') is not None and not isinstance(item['deadline'], str):
+        return 'deadline must be a string'
+    return None
+
+@api.route('/add-task/bulk', methods=['POST'])
+def add_task_bulk():
+    # Batch variant of /add-task: takes a list of objects with the same fields,
+    # resolves projects, stages and users with one lookup per model and creates
+    # all valid tasks with a single multi-record create
+    client = get_client()
+
+    try:
+        items = bulk.parse_items(request.get_json(silent=True))
+    except bulk.BulkError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    try:
+        # Each item is checked on its own, so that a malformed one fails alone
+        results = [bulk.failed(index, error) if error else None
+                   for index, error in enumerate(map(bulk_task_error, items))]
+        valid = [item for index, item in enumerate(items) if results[index] is None]
+        project_ids = current_app.reference_cache.ids_by_names(client, 'project.project',
+                                                   {item['project_name'] for item in valid})
+        user_ids = current_app.reference_cache.ids_by_names(client, 'res.users', {item['user_name'] for item in valid})
+        stage_ids = find_many_stage_ids(client, {(item['stage_name'], project_ids[item['project_name']][0])
+                                                 for item in valid if project_ids[item['project_name']]})
+
+        to_create = []
+        for index, item in enumerate(items):
+            if results[index] is not None:
+                continue
+            project_name = item['project_name']
+            stage_name = item['stage_name']
+            user_name = item['user_name']
+            if not project_ids[project_name]:
+                results[index] = bulk.failed(index, f"Project '{project_name}' not found.")
+            elif not stage_ids[(stage_name, project_ids[project_name][0])]:
+                results[index] = bulk.failed(index, f"Stage '{stage_name}' not found in project '{project_name}'.")
+            elif not user_ids[user_name]:
+                results[index] = bulk.failed(index, f"User '{user_name}' not found.")
+            else:
+                to_create.append((index, {
+                    'name': item.get('task_name'),
+                    'project_id': project_ids[project_name][0],
+                    'stage_id': stage_ids[(stage_name, project_ids[project_name][0])][0],
+                    'user_ids': [(6, 0, [user_ids[user_name][0]])],
+                    'priority': item['priority'],
+                    # XML-RPC has no None, Odoo takes False for an empty date
+                    'date_deadline': item.get('deadline') or False,
+                }))
+
+        created = bulk.create_records(client, 'project.task', [values for _, values in to_create])
+        for (index, _), task_id in zip(to_create, created):
+            results[index] = bulk.outcome(index, task_id, id=task_id)
+        return jsonify(bulk.summary(results)), 200
+
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+# Helper function returning what /fetch-timesheet depends on, for its ETag
+def timesheet_version(client, uid):
+    tasks = client.execute_kw('project.task', 'search_read', [[['user_ids', 'in', [uid]]]], {'fields': ['write_date']})
+    lines = client.execute_kw('account.analytic.line', 'search_read',
+                              [[['task_id', 'in', [task['id'] for task in tasks]]]], {'fields': ['write_date']})
+    return etags.version(tasks), etags.version(lines)
+
+# Helper function returning the user's tasks, each with its timesheet lines
+def get_timesheet_tasks(client, uid):
+    # Fetch tasks assigned to the authenticated user
+    tasks = client.execute_kw('project.task', 'search_read',
+        [[['user_ids', 'in', [uid]]]],  # Filter tasks by user ID
+        {'fields': ['id', 'name']})  # Fields to fetch
+
+    # Fetch the timesheet lines of all tasks in one call and group them by task
+    timesheet_lines = client.execute_kw('account.analytic.line', 'search_read',
+        [[['task_id', 'in', [task['id'] for task in tasks]]]],  # Filter timesheet lines by task IDs
+        {'fields': ['name', 'unit_amount', 'date', 'account_id', 'employee_id', 'task_id']})  # Fields to fetch
+
+    lines_by_task = {}
+    for line in timesheet_lines:
+        lines_by_task.setdefault(line.pop('task_id')[0], []).append(line)
+
+    for task in tasks:
+        task['timesheet_lines'] = lines_by_task.get(task['id'], [])
+    return tasks
+
+@api.route('/fetch-timesheet', methods=['GET'])
+@stale.serve_stale
+def fetch_timesheet():
+    # Set up the Odoo connection
+    client = get_client()
 
     # Authenticate and get user ID
-    uid = common.authenticate(db, username, password, {})
+    uid = client.uid
     if not uid:
         return jsonify({'error': 'Authentication failed'}), 401
 
     try:
-        # Fetch tasks assigned to the authenticated user
-        tasks = models.execute_kw(db, uid, password,
-            'project.task', 'search_read',
-            [[['user_ids', 'in', [uid]]]],  # Filter tasks by user ID
-            {'fields': ['id', 'name']})  # Fields to fetch
-
-        # Fetch timesheet lines for each task
-        tasks_with_timesheets = []
-        for task in tasks:
-            task_id = task['id']
-            timesheet_lines = models.execute_kw(db, uid, password,
-                'account.analytic.line', 'search_read',
-                [[['task_id', '=', task_id]]],  # Filter timesheet lines by task ID
-                {'fields': ['name', 'unit_amount', 'date', 'account_id', 'employee_id']})  # Fields to fetch
-            
-            task['timesheet_lines'] = timesheet_lines
-            tasks_with_timesheets.append(task)
-        
-        # Print for debugging
-        print("tasks_with_timesheets :",tasks_with_timesheets)
-        print ("task :",task)
+        # Skip reading the tasks and their lines when the client's copy is current
+        response = not_modified(*timesheet_version(client, uid))
+        if response is not None:
+            return response
 
-        return jsonify(tasks_with_timesheets)
+        return jsonify(get_timesheet_tasks(client, uid))
     except Exception as e:
         print(f"An error occurred: {e}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/add-timesheet-line', methods=['POST'])
-def add_timesheet_line():
-    global url, username, password
+# Groupings of /timesheet-report and the read_group specification of each
+TIMESHEET_GROUPS = {
+    'task': 'task_id',
+    'project': 'project_id',
+    'employee': 'employee_id',
+    'day': 'date:day',
+    'week': 'date:week',
+    'month': 'date:month',
+}
+TIMESHEET_LINE_ORDER_FIELDS = {'id', 'date', 'unit_amount', 'task_id', 'project_id', 'employee_id'}
+# Raw lines returned per page by /timesheet-report?lines=1 unless ?limit= says otherwise
+TIMESHEET_LINES_PAGE_SIZE = 200
+
+@api.route('/timesheet-report', methods=['GET'])
+@stale.serve_stale
+def timesheet_report():
+    # Hours of the timesheet lines on the user's tasks, summed by Odoo with
+    # read_group over the asked groupings (task, project, employee, day, week,
+    # month), optionally with one page of the raw lines
+    try:
+        group_by = filters.parse_group_by(request.args, TIMESHEET_GROUPS, ['task'])
+        filter_domain = filters.timesheet_domain(request.args)
+        with_lines = request.args.get('lines') in ('1', 'true')
+        page = pagination.parse_page(request.args, TIMESHEET_LINE_ORDER_FIELDS) if with_lines else None
+    except (pagination.PaginationError, filters.FilterError) as e:
+        return jsonify({'error': str(e)}), 400
+    if page is not None and page.stream:
+        return jsonify({'error': 'stream is not supported here'}), 400
+
+    client = get_client()
+    uid = client.uid
+    if not uid:
+        return jsonify({'error': 'Authentication failed'}), 401
+
+    try:
+        task_ids = client.execute_kw('project.task', 'search', [[['user_ids', 'in', [uid]]]])
+        domain = [['task_id', 'in', task_ids]] + filter_domain
+        specs = [TIMESHEET_GROUPS[group] for group in group_by]
+
+        calls = [lambda: client.execute_kw('account.analytic.line', 'read_group',
+                                           [domain, ['unit_amount:sum'], specs], {'lazy': False})]
+        if with_lines:
+            page = page or pagination.Page(TIMESHEET_LINES_PAGE_SIZE, 0, None, None, False)
+            calls.append(lambda: pagination.read_page(client, 'account.analytic.line', domain,
+                                                      ['name', 'unit_amount', 'date', 'task_id', 'project_id', 'employee_id'],
+                                                      page))
+        results = run_concurrently(client.url, calls)
+
+        groups = []
+        for row in results[0]:
+            group = {name: row[spec] for name, spec in zip(group_by, specs)}
+            group['hours'] = row['unit_amount']
+            group['count'] = row['__count']
+            groups.append(group)
+
+        report = {
+            'group_by': group_by,
+            'total_hours': sum(group['hours'] for group in groups),
+            'count': sum(group['count'] for group in groups),
+            'groups': groups,
+        }
+        headers = {}
+        if with_lines:
+            report['lines'], headers = results[1]
+        return jsonify(report), 200, headers
+    except Exception as e:
+        log_error(f"Error building the timesheet report: {e}")
+        return jsonify({'error': str(e)}), 500
 
-    # Set up XML-RPC connections
-    common = xmlrpc.client.ServerProxy('{}/xmlrpc/2/common'.format(url))
-    models = xmlrpc.client.ServerProxy('{}/xmlrpc/2/object'.format(url))
+@api.route('/add-timesheet-line', methods=['POST'])
+def add_timesheet_line():
+    # Set up the Odoo connection
+    client = get_client()
 
     # Authenticate and get user ID
-    uid = common.authenticate(db, username, password, {})
+    uid = client.uid
     if not uid:
         return jsonify({'error': 'Authentication failed'}), 401
 
@@ -553,19 +1181,258 @@ def add_timesheet_line():
     date = data.get('date')
 
     try:
+        values = {
+            'task_id': task_id,
+            'unit_amount': unit_amount,
+            'name': name,
+            'date': date,
+        }
+        if wants_async():
+            return queue_write('account.analytic.line', 'create', values)
+
         # Create a new timesheet line
-        models.execute_kw(db, uid, password,
-            'account.analytic.line', 'create',
-            [{
-                'task_id': task_id,
-                'unit_amount': unit_amount,
-                'name': name,
-                'date': date,
-            }])
+        client.execute_kw('account.analytic.line', 'create', [values])
         
         return jsonify({'status': 'Timesheet line added successfully'}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@api.route('/add-timesheet-line/bulk', methods=['POST'])
+def add_timesheet_line_bulk():
+    # Batch variant of /add-timesheet-line creating every line with one multi-record create
+    client = get_client()
+
+    try:
+        items = bulk.parse_items(request.get_json(silent=True))
+    except bulk.BulkError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        created = bulk.create_records(client, 'account.analytic.line', [{
+            'task_id': item.get('task_id'),
+            'unit_amount': item.get('unit_amount'),
+            'name': item.get('name'),
+            'date': item.get('date'),
+        } for item in items])
+        results = [bulk.outcome(index, line_id, id=line_id) for index, line_id in enumerate(created)]
+        return jsonify(bulk.summary(results)), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Helper function returning the tasks of the user as /fetch-tasks does
+def get_tasks(client, uid):
+    tasks = client.execute_kw('project.task', 'search_read', [[['user_ids', 'in', [uid]]]], {'fields': TASK_FIELDS})
+    return enrich_tasks(client, tasks)
+
+# Helper function returning the contacts as /fetch-contacts does, with image URLs
+def get_contacts(client):
+    fields, context = contact_read_options('url')
+    contacts = client.execute_kw('res.partner', 'search_read', [[]], {'fields': fields, 'context': context})
+    return format_contacts(contacts, 'url')
+
+# Sections of /bootstrap, each giving the body of the route it stands for
+BOOTSTRAP_SECTIONS = {
+    'apps': lambda client, uid: {'active_apps': get_active_apps(client)},
+    'isadmin': lambda client, uid: {'is_admin': bool(user_is_admin(client, uid))},
+    'tasks': get_tasks,
+    'new_task': get_new_task_data,
+    'contacts': lambda client, uid: get_contacts(client),
+    'timesheet': get_timesheet_tasks,
+}
+
+@api.route('/bootstrap', methods=['GET'])
+def bootstrap():
+    # Everything a screen needs in one round trip: ?sections=apps,isadmin,tasks
+    # logs in once and loads the sections concurrently. A failing section is
+    # reported in errors without failing the others.
+    sections = [section.strip() for section in request.args.get('sections', 'apps,isadmin').split(',') if section.strip()]
+    unknown = [section for section in sections if section not in BOOTSTRAP_SECTIONS]
+    if unknown or not sections:
+        return jsonify({'error': f"sections must be a comma separated list of: {', '.join(BOOTSTRAP_SECTIONS)}"}), 400
+    sections = list(dict.fromkeys(sections))
+
+    url = g.session['url']
+    try:
+        client = get_client()
+        uid = client.uid
+        if not uid:
+            return jsonify({'error': 'Authentication failed'}), 401
+    except Exception as e:
+        log_error(f"Error connecting to {url}/xmlrpc/2/common: {e}")
+        return jsonify({'error': str(e)}), 500
+
+    def load(section):
+        try:
+            return BOOTSTRAP_SECTIONS[section](client, uid), None
+        except Exception as e:
+            log_error(f"Error loading the {section} section: {e}")
+            return None, str(e)
+
+    results = run_concurrently(client.url, [lambda section=section: load(section) for section in sections])
+    data = {'uid': uid, 'sections': {}, 'errors': {}}
+    for section, (value, error) in zip(sections, results):
+        if error is None:
+            data['sections'][section] = value
+        else:
+            data['errors'][section] = error
+    return jsonify(data), 200
+
+@api.route('/events', methods=['GET'])
+def stream_events():
+    # Server-Sent Events stream of the changes to the user's tasks ('tasks')
+    # and to their activities ('activities'), so clients refetch only when
+    # something changed. EventSource clients pass the session token as ?token=.
+    client = get_client()
+    if not client.uid:
+        return jsonify({'error': 'Authentication failed'}), 401
+
+    # The stream outlives the request context, so the hub is looked up now
+    event_hub = current_app.event_hub
+    # Subscribed before answering, so that the clients over the limit get a
+    # 503 and keep polling instead of holding a request thread
+    try:
+        subscription = event_hub.subscribe(client)
+    except events.StreamLimitError as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': str(e.retry_after)}
+
+    response = Response(subscription.stream(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Also when the client went away before the stream started
+    response.call_on_close(lambda: event_hub.unsubscribe(subscription))
+    return response
+
+@api.route('/operations/<operation_id>', methods=['GET'])
+def operation_status(operation_id):
+    # Status of a write queued with Prefer: respond-async: queued, done or failed
+    operation = current_app.write_queue.status(operation_id, g.session)
+    if operation is None:
+        return jsonify({'error': 'Operation not found'}), 404
+    return jsonify(operation), 200
+
+@api.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@api.route('/cache-stats', methods=['GET'])
+def cache_stats():
+    return jsonify(current_app.reference_cache.stats()), 200
+
+@api.route('/backend-status', methods=['GET'])
+def backend_status():
+    # Circuit breaker of the session's Odoo backend, its Odoo calls running and
+    # waiting, the last good responses kept, the queued writes and the user's
+    # replica. Other backends and users are not shown: they are other tenants.
+    session = g.session
+    backend = resilience.backend_of(session['url'])
+    replica_key = (session['url'], session['db'], session['username'])
+    return jsonify({'breakers': resilience.stats(backend), 'admission': admission.stats(backend),
+                    'stale_responses': current_app.stale_responses.stats(),
+                    'write_queue': current_app.write_queue.stats(),
+                    'replica': current_app.replica.stats(replica_key) if current_app.replica is not None else None}), 200
+
+@api.route('/cache/invalidate', methods=['POST'])
+def invalidate_cache():
+    # Drop the cached reference data of the session's database, optionally for one model
+    model = (request.get_json(silent=True) or {}).get('model')
+    current_app.reference_cache.invalidate(g.session['url'], g.session['db'], model)
+    return jsonify({'success': True}), 200
+
+SYNC_MODELS = ('tasks', 'contacts', 'timesheets')
+# Id lists kept for /sync, one per session, model and watermark handed out
+SYNC_SNAPSHOT_MAX_ENTRIES = int(os.environ.get('SYNC_SNAPSHOT_MAX_ENTRIES', 4096))
+TIMESHEET_FIELDS = ['name', 'unit_amount', 'date', 'account_id', 'employee_id', 'task_id']
+
+@api.route('/sync', methods=['GET'])
+def sync():
+    # Incremental replication: returns the records written since the client's
+    # watermark, the ids deleted (or moved out of scope) since then, and a new
+    # watermark to send back as ?since= on the next call. Records written at
+    # exactly the watermark are sent again, so clients should upsert by id.
+    client = get_client()
+
+    uid = client.uid
+    if not uid:
+        return jsonify({'error': 'Authentication failed'}), 401
+
+    models = [model for model in request.args.get('models', ','.join(SYNC_MODELS)).split(',') if model]
+    if not models or any(model not in SYNC_MODELS for model in models):
+        return jsonify({'error': f'models must be a subset of {", ".join(SYNC_MODELS)}'}), 400
+
+    try:
+        since = watermarks.parse(request.args.get('since'), models)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        task_domain = [['user_ids', 'in', [uid]]]
+        contact_domain = []
+
+        def changed(domain, model):
+            return domain + [['write_date', '>=', since[model]]] if since.get(model) else domain
+
+        # Ids currently in scope, used to detect deletions; timesheets follow the user's tasks
+        id_calls = [('project.task', 'search', [task_domain])]
+        if 'contacts' in models:
+            id_calls.append(('res.partner', 'search', [contact_domain]))
+        id_results = client.execute_many(id_calls)
+        task_ids = id_results[0]
+        contact_ids = id_results[1] if 'contacts' in models else []
+        timesheet_domain = [['task_id', 'in', task_ids]]
+
+        contact_fields, contact_context = contact_read_options('url')
+        calls = {
+            'tasks': ('project.task', 'search_read', [changed(task_domain, 'tasks')],
+                      {'fields': TASK_FIELDS + ['write_date']}),
+            'contacts': ('res.partner', 'search_read', [changed(contact_domain, 'contacts')],
+                         {'fields': contact_fields, 'context': contact_context}),
+            'timesheets': ('account.analytic.line', 'search_read', [changed(timesheet_domain, 'timesheets')],
+                           {'fields': TIMESHEET_FIELDS + ['write_date']}),
+        }
+        if 'timesheets' in models:
+            calls['timesheet_ids'] = ('account.analytic.line', 'search', [timesheet_domain])
+
+        names = [name for name in calls if name in models or name == 'timesheet_ids']
+        results = dict(zip(names, client.execute_many([calls[name] for name in names])))
+
+        current_ids = {'tasks': task_ids, 'contacts': contact_ids, 'timesheets': results.get('timesheet_ids', [])}
+        new_since = {}
+        response = {}
+
+        for model in models:
+            updated = results[model]
+            new_since[model] = watermarks.latest(updated, since[model])
+
+            if model == 'tasks':
+                enrich_tasks(client, updated)
+            elif model == 'contacts':
+                # The image url/etag replace write_date, so read the watermark first
+                format_contacts(updated, 'url')
+
+            entry = {'updated': updated}
+            if since[model] is None:
+                entry['deleted'] = []
+            else:
+                previous = current_app.sync_snapshots.get((g.token, model, since[model]), 'sync')
+                if previous is not None:
+                    entry['deleted'] = sorted(set(previous) - set(current_ids[model]))
+                else:
+                    # No record of what the client holds: send the full id list to prune against
+                    entry['ids'] = current_ids[model]
+            response[model] = entry
+            # The ids the client holds once it applied this response
+            current_app.sync_snapshots.set((g.token, model, new_since[model]), current_ids[model],
+                                            current_app.config['SESSION_TTL'])
+
+        response['watermark'] = watermarks.encode(new_since)
+        return jsonify(response), 200
+
+    except xmlrpc.client.Fault as fault:
+        log_error(f"XML-RPC Fault during sync: {fault}")
+        return jsonify({'error': str(fault)}), 500
+    except Exception as e:
+        log_error(f"Error during sync: {e}")
+        return jsonify({'error': str(e)}), 500
+
 if __name__ == '__main__':
-    app.run(debug=True)
+    # Development server only, see wsgi.py and gunicorn.conf.py for production
+    create_app().run(debug=os.environ.get('FLASK_DEBUG', '1') == '1', threaded=True)
@@ -0,0 +1,158 @@
+import json
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+import utils
+
+# Maximum number of sessions kept by the in-process store before the least
+# recently used ones are evicted
+SESSION_MAX = int(os.environ.get('SESSION_MAX', 1000))
+# Sessions unused for this many seconds expire
+SESSION_TTL = int(os.environ.get('SESSION_TTL', 7 * 24 * 3600))
+# When set, sessions are kept in Redis so several workers can share them
+SESSION_REDIS_URL = os.environ.get('SESSION_REDIS_URL', '')
+# When set (and Redis is not), sessions are kept in this SQLite file, shared
+# by the workers of one host
+SESSION_SQLITE_PATH = os.environ.get('SESSION_SQLITE_PATH', '')
+
+
+class MemoryBackend:
+    # In-process LRU store, private to one worker process
+
+    def __init__(self, max_size=SESSION_MAX, ttl=SESSION_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        with self._lock:
+            entry = self._data.get(token)
+            if entry is None:
+                return None
+            data, last_used = entry
+            now = time.monotonic()
+            if now - last_used > self.ttl:
+                del self._data[token]
+                return None
+            self._data[token] = (data, now)
+            self._data.move_to_end(token)
+            return dict(data)
+
+    def set(self, token, data):
+        with self._lock:
+            self._data[token] = (dict(data), time.monotonic())
+            self._data.move_to_end(token)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, token):
+        with self._lock:
+            self._data.pop(token, None)
+
+
+class RedisBackend:
+    # Shared store for multi-worker deployments, needs the redis package
+
+    def __init__(self, redis_url=SESSION_REDIS_URL, ttl=SESSION_TTL, prefix='odoo-proxy:session:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('SESSION_REDIS_URL is set but the redis package is not installed')
+        self.ttl = ttl
+        self.prefix = prefix
+        self._redis = redis.Redis.from_url(redis_url)
+
+    def get(self, token):
+        key = self.prefix + token
+        pipeline = self._redis.pipeline()
+        pipeline.get(key)
+        pipeline.expire(key, self.ttl)
+        raw, _ = pipeline.execute()
+        return json.loads(raw) if raw else None
+
+    def set(self, token, data):
+        self._redis.set(self.prefix + token, json.dumps(data), ex=self.ttl)
+
+    def delete(self, token):
+        self._redis.delete(self.prefix + token)
+
+
+class SqliteBackend:
+    # Shared store for the worker processes of a single host
+
+    # last_used is only refreshed when older than this, to spare writes
+    TOUCH_INTERVAL = 60
+
+    def __init__(self, path=SESSION_SQLITE_PATH, ttl=SESSION_TTL, table='sessions'):
+        self.path = path
+        self.ttl = ttl
+        self.table = table
+        self._local = threading.local()
+        self._connection().execute(f'CREATE TABLE IF NOT EXISTS {table} '
+                                   '(token TEXT PRIMARY KEY, data TEXT NOT NULL, last_used REAL NOT NULL)')
+
+    def _connection(self):
+        return utils.sqlite_connection(self._local, self.path)
+
+    def get(self, token):
+        connection = self._connection()
+        row = connection.execute(f'SELECT data, last_used FROM {self.table} WHERE token = ?', (token,)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if now - row[1] > self.ttl:
+            self.delete(token)
+            return None
+        if now - row[1] > self.TOUCH_INTERVAL:
+            connection.execute(f'UPDATE {self.table} SET last_used = ? WHERE token = ?', (now, token))
+        return json.loads(row[0])
+
+    def set(self, token, data):
+        now = time.time()
+        connection = self._connection()
+        connection.execute(f'INSERT OR REPLACE INTO {self.table} (token, data, last_used) VALUES (?, ?, ?)',
+                           (token, json.dumps(data), now))
+        connection.execute(f'DELETE FROM {self.table} WHERE last_used < ?', (now - self.ttl,))
+
+    def delete(self, token):
+        self._connection().execute(f'DELETE FROM {self.table} WHERE token = ?', (token,))
+
+
+def default_backend(redis_url=SESSION_REDIS_URL, sqlite_path=SESSION_SQLITE_PATH, max_size=SESSION_MAX,
+                    ttl=SESSION_TTL):
+    if redis_url:
+        return RedisBackend(redis_url, ttl)
+    if sqlite_path:
+        return SqliteBackend(sqlite_path, ttl)
+    return MemoryBackend(max_size, ttl)
+
+
+class SessionStore:
+    # Per-client Odoo credentials (url, db, username, password) and cached uid,
+    # addressed by the token returned from /store-data
+
+    def __init__(self, backend=None):
+        self.backend = backend or default_backend()
+
+    def create(self, data):
+        token = secrets.token_urlsafe(32)
+        self.backend.set(token, data)
+        return token
+
+    def get(self, token):
+        if not token:
+            return None
+        return self.backend.get(token)
+
+    def update(self, token, **values):
+        data = self.backend.get(token)
+        if data is not None:
+            data.update(values)
+            self.backend.set(token, data)
+
+    def delete(self, token):
+        self.backend.delete(token)
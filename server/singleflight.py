@@ -0,0 +1,60 @@
+import copy
+import threading
+
+
+class _Flight:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.followers = 0
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    # Runs one call per key at a time: callers asking for a key already in
+    # flight wait for that call and share its result (or its exception)
+    # instead of running their own. Nothing is kept once the call returns.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def do(self, key, function):
+        # Returns (result, shared), shared being True for the waiting callers
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                flight.followers += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            # Each caller gets its own copy, the routes modify the records they read
+            return copy.deepcopy(flight.result), True
+
+        try:
+            flight.result = function()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            flight.done.set()
+        return (copy.deepcopy(flight.result) if flight.followers else flight.result), False
+
+    def forget(self, match):
+        # Later callers of the keys matching match(key) start a new call
+        # instead of joining the one in flight, e.g. after a write
+        with self._lock:
+            for key in [key for key in self._flights if match(key)]:
+                del self._flights[key]
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._flights)
@@ -0,0 +1,198 @@
+import contextvars
+import functools
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from flask import current_app, g, request
+
+import admission
+import metrics
+import resilience
+import utils
+
+# Seconds a read endpoint waits for Odoo before answering with its last good
+# response while the fresh one is computed in the background; 0 disables
+# stale responses
+STALE_DEADLINE = float(os.environ.get('STALE_DEADLINE', 3))
+# Last good responses older than this (in seconds) are not served any more
+STALE_MAX_AGE = float(os.environ.get('STALE_MAX_AGE', 24 * 3600))
+# Memory bound of the last good responses, in bytes
+STALE_MAX_BYTES = int(os.environ.get('STALE_MAX_BYTES', 64 * 1024 * 1024))
+# Threads computing the responses that did not meet the deadline, for each
+# admission priority, so that the bulk reads do not hold back the others. As
+# many as the request threads of gunicorn.conf.py by default: when they are
+# all busy, the view runs on the request thread instead, without a deadline
+REFRESH_WORKERS = int(os.environ.get('STALE_REFRESH_WORKERS', os.environ.get('GUNICORN_THREADS', 32)))
+
+class ResponseStore:
+    # Last successful response of each read endpoint, per user and query string,
+    # and the refresh in progress for it, computed by the threads of the store
+
+    def __init__(self, max_bytes=STALE_MAX_BYTES, max_age=STALE_MAX_AGE, deadline=STALE_DEADLINE,
+                 workers=REFRESH_WORKERS):
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.deadline = deadline
+        self.workers = workers
+        self.size = 0
+        self._executors = {priority: ThreadPoolExecutor(max_workers=workers,
+                                                        thread_name_prefix=f'stale-refresh-{priority}')
+                           for priority in admission.PRIORITIES}
+        self._entries = OrderedDict()
+        self._refreshes = {}
+        self._busy = dict.fromkeys(admission.PRIORITIES, 0)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        # (body, mimetype, stored_at) or None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry[2] > self.max_age:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, body, mimetype):
+        with self._lock:
+            self._remove(key)
+            if len(body) > self.max_bytes:
+                return
+            self._entries[key] = (body, mimetype, time.time())
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[0])
+
+    def refresh(self, key, compute):
+        # Future of the refresh of key, started unless one is already running,
+        # or None when all the refresh threads of the priority are busy
+        with self._lock:
+            future = self._refreshes.get(key)
+            if future is not None:
+                return future
+            priority = admission.priority()
+            if self._busy[priority] >= self.workers:
+                return None
+            self._busy[priority] += 1
+            future = self._refreshes[key] = self._executors[priority].submit(compute)
+        # Outside of the lock: the callback runs right away when the refresh
+        # already finished, and takes the lock
+        future.add_done_callback(lambda _: self._end_refresh(key, future, priority))
+        return future
+
+    def _end_refresh(self, key, future, priority):
+        with self._lock:
+            self._busy[priority] -= 1
+            if self._refreshes.get(key) is future:
+                del self._refreshes[key]
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self.size, 'refreshing': len(self._refreshes)}
+
+    def shutdown(self, wait=True):
+        # Wait for the refreshes in flight to finish, then stop the threads
+        for executor in self._executors.values():
+            executor.shutdown(wait=wait)
+
+
+def _remember(store, key, rv):
+    # Keep the successful, complete responses of the view
+    response = current_app.make_response(rv)
+    if response.status_code == 200 and not response.is_streamed:
+        store.set(key, response.get_data(), response.mimetype)
+    return response
+
+
+def _stale_response(entry, reason):
+    body, mimetype, stored_at = entry
+    response = current_app.response_class(body, mimetype=mimetype)
+    # Age tells how old the data is; Warning 110 marks it as not revalidated
+    response.headers['Age'] = str(int(time.time() - stored_at))
+    response.headers['Warning'] = '110 - "Response is Stale"'
+    response.headers['X-Stale-Reason'] = reason
+    metrics.STALE_RESPONSES.inc(request.url_rule.rule if request.url_rule else request.path, reason)
+    return response
+
+
+def _unavailable_response(rv):
+    # Without a last good response, an open circuit answers 503 right away
+    response = current_app.make_response(rv)
+    if response.status_code >= 500 and not resilience.is_available(g.session['url']):
+        retry_after = resilience.breaker(resilience.backend_of(g.session['url'])).retry_after()
+        response.status_code = 503
+        response.headers['Retry-After'] = str(max(int(retry_after), 1))
+    return response
+
+
+def serve_stale(view):
+    # Read endpoints: when Odoo is down or slower than the deadline, answer
+    # with the last good response of the same user and query, marked with the
+    # Age and Warning headers, and let the fresh response be computed in the
+    # background for the next request
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        store = current_app.stale_responses
+        if store.deadline <= 0 or request.args.get('stream'):
+            return view(*args, **kwargs)
+        session = g.session
+        # The password is part of the key, as for the coalesced reads: a response
+        # is only served again to the credentials it was computed with
+        key = (session['url'], session['db'], session['username'], utils.digest(session['password']),
+               request.full_path)
+        # Nor to a session whose login Odoo never accepted
+        entry = store.get(key) if session.get('uid') else None
+        if entry is None:
+            return _unavailable_response(_remember(store, key, view(*args, **kwargs)))
+
+        # The view runs in a copy of this request, with the same g, so that it
+        # can finish after this request was answered
+        app = current_app._get_current_object()
+        environ = request.environ
+        values = dict(g.__dict__)
+        context = contextvars.copy_context()
+
+        def compute():
+            with app.request_context(environ):
+                g.__dict__.update(values)
+                response = _remember(store, key, view(*args, **kwargs))
+                return response, dict(g.__dict__)
+
+        # A 304 only answers the requests with the same If-None-Match
+        refresh_key = key + (request.headers.get('If-None-Match'),)
+        if not resilience.is_available(session['url']):
+            store.refresh(refresh_key, lambda: context.run(compute))
+            return _stale_response(entry, 'unavailable')
+        future = store.refresh(refresh_key, lambda: context.run(compute))
+        if future is None:
+            # No refresh thread free: this request waits for Odoo itself
+            try:
+                response = _remember(store, key, view(*args, **kwargs))
+            except Exception:
+                return _stale_response(entry, 'error')
+            return _stale_response(entry, 'error') if response.status_code >= 500 else response
+        try:
+            response, values = future.result(timeout=store.deadline)
+        except TimeoutError:
+            return _stale_response(entry, 'timeout')
+        except Exception:
+            return _stale_response(entry, 'error')
+        if response.status_code >= 500:
+            return _stale_response(entry, 'error')
+        # ETag, client... set by the view for the after_request hooks
+        g.__dict__.update(values)
+        # Requests sharing the refresh each get their own response to finalize
+        return current_app.response_class(response.get_data(), status=response.status_code,
+                                          headers=response.headers.copy())
+
+    return wrapper
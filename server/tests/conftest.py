@@ -0,0 +1,45 @@
+# Fixtures of the tests: the synthetic Odoo of mock_odoo.py on a free port and
+# the proxy app, with a client logged in to it as admin. Run from server/:
+#   python -m pytest -q
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mock_odoo
+import server
+
+
+@pytest.fixture
+def odoo():
+    odoo = mock_odoo.MockOdoo(tasks=40, projects=4, contacts=20)
+    odoo_server = mock_odoo.serve(odoo, port=0)
+    odoo.url = f'http://127.0.0.1:{odoo_server.server_address[1]}'
+    yield odoo
+    odoo_server.shutdown()
+    odoo_server.server_close()
+
+
+@pytest.fixture
+def app(odoo):
+    app = server.create_app()
+    yield app
+    server.shutdown(app)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def login(client, odoo, username):
+    response = client.post('/store-data', json={'url': odoo.url, 'db': 'test', 'username': username,
+                                                'password': username})
+    return {'X-Session-Token': response.get_json()['token']}
+
+
+@pytest.fixture
+def headers(client, odoo):
+    return login(client, odoo, 'admin')
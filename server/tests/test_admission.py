@@ -0,0 +1,110 @@
+import threading
+import time
+
+import pytest
+
+import admission
+import resilience
+
+BACKEND = 'http://odoo.example:8069'
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def queued(scheduler):
+    return sum(scheduler.stats(BACKEND)['backends'][BACKEND]['queued'].values())
+
+
+def in_flight(scheduler):
+    return scheduler.stats(BACKEND)['backends'][BACKEND]['in_flight']
+
+
+def test_waiting_calls_go_in_priority_order():
+    scheduler = admission.Scheduler(max_in_flight=1)
+    holder = scheduler.acquire(BACKEND, admission.Scope('holder'))
+    order = []
+
+    def call(priority):
+        user = scheduler.acquire(BACKEND, admission.Scope(priority, priority))
+        order.append(priority)
+        scheduler.release(BACKEND, user, priority)
+
+    threads = []
+    for priority in (admission.BULK, admission.READ, admission.WRITE):
+        threads.append(threading.Thread(target=call, args=(priority,)))
+        threads[-1].start()
+        wait_until(lambda: queued(scheduler) == len(threads))
+    scheduler.release(BACKEND, holder, admission.READ)
+    for thread in threads:
+        thread.join()
+    assert order == [admission.WRITE, admission.READ, admission.BULK]
+
+
+def test_bulk_reads_leave_slots_to_the_others():
+    scheduler = admission.Scheduler(max_in_flight=2, bulk_in_flight=1, queue_timeout=0.2)
+    bulk = scheduler.acquire(BACKEND, admission.Scope('a', admission.BULK))
+    # The second bulk read waits for the first one, the read goes right away
+    with pytest.raises(admission.RejectedError) as rejected:
+        scheduler.acquire(BACKEND, admission.Scope('b', admission.BULK))
+    assert (rejected.value.reason, rejected.value.status) == ('timeout', 503)
+    read = scheduler.acquire(BACKEND, admission.Scope('b', admission.READ))
+    assert in_flight(scheduler) == 2
+    scheduler.release(BACKEND, read, admission.READ)
+    scheduler.release(BACKEND, bulk, admission.BULK)
+
+
+def test_a_user_over_their_rate_gets_429(monkeypatch):
+    monkeypatch.setattr(admission, 'USER_RATE', 1)
+    monkeypatch.setattr(admission, 'USER_BURST', 1)
+    scheduler = admission.Scheduler(queue_timeout=0.5)
+    scope = admission.Scope('busy')
+    scheduler.release(BACKEND, scheduler.acquire(BACKEND, scope), admission.READ)
+    with pytest.raises(admission.RejectedError) as rejected:
+        scheduler.acquire(BACKEND, scope)
+    assert (rejected.value.reason, rejected.value.status) == ('user', 429)
+    assert scope.rejected is rejected.value
+    # Another user is not held back
+    scheduler.release(BACKEND, scheduler.acquire(BACKEND, admission.Scope('other')), admission.READ)
+
+
+def test_a_full_queue_gets_503():
+    scheduler = admission.Scheduler(max_in_flight=1, max_queued=0)
+    holder = scheduler.acquire(BACKEND, admission.Scope('a'))
+    with pytest.raises(admission.RejectedError) as rejected:
+        scheduler.acquire(BACKEND, admission.Scope('b'))
+    assert (rejected.value.reason, rejected.value.status) == ('queue_full', 503)
+    scheduler.release(BACKEND, holder, admission.READ)
+
+
+def test_rejected_calls_give_back_their_place():
+    scheduler = admission.Scheduler(max_in_flight=1, queue_timeout=0.1)
+    holder = scheduler.acquire(BACKEND, admission.Scope('a'))
+    for _ in range(3):
+        with pytest.raises(admission.RejectedError):
+            scheduler.acquire(BACKEND, admission.Scope('b'))
+    assert (queued(scheduler), in_flight(scheduler)) == (0, 1)
+    scheduler.release(BACKEND, holder, admission.READ)
+    assert in_flight(scheduler) == 0
+    # The next call goes right away
+    started = time.monotonic()
+    scheduler.release(BACKEND, scheduler.acquire(BACKEND, admission.Scope('b')), admission.READ)
+    assert time.monotonic() - started < 0.1
+
+
+def test_overloaded_requests_answer_503_with_retry_after(monkeypatch, client, headers, odoo):
+    scheduler = admission.Scheduler(max_in_flight=1, max_queued=0)
+    monkeypatch.setattr(admission, '_scheduler', scheduler)
+    backend = resilience.backend_of(odoo.url)
+    holder = scheduler.acquire(backend, admission.Scope('other'))
+    try:
+        response = client.get('/fetch-contacts', headers=headers)
+    finally:
+        scheduler.release(backend, holder, admission.READ)
+    assert response.status_code == 503
+    assert int(response.headers['Retry-After']) >= 1
+    assert client.get('/fetch-contacts', headers=headers).status_code == 200
@@ -0,0 +1,29 @@
+import server
+from conftest import login
+
+
+def test_settings_come_from_the_config(odoo):
+    app = server.create_app({'STALE_DEADLINE': 0, 'ODOO_MAX_CONCURRENCY': 2, 'WRITE_QUEUE': False})
+    try:
+        assert app.stale_responses.deadline == 0
+        assert app.gateway.max_concurrency == 2
+        client = app.test_client()
+        response = client.post('/update-stage', headers=dict(login(client, odoo, 'admin'), Prefer='respond-async'),
+                               json={'task_id': 1, 'new_stage_name': 'Done'})
+        # Written right away, not queued
+        assert response.status_code == 200
+    finally:
+        server.shutdown(app)
+
+
+def test_an_app_created_after_another_one_shut_down_can_fan_out(odoo):
+    server.shutdown(server.create_app())
+    app = server.create_app()
+    try:
+        client = app.test_client()
+        # /fetch-new-task loads the projects and users side by side
+        response = client.get('/fetch-new-task', headers=login(client, odoo, 'admin'))
+        assert 'error' not in response.get_json()
+        assert response.get_json()['projects']
+    finally:
+        server.shutdown(app)
@@ -0,0 +1,107 @@
+import xmlrpc.client
+
+import bulk
+
+
+class FakeClient:
+    # Client whose calls fail with the error given for a value, e.g. a name
+
+    def __init__(self, errors):
+        self.errors = errors
+        self.calls = []
+
+    def execute_kw(self, model, method, args):
+        self.calls.append((method, args))
+        values = args[0] if method == 'create' else args[1]
+        for record_values in values if isinstance(values, list) else [values]:
+            error = self.errors.get(record_values.get('name'))
+            if error is not None:
+                raise error
+        if method == 'write':
+            return True
+        return list(range(1, len(values) + 1)) if isinstance(values, list) else 1
+
+
+def test_create_records_fails_only_the_faulty_records():
+    client = FakeClient({'fault': xmlrpc.client.Fault(2, 'rejected'), 'none': TypeError('cannot marshal None')})
+    values = [{'name': 'a'}, {'name': 'fault'}, {'name': 'none'}, {'name': 'b'}]
+    results = bulk.create_records(client, 'project.task', values)
+    assert results[0] == 1 and results[3] == 1
+    assert isinstance(results[1], xmlrpc.client.Fault)
+    assert isinstance(results[2], TypeError)
+    assert [bulk.outcome(i, result)['success'] for i, result in enumerate(results)] == [True, False, False, True]
+    # The multi-record create, then one create per record
+    assert len(client.calls) == 1 + len(values)
+
+
+def test_create_records_does_not_resend_after_a_transport_error():
+    # Odoo may have created the records before the connection dropped
+    client = FakeClient({'down': ConnectionResetError('reset')})
+    results = bulk.create_records(client, 'project.task', [{'name': 'a'}, {'name': 'down'}, {'name': 'b'}])
+    assert all(isinstance(result, ConnectionResetError) for result in results)
+    assert len(client.calls) == 1
+
+
+def test_write_groups_retries_each_record_of_a_rejected_group():
+    client = FakeClient({'bad': xmlrpc.client.Fault(2, 'rejected')})
+    groups = {1: ([1, 2], {'name': 'good'}), 2: ([3, 4], {'name': 'bad'})}
+    results = bulk.write_groups(client, 'project.task', groups)
+    assert results[1] is True and results[2] is True
+    assert isinstance(results[3], xmlrpc.client.Fault) and isinstance(results[4], xmlrpc.client.Fault)
+    # One write per group, then one per record of the rejected group
+    assert len(client.calls) == 4
+
+
+def test_write_groups_does_not_resend_after_a_transport_error():
+    client = FakeClient({'bad': xmlrpc.client.ProtocolError('odoo', 502, 'Bad Gateway', {})})
+    groups = {1: ([1, 2], {'name': 'good'}), 2: ([3, 4], {'name': 'bad'})}
+    results = bulk.write_groups(client, 'project.task', groups)
+    assert results[1] is True and results[2] is True
+    assert isinstance(results[3], xmlrpc.client.ProtocolError) and isinstance(results[4], xmlrpc.client.ProtocolError)
+    assert len(client.calls) == 2
+
+
+def test_update_stage_bulk_with_malformed_items(client, headers, odoo):
+    items = [
+        {'task_id': 1, 'new_stage_name': 'Done'},
+        {'task_id': 2, 'new_stage_name': ['Done']},
+        {'task_id': 3, 'new_stage_name': {'name': 'Done'}},
+        {'task_id': '4', 'new_stage_name': 'Done'},
+        {'task_id': 5, 'new_stage_name': 'No such stage'},
+        {'task_id': 9999, 'new_stage_name': 'Done'},
+        {'task_id': 6, 'new_stage_name': 'In Progress'},
+    ]
+    response = client.post('/update-stage/bulk', json=items, headers=headers)
+    assert response.status_code == 200
+    results = response.get_json()['results']
+    assert [result['success'] for result in results] == [True, False, False, False, False, False, True]
+    assert results[1]['error'] == results[2]['error'] == 'new_stage_name must be a string'
+    assert results[4]['error'] == 'Stage not found'
+    assert odoo.data['project.task'][1]['stage_id'] == 3
+    assert odoo.data['project.task'][6]['stage_id'] == 2
+
+
+def test_add_task_bulk_with_malformed_items(client, headers, odoo):
+    task = {'task_name': 'Write the tests', 'project_name': 'Project 1', 'stage_name': 'New',
+            'user_name': 'Marc Demo', 'priority': '0'}
+    items = [
+        dict(task, deadline='2024-06-01'),
+        dict(task, task_name=None),
+        dict(task, project_name=['Project 1']),
+        dict(task, stage_name={'name': 'New'}),
+        dict(task, deadline=None),
+        dict(task, deadline=20240601),
+        dict(task, priority=1),
+        dict(task, user_name='Nobody'),
+    ]
+    count = len(odoo.data['project.task'])
+    response = client.post('/add-task/bulk', json=items, headers=headers)
+    assert response.status_code == 200
+    results = response.get_json()['results']
+    assert [result['success'] for result in results] == [True, False, False, False, True, False, False, False]
+    assert results[1]['error'] == 'task_name must be a string'
+    assert results[5]['error'] == 'deadline must be a string'
+    assert results[6]['error'] == 'Invalid priority value'
+    assert results[7]['error'] == "User 'Nobody' not found."
+    assert len(odoo.data['project.task']) == count + 2
+    assert odoo.data['project.task'][results[4]['id']]['date_deadline'] is False
@@ -0,0 +1,12 @@
+def test_304_and_compressed_200_send_the_same_etag(client, headers):
+    plain = client.get('/fetch-tasks', headers=headers)
+    compressed = client.get('/fetch-tasks', headers=dict(headers, **{'Accept-Encoding': 'gzip'}))
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert plain.headers['ETag'] == compressed.headers['ETag']
+    assert compressed.headers['ETag'].startswith('W/"')
+
+    for etag in (compressed.headers['ETag'], compressed.headers['ETag'][2:]):
+        revalidated = client.get('/fetch-tasks', headers=dict(headers, **{'If-None-Match': etag,
+                                                                          'Accept-Encoding': 'gzip'}))
+        assert revalidated.status_code == 304
+        assert revalidated.headers['ETag'] == compressed.headers['ETag']
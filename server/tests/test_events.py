@@ -0,0 +1,75 @@
+import queue
+
+import events
+from odoo_client import OdooClient
+
+
+def subscribe(poller, odoo, username, password, uid):
+    subscription = events.Subscription(OdooClient(odoo.url, 'test', username, password, uid=uid))
+    poller.subscriptions.append(subscription)
+    return subscription
+
+
+def received(subscription):
+    items = []
+    while True:
+        try:
+            items.append(subscription.queue.get_nowait())
+        except queue.Empty:
+            return items
+
+
+def test_each_user_is_polled_with_their_own_session(odoo):
+    # Older changes than the ones made below, Odoo write dates have a one second resolution
+    for model in ('project.task', 'mail.activity'):
+        for record in odoo.data[model].values():
+            record['write_date'] = '2024-01-01 00:00:00'
+    errors = []
+    poller = events.DatabasePoller(events.EventHub(errors.append), (odoo.url, 'test'))
+    # The first session of admin is no longer accepted by Odoo
+    expired = subscribe(poller, odoo, 'admin', 'old password', 1)
+    admin = subscribe(poller, odoo, 'admin', 'admin', 1)
+    demo = subscribe(poller, odoo, 'demo', 'demo', 2)
+    poller.poll()
+    assert set(poller.watermarks) == {1, 2}
+
+    # Task 1 is assigned to admin, task 3 to admin and demo
+    odoo.rpc_write('project.task', [1], {'name': 'Admin only'})
+    odoo.rpc_write('project.task', [3], {'name': 'Shared'})
+    poller.poll()
+    assert not errors
+    for subscription in (expired, admin):
+        [(event, data)] = received(subscription)
+        assert event == 'tasks' and sorted(task['id'] for task in data['tasks']) == [1, 3]
+    [(event, data)] = received(demo)
+    assert [task['id'] for task in data['tasks']] == [3]
+    assert 'user_ids' not in data['tasks'][0]
+
+    # Nothing new: nothing is notified again
+    poller.poll()
+    assert not received(admin) and not received(demo)
+
+    # Gone users are forgotten
+    poller.subscriptions.remove(demo)
+    poller.poll()
+    assert set(poller.watermarks) == {1}
+
+
+def test_streams_over_the_limit_are_refused(app, client, headers):
+    app.event_hub.max_streams = 2
+    first = client.get('/events', headers=headers, buffered=False)
+    second = client.get('/events', headers=headers, buffered=False)
+    assert first.status_code == second.status_code == 200
+
+    refused = client.get('/events', headers=headers, buffered=False)
+    assert refused.status_code == 503
+    assert refused.headers['Retry-After'] == '30'
+
+    # A closed stream frees its place, even if it was never read
+    first.close()
+    third = client.get('/events', headers=headers, buffered=False)
+    assert third.status_code == 200
+    assert next(third.response).startswith(b'retry:')
+    second.close()
+    third.close()
+    assert app.event_hub.stats() == {}
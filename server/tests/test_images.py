@@ -0,0 +1,38 @@
+import os
+
+import images
+
+
+def test_replacing_an_entry_counts_its_size_once(tmp_path):
+    cache = images.ImageCache(str(tmp_path), max_bytes=1000)
+    cache.put(b'a' * 400, 'image/png', 1, 'thumbnail')
+    cache.put(b'b' * 400, 'image/png', 1, 'thumbnail')
+    assert cache.stats()['bytes'] == 400
+    # Replaced with another type: the previous file goes away
+    cache.put(b'c' * 300, 'image/jpeg', 1, 'thumbnail')
+    assert cache.stats()['bytes'] == 300
+    assert cache.get(1, 'thumbnail') == (b'c' * 300, 'image/jpeg')
+    # Touched entries keep their size
+    cache.get(1, 'thumbnail')
+    cache.put(b'd' * 600, 'image/png', 2, 'thumbnail')
+    assert cache.stats()['bytes'] == 900
+    assert cache.stats()['files'] == 2
+    assert cache.get(1, 'thumbnail') is not None and cache.get(2, 'thumbnail') is not None
+
+
+def test_eviction_starts_past_the_byte_budget(tmp_path):
+    cache = images.ImageCache(str(tmp_path), max_bytes=1000)
+    for i in range(3):
+        cache.put(bytes(400), 'image/png', i)
+    stats = cache.stats()
+    assert stats['bytes'] <= 900
+    assert stats['bytes'] == sum(entry.stat().st_size for entry in os.scandir(tmp_path))
+
+
+def test_images_of_another_type_are_served_from_the_cache(tmp_path):
+    cache = images.ImageCache(str(tmp_path), max_bytes=1000)
+    cache.put(b'BM' + bytes(100), 'application/octet-stream', 1, 'thumbnail')
+    assert cache.get(1, 'thumbnail') == (b'BM' + bytes(100), 'application/octet-stream')
+    # Replaced with a known type, the previous file stops counting
+    cache.put(b'a' * 50, 'image/png', 1, 'thumbnail')
+    assert cache.stats() == {'files': 1, 'bytes': 50, 'max_bytes': 1000}
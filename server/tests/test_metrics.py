@@ -0,0 +1,29 @@
+import re
+import xmlrpc.client
+
+import pytest
+
+import transport
+
+
+def errors(client, model, method):
+    # Failed calls of model.method by exception class, as /metrics shows them
+    pattern = rf'^odoo_rpc_errors_total{{model="{model}",method="{method}",error="(\w+)"}} (\d+)$'
+    text = client.get('/metrics').get_data(as_text=True)
+    return {error: int(value) for error, value in re.findall(pattern, text, re.MULTILINE)}
+
+
+def test_failed_rpcs_are_counted_by_exception_class(client, odoo):
+    before = errors(client, 'missing', 'version')
+    # Odoo answers 404 outside of its RPC paths
+    with pytest.raises(xmlrpc.client.ProtocolError):
+        transport.get_proxy(odoo.url, '/xmlrpc/2/missing', 'xmlrpc').version()
+    after = errors(client, 'missing', 'version')
+    assert after.get('ProtocolError', 0) == before.get('ProtocolError', 0) + 1
+
+    before = errors(client, 'object', 'execute_kw')
+    for protocol in ('xmlrpc', 'jsonrpc'):
+        with pytest.raises(xmlrpc.client.Fault):
+            transport.get_proxy(odoo.url, '/xmlrpc/2/object', protocol).execute_kw(
+                'test', 1, 'wrong password', 'project.task', 'search', [[]])
+    assert errors(client, 'object', 'execute_kw').get('Fault', 0) == before.get('Fault', 0) + 2
@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+import pagination
+from odoo_client import OdooClient
+
+
+def ids(records):
+    return [record['id'] for record in records]
+
+
+def walk(client, headers, path, header, parameter, start):
+    # Records of all the pages, following the next page header
+    records = []
+    url = f'{path}&{parameter}={start}'
+    while True:
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200
+        records += response.get_json()
+        if header not in response.headers:
+            return records
+        url = f'{path}&{parameter}={response.headers[header]}'
+
+
+def test_offset_and_cursor_pages_cover_the_list(client, headers):
+    everything = ids(client.get('/fetch-contacts?images=none', headers=headers).get_json())
+    assert len(everything) == 20
+    first = client.get('/fetch-contacts?images=none&limit=7', headers=headers)
+    assert len(first.get_json()) == 7 and first.headers['X-Next-Offset'] == '7'
+    assert ids(walk(client, headers, '/fetch-contacts?images=none&limit=7', 'X-Next-Offset', 'offset', 0)) == everything
+    assert ids(walk(client, headers, '/fetch-contacts?images=none&limit=7', 'X-Next-Cursor',
+                    'after_id', 0)) == sorted(everything)
+    tasks = ids(client.get('/fetch-tasks', headers=headers).get_json())
+    assert sorted(ids(walk(client, headers, '/fetch-tasks?limit=15', 'X-Next-Offset', 'offset', 0))) == sorted(tasks)
+
+
+def test_pages_follow_the_order_asked_for(client, headers):
+    contacts = client.get('/fetch-contacts?images=none&limit=5&order=name desc', headers=headers).get_json()
+    names = [contact['name'] for contact in contacts]
+    assert names == sorted(names, reverse=True)
+
+
+@pytest.mark.parametrize('query', ['limit=-1', 'limit=many', 'order=password', 'order=name sideways',
+                                   'after_id=3&offset=5'])
+def test_invalid_paging_answers_400(client, headers, query):
+    response = client.get(f'/fetch-contacts?images=none&{query}', headers=headers)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_streams_send_one_record_per_line(client, headers):
+    everything = client.get('/fetch-tasks', headers=headers).get_json()
+    response = client.get('/fetch-tasks?stream=1', headers=headers)
+    assert response.mimetype == 'application/x-ndjson'
+    streamed = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert sorted(streamed, key=lambda task: task['id']) == sorted(everything, key=lambda task: task['id'])
+    limited = client.get('/fetch-contacts?images=none&stream=1&limit=4', headers=headers).get_data(as_text=True)
+    assert len(limited.splitlines()) == 4
+
+
+def test_batches_follow_an_id_cursor(odoo):
+    client = OdooClient(odoo.url, 'test', 'admin', 'admin')
+    page = pagination.Page(limit=None, offset=0, after_id=None, order=None, stream=True)
+    batches = list(pagination.iter_batches(client, 'res.partner', [], ['name'], page, batch_size=7))
+    assert [len(batch) for batch in batches] == [7, 7, 6]
+    assert ids(sum(batches, [])) == list(range(1, 21))
+
+
+def test_a_failing_stream_ends_with_an_error_line():
+    def batches():
+        yield [{'id': 1}]
+        raise ConnectionResetError('Odoo went away')
+
+    lines = b''.join(pagination.ndjson(batches(), log_error=lambda message: None)).splitlines()
+    assert [json.loads(line) for line in lines] == [{'id': 1}, {'error': 'Odoo went away'}]
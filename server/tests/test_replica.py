@@ -0,0 +1,126 @@
+import pytest
+
+import replica
+from odoo_client import OdooClient
+
+
+def admin_session(odoo, password='admin', uid=1):
+    session = {'url': odoo.url, 'db': 'test', 'username': 'admin', 'password': password}
+    if uid:
+        session['uid'] = uid
+    return session
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = replica.Replica(path=str(tmp_path / 'replica.db'), log_error=lambda message: None)
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def synced(store, odoo):
+    # Some tasks without a deadline, and names differing in case only
+    for task_id in (2, 5, 9):
+        odoo.data['project.task'][task_id]['date_deadline'] = False
+    odoo.data['project.task'][4]['name'] = 'TASK 4 urgent'
+    reader = store.reader(admin_session(odoo), refresh=True)
+    assert reader.owner.verified and not reader.owner.failing
+    return reader
+
+
+def test_sessions_without_a_verified_login_do_not_read_nor_sync(store, odoo):
+    assert store.reader(admin_session(odoo, uid=None)) is None
+    assert store.stats() == {}
+
+
+def test_owner_session_is_only_replaced_by_working_credentials(synced, store, odoo):
+    owner = synced.owner
+    session = owner.session
+    # Same password: the newer session takes over
+    same = admin_session(odoo)
+    assert store.reader(same).owner is owner and owner.session is same
+    # Another password, even with a uid, while the syncs work: ignored
+    other = store.reader(admin_session(odoo, password='other'))
+    assert owner.session is same and owner.session is not session
+    assert other.execute_kw('project.task', 'search', [[]]) == (False, None)
+    # Once the owner's syncs fail, a verified session takes over
+    owner.failing = True
+    changed = admin_session(odoo, password='changed')
+    store.reader(changed)
+    assert owner.session is changed
+
+
+DOMAINS = [
+    [],
+    [['stage_id', '=', 1], ['priority', '=', '1']],
+    ['&', ['stage_id', '=', 1], ['project_id', 'in', [1, 2]]],
+    ['|', ['stage_id', '=', 1], ['priority', '=', '1']],
+    ['|', '&', ['stage_id', '=', 2], ['priority', '=', '0'], ['project_id', '=', 3]],
+    ['!', ['stage_id', 'in', [1, 2]]],
+    ['!', '|', ['stage_id', '=', 1], ['user_ids', 'in', [2]]],
+    [['stage_id', 'not in', [1, 3]]],
+    [['stage_id', 'in', []]],
+    [['stage_id', 'not in', []]],
+    [['id', 'in', [1, 2, 3, 50]]],
+    [['user_ids', 'in', [2]]],
+    [['user_ids', '=', 2]],
+    [['tag_ids', 'not in', [1, 2]]],
+    [['tag_ids', '!=', 3]],
+    [['name', 'ilike', 'task 4']],
+    [['name', 'ilike', 'URGENT']],
+    # NULL deadlines: never before a date, always different from one
+    [['date_deadline', '<', '2024-02-15']],
+    [['date_deadline', '>=', '2024-02-15']],
+    [['date_deadline', '!=', '2024-01-10']],
+    [['date_deadline', 'not in', ['2024-01-10', '2024-01-20']]],
+    [['priority', '=', '1'], ['date_deadline', '<=', '2024-03-01']],
+]
+
+
+@pytest.mark.parametrize('domain', DOMAINS)
+def test_domains_match_odoo(synced, store, odoo, domain):
+    assert sorted(store.query(synced.owner.key, 'project.task', 'search', [domain], {})) == \
+        sorted(odoo.rpc_search('project.task', domain))
+
+
+UNSUPPORTED = [
+    [['name', 'like', 'Task']],
+    [['name', 'ilike', 'tâche']],
+    [['date_deadline', '=', False]],
+    [['date_deadline', '!=', False]],
+    [['stage_id', 'in', [1, False]]],
+    [['project_id', '=', 'Project 1']],
+    [['project_id', 'ilike', 'Project']],
+    [['project_id', 'child_of', 1]],
+    [['user_ids', 'ilike', 'Admin']],
+    [['description', '=', 'x']],
+    [['stage_id', '=?', 1]],
+    ['&', ['stage_id', '=', 1]],
+    ['stage_id'],
+]
+
+
+@pytest.mark.parametrize('domain', UNSUPPORTED)
+def test_unsupported_domains_go_to_odoo(synced, store, odoo, domain):
+    with pytest.raises(replica.Unsupported):
+        store.query(synced.owner.key, 'project.task', 'search', [domain], {})
+    assert synced.execute_kw('project.task', 'search', [domain]) == (False, None)
+
+
+def test_client_reads_the_replica_and_falls_back_to_rpc(synced, odoo):
+    client = OdooClient(odoo.url, 'test', 'admin', 'admin', uid=1)
+    client.replica = synced
+    odoo.calls = 0
+    assert sorted(client.execute_kw('project.task', 'search', [[['stage_id', '=', 1]]])) == \
+        sorted(odoo.rpc_search('project.task', [['stage_id', '=', 1]]))
+    assert odoo.calls == 0
+    domain = [['name', 'like', 'Task 1']]
+    assert client.execute_kw('project.task', 'search', [domain]) == odoo.rpc_search('project.task', domain)
+    assert odoo.calls == 1
+
+
+def test_stats_of_one_user(synced, store, odoo):
+    store.reader({'url': odoo.url, 'db': 'test', 'username': 'demo', 'password': 'demo', 'uid': 2})
+    assert len(store.stats()) == 2
+    assert list(store.stats(synced.owner.key)) == ['admin@' + odoo.url + '/test']
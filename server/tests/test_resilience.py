@@ -0,0 +1,112 @@
+import threading
+import time
+import xmlrpc.client
+
+import pytest
+
+import resilience
+import server
+import stale
+from conftest import login
+
+
+def test_the_breaker_opens_after_consecutive_failures_and_probes_once():
+    breaker = resilience.CircuitBreaker('http://odoo.example:8069', failures=2, reset_timeout=0.2)
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_failure()
+    with pytest.raises(resilience.CircuitOpenError):
+        breaker.before_call()
+    assert breaker.retry_after() > 0
+
+    time.sleep(0.25)
+    # One probe goes through, the others are rejected until it is answered
+    breaker.before_call()
+    with pytest.raises(resilience.CircuitOpenError):
+        breaker.before_call()
+    # A failed probe opens the circuit again, a successful one closes it
+    breaker.record_failure()
+    with pytest.raises(resilience.CircuitOpenError):
+        breaker.before_call()
+    time.sleep(0.25)
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.stats() == {'state': resilience.CLOSED, 'consecutive_failures': 0}
+    breaker.before_call()
+
+
+def test_only_transient_failures_are_retried():
+    calls = []
+
+    def call(error):
+        calls.append(error)
+        if len(calls) == 1:
+            raise error
+        return 'answer'
+
+    assert resilience.retry(lambda: call(ConnectionResetError()), backoff=0) == 'answer'
+    assert len(calls) == 2
+    calls.clear()
+    # Timeouts already took long, faults are answers, open circuits fail fast
+    for error in (TimeoutError(), xmlrpc.client.Fault(2, 'Access Denied'),
+                  resilience.CircuitOpenError('http://odoo.example:8069', 5)):
+        with pytest.raises(type(error)):
+            resilience.retry(lambda: call(error), backoff=0)
+        calls.clear()
+
+
+def test_refreshes_that_finish_at_once_are_ended():
+    store = stale.ResponseStore(workers=1)
+
+    def refresh_many():
+        for i in range(200):
+            store.refresh(('tasks', i), lambda: None).result()
+
+    thread = threading.Thread(target=refresh_many, daemon=True)
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive()
+    store.shutdown()
+
+
+@pytest.fixture
+def app(odoo):
+    app = server.create_app({'STALE_DEADLINE': 0.3})
+    yield app
+    server.shutdown(app)
+
+
+@pytest.fixture
+def breaker(odoo):
+    breaker = resilience.breaker(resilience.backend_of(odoo.url))
+    yield breaker
+    breaker.record_success()
+
+
+def test_slow_odoo_gets_the_last_good_response(client, headers, odoo):
+    fresh = client.get('/fetch-contacts', headers=headers)
+    assert fresh.status_code == 200 and 'Warning' not in fresh.headers
+
+    odoo.latency = 1
+    stale = client.get('/fetch-contacts', headers=headers)
+    assert stale.status_code == 200
+    assert stale.headers['X-Stale-Reason'] == 'timeout'
+    assert stale.headers['Warning'] == '110 - "Response is Stale"'
+    assert int(stale.headers['Age']) >= 0
+    assert stale.get_json() == fresh.get_json()
+
+
+def test_open_circuit_serves_the_last_good_response_or_503(client, headers, odoo, breaker):
+    fresh = client.get('/fetch-contacts', headers=headers)
+    for _ in range(breaker.failures):
+        breaker.record_failure()
+
+    stale = client.get('/fetch-contacts', headers=headers)
+    assert stale.headers['X-Stale-Reason'] == 'unavailable'
+    assert stale.get_json() == fresh.get_json()
+
+    # Only served to the user and query it was computed for
+    other = client.get('/fetch-contacts?images=none', headers=headers)
+    assert other.status_code == 503
+    assert int(other.headers['Retry-After']) >= 1
+    assert client.get('/fetch-contacts', headers=login(client, odoo, 'admin')).status_code == 503
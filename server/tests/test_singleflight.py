@@ -0,0 +1,94 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from odoo_client import OdooClient
+from singleflight import SingleFlight
+
+
+def run_together(flight, key, function, callers):
+    # do(key, function) from callers threads, the first one leading
+    started = threading.Event()
+    release = threading.Event()
+
+    def leader():
+        started.set()
+        release.wait(5)
+        return function()
+
+    with ThreadPoolExecutor(callers) as executor:
+        futures = [executor.submit(flight.do, key, leader)]
+        started.wait(5)
+        futures += [executor.submit(flight.do, key, function) for _ in range(callers - 1)]
+        # Time for the others to join the call in flight
+        time.sleep(0.2)
+        release.set()
+        return [future.exception() or future.result() for future in futures]
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight()
+    calls = []
+
+    def read():
+        calls.append(1)
+        return [{'id': 1, 'name': 'Task'}]
+
+    results = run_together(flight, 'tasks', read, 4)
+    assert len(calls) == 1
+    assert [shared for _, shared in results] == [False, True, True, True]
+    # Each caller gets its own copy of the records
+    results[1][0][0]['name'] = 'Changed'
+    assert results[2][0][0]['name'] == 'Task'
+    assert flight.in_flight() == 0
+
+
+def test_the_error_of_the_call_is_raised_to_every_caller():
+    flight = SingleFlight()
+
+    def fail():
+        raise ValueError('Odoo is down')
+
+    errors = run_together(flight, 'tasks', fail, 3)
+    assert all(isinstance(error, ValueError) for error in errors)
+    # Nothing is kept: the next caller runs the call again
+    with pytest.raises(ValueError):
+        flight.do('tasks', fail)
+
+
+def test_forgotten_keys_start_a_new_call():
+    flight = SingleFlight()
+    release = threading.Event()
+    with ThreadPoolExecutor(1) as executor:
+        first = executor.submit(flight.do, 'tasks', lambda: release.wait(5) and 'before the write')
+        while not flight.in_flight():
+            time.sleep(0.01)
+        flight.forget(lambda key: key == 'tasks')
+        assert flight.do('tasks', lambda: 'after the write') == ('after the write', False)
+        release.set()
+        assert first.result() == ('before the write', False)
+
+
+def test_identical_reads_of_clients_reach_odoo_once(odoo):
+    OdooClient(odoo.url, 'test', 'admin', 'admin').uid
+    odoo.latency = 0.3
+    before = odoo.calls
+
+    def read(password):
+        client = OdooClient(odoo.url, 'test', 'admin', password)
+        return client.execute_kw('project.task', 'search_read', [[]], {'fields': ['name']})
+
+    with ThreadPoolExecutor(4) as executor:
+        results = list(executor.map(read, ['admin'] * 4))
+    assert odoo.calls - before == 1
+    assert all(result == results[0] for result in results)
+
+    # Another password does not share the read of the right one
+    before = odoo.calls
+    with ThreadPoolExecutor(2) as executor:
+        futures = [executor.submit(read, password) for password in ('admin', 'wrong')]
+        assert futures[0].result() == results[0]
+        assert futures[1].exception() is not None
+    assert odoo.calls - before >= 2
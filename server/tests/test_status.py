@@ -0,0 +1,12 @@
+import resilience
+
+
+def test_backend_status_only_shows_the_session_backend(client, headers, odoo):
+    client.get('/fetch-tasks', headers=headers)
+    # Another tenant's backend, known to this process
+    resilience.breaker('http://other-tenant.example:8069')
+    status = client.get('/backend-status', headers=headers).get_json()
+    backend = resilience.backend_of(odoo.url)
+    assert list(status['breakers']) == [backend]
+    assert list(status['admission']['backends']) == [backend]
+    assert 'users' not in status['admission']
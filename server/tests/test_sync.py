@@ -0,0 +1,35 @@
+import pytest
+
+import watermarks
+from conftest import login
+
+
+def test_sync_reports_deletions_from_the_server_side_snapshot(app, client, headers, odoo):
+    first = client.get('/sync?models=tasks', headers=headers).get_json()
+    assert first['tasks']['deleted'] == []
+    task_ids = [task['id'] for task in first['tasks']['updated']]
+
+    with odoo.lock:
+        odoo.rpc_unlink('project.task', task_ids[:2])
+    second = client.get(f"/sync?models=tasks&since={first['watermark']}", headers=headers).get_json()
+    assert second['tasks']['deleted'] == sorted(task_ids[:2])
+    assert 'ids' not in second['tasks']
+
+    # Only the watermark goes back and forth: the session holds no id list
+    session = app.sessions.get(headers['X-Session-Token'])
+    assert not any(isinstance(value, (dict, list)) for value in session.values())
+
+    # Another session has no snapshot for that watermark and gets the full id list
+    other = client.get(f"/sync?models=tasks&since={first['watermark']}", headers=login(client, odoo, 'admin'))
+    assert sorted(other.get_json()['tasks']['ids']) == sorted(task_ids[2:])
+
+
+@pytest.mark.parametrize('watermark', [
+    {'tasks': [1, 2]},
+    {'tasks': 5},
+    {'tasks': 'yesterday'},
+])
+def test_sync_rejects_a_watermark_that_is_not_a_timestamp(client, headers, watermark):
+    response = client.get(f'/sync?models=tasks&since={watermarks.encode(watermark)}', headers=headers)
+    assert response.status_code == 400
+    assert response.get_json()['error'].startswith('Invalid')
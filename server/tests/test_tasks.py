@@ -0,0 +1,58 @@
+import json
+
+import pytest
+
+
+def test_fetch_tasks_projects_the_fields_asked_for(client, headers):
+    for fields, expected in (('activities', {'id', 'activities'}),
+                             ('activities,stages', {'id', 'activities', 'stages'}),
+                             ('stages', {'id', 'stages'}),
+                             ('name,tag_names', {'id', 'name', 'tag_names'})):
+        response = client.get(f'/fetch-tasks?fields={fields}', headers=headers)
+        assert response.status_code == 200
+        tasks = response.get_json()
+        assert tasks and all(set(task) == expected for task in tasks), fields
+        paged = client.get(f'/fetch-tasks?fields={fields}&limit=5', headers=headers).get_json()
+        assert all(set(task) == expected for task in paged), fields
+        streamed = client.get(f'/fetch-tasks?fields={fields}&stream=1', headers=headers).get_data(as_text=True)
+        assert all(set(json.loads(line)) == expected for line in streamed.splitlines()), fields
+
+
+def test_fetch_tasks_filters_in_odoo(client, headers):
+    everything = client.get('/fetch-tasks?fields=name,project_id,stage_id,date_deadline', headers=headers).get_json()
+    for query, keep in (
+            ('project_id=1,2', lambda task: task['project_id'][0] in (1, 2)),
+            ('stage_id=3', lambda task: task['stage_id'][0] == 3),
+            ('deadline_from=2024-02-01&deadline_to=2024-02-29',
+             lambda task: '2024-02-01' <= task['date_deadline'] <= '2024-02-29'),
+            ('q=task 1', lambda task: 'task 1' in task['name'].lower()),
+            ('project_id=1&q=task 2', lambda task: task['project_id'][0] == 1 and 'task 2' in task['name'].lower())):
+        expected = sorted(task['id'] for task in everything if keep(task))
+        assert expected, query
+        response = client.get(f'/fetch-tasks?fields=name,project_id,stage_id,date_deadline&{query}', headers=headers)
+        assert sorted(task['id'] for task in response.get_json()) == expected, query
+
+
+def test_fetch_contacts_searches_names_and_emails(client, headers):
+    by_name = client.get('/fetch-contacts?images=none&q=Contact 1', headers=headers).get_json()
+    expected = ['Contact 1'] + [f'Contact {i}' for i in range(10, 20)]
+    assert sorted(contact['name'] for contact in by_name) == sorted(expected)
+    by_email = client.get('/fetch-contacts?images=none&q=contact7@', headers=headers).get_json()
+    assert [contact['email'] for contact in by_email] == ['contact7@example.com']
+    projected = client.get('/fetch-contacts?images=none&fields=email', headers=headers).get_json()
+    assert all(set(contact) == {'id', 'email'} for contact in projected)
+
+
+@pytest.mark.parametrize('path', [
+    '/fetch-tasks?project_id=abc',
+    '/fetch-tasks?stage_id=0',
+    '/fetch-tasks?deadline_from=tomorrow',
+    '/fetch-tasks?deadline_from=2024-03-01&deadline_to=2024-02-01',
+    '/fetch-tasks?q=' + 'x' * 101,
+    '/fetch-tasks?fields=password',
+    '/fetch-contacts?fields=name,password',
+])
+def test_invalid_filters_answer_400(client, headers, path):
+    response = client.get(path, headers=headers)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
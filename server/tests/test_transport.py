@@ -0,0 +1,66 @@
+import xmlrpc.client
+
+import pytest
+
+import transport
+
+
+def call(odoo, protocol, *args):
+    return transport.get_proxy(odoo.url, '/xmlrpc/2/object', protocol).execute_kw('test', 1, 'admin', *args)
+
+
+def fault(odoo, protocol, *args):
+    with pytest.raises(xmlrpc.client.Fault) as raised:
+        call(odoo, protocol, *args)
+    return raised.value
+
+
+def test_both_protocols_return_the_same_results(odoo):
+    args = ('project.task', 'search_read', [[['id', '<=', 5]]], {'fields': ['name', 'stage_id', 'date_deadline']})
+    assert call(odoo, 'jsonrpc', *args) == call(odoo, 'xmlrpc', *args)
+    for path in ('/xmlrpc/2/common', '/xmlrpc/2/db'):
+        proxies = [transport.get_proxy(odoo.url, path, protocol) for protocol in transport.PROTOCOLS]
+        assert isinstance(proxies[1], transport.JsonRpcProxy)
+        assert proxies[0].version() == proxies[1].version()
+    assert transport.get_proxy(odoo.url, '/xmlrpc/2/common', 'jsonrpc').authenticate('test', 'admin', 'admin', {}) == 1
+
+
+def test_json_rpc_errors_are_raised_as_the_xml_rpc_faults(odoo):
+    for args in (('project.task', 'write', [[99999], {'name': 'Missing'}]),
+                 ('project.task', 'unknown_method', [[]])):
+        xml, json = fault(odoo, 'xmlrpc', *args), fault(odoo, 'jsonrpc', *args)
+        assert json.faultCode == xml.faultCode
+    with pytest.raises(xmlrpc.client.Fault) as raised:
+        transport.get_proxy(odoo.url, '/xmlrpc/2/object', 'jsonrpc').execute_kw(
+            'test', 1, 'wrong password', 'project.task', 'search', [[]])
+    assert raised.value.faultCode == transport.FAULT_CODES['odoo.exceptions.AccessDenied']
+
+
+def test_fault_codes_of_odoo_exceptions():
+    error = {'code': 200, 'message': 'Odoo Server Error',
+             'data': {'name': 'odoo.exceptions.ValidationError', 'message': 'Invalid date', 'debug': 'Traceback...'}}
+    fault = transport._fault(error)
+    assert (fault.faultCode, fault.faultString) == (2, 'Invalid date')
+    # Other exceptions keep Odoo's traceback, as with XML-RPC
+    error['data']['name'] = 'builtins.KeyError'
+    fault = transport._fault(error)
+    assert (fault.faultCode, fault.faultString) == (1, 'Traceback...')
+
+
+def test_protocols_are_checked_and_other_paths_stay_xml_rpc(odoo):
+    with pytest.raises(ValueError):
+        transport.get_proxy(odoo.url, '/xmlrpc/2/object', 'soap')
+    assert not isinstance(transport.get_proxy(odoo.url, '/start', 'jsonrpc'), transport.JsonRpcProxy)
+
+
+def test_sessions_choose_their_protocol(client, odoo):
+    bodies = []
+    for protocol in transport.PROTOCOLS:
+        response = client.post('/store-data', json={'url': odoo.url, 'db': 'test', 'username': 'admin',
+                                                    'password': 'admin', 'protocol': protocol})
+        headers = {'X-Session-Token': response.get_json()['token']}
+        bodies.append(client.get('/fetch-tasks', headers=headers).get_json())
+    assert bodies[0] == bodies[1]
+    response = client.post('/store-data', json={'url': odoo.url, 'db': 'test', 'username': 'admin',
+                                                'password': 'admin', 'protocol': 'soap'})
+    assert response.status_code == 400
@@ -0,0 +1,111 @@
+import pytest
+
+import resilience
+import writequeue
+from conftest import login
+
+ASYNC = {'Prefer': 'respond-async'}
+
+
+@pytest.fixture(autouse=True)
+def manual_flush(monkeypatch):
+    # The tests flush the queue themselves
+    monkeypatch.setattr(writequeue, 'FLUSH_DELAY', 60)
+    monkeypatch.setattr(writequeue, 'RETRY_BACKOFF', 0)
+
+
+@pytest.fixture
+def writes(odoo):
+    # The write and create calls received by Odoo
+    calls = []
+    execute_kw = odoo.execute_kw
+
+    def spy(db, uid, password, model, method, args, kwargs=None):
+        if method in ('write', 'create'):
+            calls.append((model, method, args))
+        return execute_kw(db, uid, password, model, method, args, kwargs)
+
+    odoo.execute_kw = spy
+    return calls
+
+
+@pytest.fixture
+def breaker(odoo):
+    breaker = resilience.breaker(resilience.backend_of(odoo.url))
+    yield breaker
+    breaker.record_success()
+
+
+def queue(client, headers, path, body):
+    response = client.post(path, json=body, headers=dict(headers, **ASYNC))
+    assert response.status_code == 202
+    return response.headers['Location']
+
+
+def status(client, headers, location):
+    return client.get(location, headers=headers).get_json()
+
+
+def test_queued_writes_are_collapsed_and_batched(app, client, headers, odoo, writes):
+    locations = [queue(client, headers, '/update-stage', {'task_id': 1, 'new_stage_name': stage})
+                 for stage in ('In Progress', 'Done', 'In Progress', 'Done')]
+    locations += [queue(client, headers, '/update-stage', {'task_id': task_id, 'new_stage_name': 'Done'})
+                  for task_id in (2, 3)]
+    locations += [queue(client, headers, '/add-timesheet-line',
+                        {'task_id': 1, 'unit_amount': 1.5, 'name': f'Line {i}', 'date': '2024-05-01'})
+                  for i in range(3)]
+    assert status(client, headers, locations[0])['status'] == writequeue.QUEUED
+    assert app.write_queue.stats() == {'queued': 9, 'records': 6}
+
+    app.write_queue.flush()
+    # One write for the three tasks moved to Done, one create for the three lines
+    assert sorted((model, method) for model, method, _ in writes) == [
+        ('account.analytic.line', 'create'), ('project.task', 'write')]
+    write = next(args for _, method, args in writes if method == 'write')
+    assert sorted(write[0]) == [1, 2, 3]
+    assert [status(client, headers, location)['status'] for location in locations] == [writequeue.DONE] * 9
+    # Only the user who queued an operation sees it
+    assert client.get(locations[0], headers=login(client, odoo, 'demo')).status_code == 404
+
+
+def test_writes_odoo_did_not_receive_are_retried(app, client, headers, odoo, writes, breaker):
+    location = queue(client, headers, '/update-stage', {'task_id': 1, 'new_stage_name': 'Done'})
+    for _ in range(breaker.failures):
+        breaker.record_failure()
+    app.write_queue.flush()
+    operation = status(client, headers, location)
+    assert (operation['status'], operation['attempts']) == (writequeue.QUEUED, 1)
+    assert 'unavailable' in operation['error']
+    assert writes == []
+
+    breaker.record_success()
+    app.write_queue.flush()
+    assert status(client, headers, location)['status'] == writequeue.DONE
+    assert len(writes) == 1
+
+
+def test_faults_fail_the_write_without_retry(app, client, headers, writes):
+    location = queue(client, headers, '/update-stage', {'task_id': 99999, 'new_stage_name': 'Done'})
+    app.write_queue.flush()
+    operation = status(client, headers, location)
+    assert operation['status'] == writequeue.FAILED
+    assert 'MissingError' in operation['error']
+    assert app.write_queue.stats()['queued'] == 0
+
+
+def test_closing_the_queue_writes_what_is_left(app, client, headers, writes):
+    written = queue(client, headers, '/update-stage', {'task_id': 1, 'new_stage_name': 'Done'})
+    app.write_queue.close()
+    assert status(client, headers, written)['status'] == writequeue.DONE
+    assert len(writes) == 1
+    with pytest.raises(RuntimeError):
+        app.write_queue.submit(app.sessions.get(headers['X-Session-Token']), 'project.task', 'write', {}, 1)
+
+
+def test_the_final_flush_does_not_wait_for_retries(app, client, headers, writes, breaker):
+    location = queue(client, headers, '/update-stage', {'task_id': 1, 'new_stage_name': 'Done'})
+    for _ in range(breaker.failures):
+        breaker.record_failure()
+    app.write_queue.close()
+    assert status(client, headers, location)['status'] == writequeue.FAILED
+    assert writes == []
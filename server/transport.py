@@ -0,0 +1,281 @@
+import gzip
+import http.client
+import itertools
+import os
+import select
+import ssl
+import threading
+import time
+import xmlrpc.client
+from urllib.parse import urlsplit
+
+import admission
+import metrics
+import resilience
+import serialization
+
+# Maximum number of idle keep-alive connections kept per Odoo host
+POOL_SIZE = int(os.environ.get('ODOO_POOL_SIZE', 10))
+# Seconds allowed to open a TCP/TLS connection to Odoo
+CONNECT_TIMEOUT = float(os.environ.get('ODOO_CONNECT_TIMEOUT', 5))
+# Seconds allowed to wait for Odoo to answer on an open connection
+READ_TIMEOUT = float(os.environ.get('ODOO_READ_TIMEOUT', 120))
+# Idle connections older than this are closed instead of reused
+IDLE_TIMEOUT = float(os.environ.get('ODOO_POOL_IDLE_TIMEOUT', 30))
+# Protocol of the Odoo calls when the session does not choose one: 'xmlrpc' or
+# 'jsonrpc' (Odoo's /jsonrpc endpoint, cheaper to decode for large responses)
+ODOO_PROTOCOL = os.environ.get('ODOO_PROTOCOL', 'xmlrpc')
+PROTOCOLS = ('xmlrpc', 'jsonrpc')
+
+# XML-RPC fault codes Odoo gives its exceptions, used for the JSON-RPC errors
+# so that callers handle both protocols the same way
+FAULT_CODES = {
+    'odoo.exceptions.AccessDenied': 3,
+    'odoo.exceptions.AccessError': 4,
+    'odoo.exceptions.UserError': 2,
+    'odoo.exceptions.ValidationError': 2,
+    'odoo.exceptions.MissingError': 2,
+    'odoo.exceptions.RedirectWarning': 2,
+}
+
+
+class ConnectionPool:
+    # Thread-safe pool of idle HTTP(S) connections keyed by (scheme, host)
+
+    def __init__(self, size=POOL_SIZE, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 idle_timeout=IDLE_TIMEOUT):
+        self.size = size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.idle_timeout = idle_timeout
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._ssl_context = ssl.create_default_context()
+
+    def acquire(self, scheme, host):
+        key = (scheme, host)
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                if not idle:
+                    break
+                connection, released_at = idle.pop()
+            if self._is_alive(connection, released_at):
+                return connection
+            connection.close()
+        return self._connect(scheme, host)
+
+    def release(self, scheme, host, connection):
+        key = (scheme, host)
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.size:
+                idle.append((connection, time.monotonic()))
+                return
+        connection.close()
+
+    def clear(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection, _ in connections:
+                connection.close()
+
+    def _connect(self, scheme, host):
+        if scheme == 'https':
+            connection = http.client.HTTPSConnection(host, timeout=self.connect_timeout, context=self._ssl_context)
+        else:
+            connection = http.client.HTTPConnection(host, timeout=self.connect_timeout)
+        connection.connect()
+        connection.sock.settimeout(self.read_timeout)
+        return connection
+
+    def _is_alive(self, connection, released_at):
+        if connection.sock is None or time.monotonic() - released_at > self.idle_timeout:
+            return False
+        # An idle keep-alive socket only becomes readable when the server closed it
+        try:
+            readable, _, _ = select.select([connection.sock], [], [], 0)
+        except (OSError, ValueError):
+            return False
+        return not readable
+
+
+_pool = ConnectionPool()
+
+
+def _guarded(scheme, host, send):
+    # Calls wait for their turn (see admission.py), then fail fast while the
+    # backend's circuit is open
+    backend = f'{scheme}://{host}'
+    with admission.slot(backend):
+        circuit = resilience.breaker(backend)
+        circuit.before_call()
+        try:
+            result = send()
+        except Exception as e:
+            if resilience.is_failure(e):
+                circuit.record_failure()
+            else:
+                circuit.record_success()
+            raise
+        circuit.record_success()
+        return result
+
+
+class PooledTransport(xmlrpc.client.Transport):
+    # XML-RPC transport borrowing keep-alive connections from the shared pool,
+    # so one instance can be used by several threads at once
+
+    def __init__(self, scheme='http', pool=None):
+        super().__init__()
+        self.scheme = scheme
+        self.pool = pool or _pool
+
+    def single_request(self, host, handler, request_body, verbose=False):
+        return _guarded(self.scheme, self.get_host_info(host)[0],
+                        lambda: self._send(host, handler, request_body, verbose))
+
+    def _send(self, host, handler, request_body, verbose):
+        chost, extra_headers, _ = self.get_host_info(host)
+        headers = dict(self._headers + (extra_headers or []))
+        if self.accept_gzip_encoding:
+            headers['Accept-Encoding'] = 'gzip'
+
+        with metrics.rpc(handler, request_body) as call:
+            connection = self.pool.acquire(self.scheme, chost)
+            try:
+                connection.request('POST', handler, body=request_body, headers=headers)
+                response = connection.getresponse()
+                call.response_bytes = int(response.getheader('Content-Length') or 0)
+                if response.status == 200:
+                    self.verbose = verbose
+                    try:
+                        result = self.parse_response(response)
+                    except xmlrpc.client.Fault:
+                        # Faults arrive in a complete response, the connection stays usable
+                        self._release(chost, connection, response)
+                        raise
+                    self._release(chost, connection, response)
+                    return result
+                response.read()
+                # An error page may leave the connection in any state, e.g. with
+                # the request body unread by the server: it is not reused
+                connection.close()
+            except xmlrpc.client.Fault:
+                raise
+            except Exception:
+                # Never hand a socket in an unknown state back to the pool
+                connection.close()
+                raise
+            # Inside the measured call, so that it is counted as an error
+            raise xmlrpc.client.ProtocolError(host + handler, response.status, response.reason,
+                                              dict(response.getheaders()))
+
+    def _release(self, chost, connection, response):
+        if response.will_close or not response.isclosed():
+            connection.close()
+        else:
+            self.pool.release(self.scheme, chost, connection)
+
+    def close(self):
+        pass
+
+
+def _fault(error):
+    # xmlrpc.client.Fault equivalent to an Odoo JSON-RPC error object
+    data = error.get('data') or {}
+    code = FAULT_CODES.get(data.get('name'), 1)
+    if code == 1:
+        return xmlrpc.client.Fault(1, data.get('debug') or f"{data.get('name')}: {data.get('message')}")
+    return xmlrpc.client.Fault(code, data.get('message') or error.get('message', ''))
+
+
+class JsonRpcProxy:
+    # Odoo service (common, object, db) called through /jsonrpc with the
+    # interface of xmlrpc.client.ServerProxy, e.g. proxy.execute_kw(...), over
+    # the same pooled connections and circuit breakers. Errors are raised as
+    # the xmlrpc.client.Fault Odoo's XML-RPC would have returned.
+
+    def __init__(self, url, service, pool=None):
+        parts = urlsplit(url)
+        self.scheme = 'https' if parts.scheme == 'https' else 'http'
+        self.host = parts.netloc.rpartition('@')[2]
+        self.handler = parts.path.rstrip('/') + '/jsonrpc'
+        self.service = service
+        self.pool = pool or _pool
+        self._ids = itertools.count(1)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return lambda *args: self._call(name, args)
+
+    def _call(self, method, args):
+        body = serialization.dumps({'jsonrpc': '2.0', 'method': 'call', 'id': next(self._ids),
+                                    'params': {'service': self.service, 'method': method, 'args': list(args)}})
+        return _guarded(self.scheme, self.host, lambda: self._send(method, body))
+
+    def _send(self, method, body):
+        headers = {'Content-Type': 'application/json', 'Accept-Encoding': 'gzip'}
+        with metrics.rpc(self.handler, body, (self.service, method)) as call:
+            connection = self.pool.acquire(self.scheme, self.host)
+            try:
+                connection.request('POST', self.handler, body=body, headers=headers)
+                response = connection.getresponse()
+                data = response.read()
+            except Exception:
+                # Never hand a socket in an unknown state back to the pool
+                connection.close()
+                raise
+            # Error pages are not trusted to leave the connection reusable
+            if response.will_close or response.status != 200:
+                connection.close()
+            else:
+                self.pool.release(self.scheme, self.host, connection)
+            call.response_bytes = len(data)
+
+            if response.status != 200:
+                raise xmlrpc.client.ProtocolError(self.host + self.handler, response.status, response.reason,
+                                                  dict(response.getheaders()))
+            if response.getheader('Content-Encoding') == 'gzip':
+                data = gzip.decompress(data)
+            reply = serialization.loads(data)
+            if reply.get('error'):
+                raise _fault(reply['error'])
+            return reply.get('result')
+
+
+_transports = {
+    'http': PooledTransport('http'),
+    'https': PooledTransport('https'),
+}
+_proxies = {}
+_proxies_lock = threading.Lock()
+
+
+def close():
+    # Close the idle pooled connections, on shutdown
+    _pool.clear()
+
+
+def get_proxy(url, path, protocol=None):
+    # Shared proxy for an Odoo endpoint such as /xmlrpc/2/object. With the
+    # jsonrpc protocol the /xmlrpc/2/<service> endpoints are called through
+    # /jsonrpc instead; both proxies have the ServerProxy interface.
+    protocol = protocol or ODOO_PROTOCOL
+    if protocol not in PROTOCOLS:
+        raise ValueError(f'Unknown Odoo protocol: {protocol}')
+    if not path.startswith('/xmlrpc/2/'):
+        protocol = 'xmlrpc'
+    endpoint = f'{url.rstrip("/")}{path}'
+    with _proxies_lock:
+        proxy = _proxies.get((endpoint, protocol))
+        if proxy is None:
+            if protocol == 'jsonrpc':
+                proxy = JsonRpcProxy(url, path.rsplit('/', 1)[-1])
+            else:
+                scheme = 'https' if endpoint.startswith('https:') else 'http'
+                proxy = xmlrpc.client.ServerProxy(endpoint, transport=_transports[scheme])
+            _proxies[(endpoint, protocol)] = proxy
+    return proxy
@@ -0,0 +1,25 @@
+# Helpers of the modules keeping per-user state: admission, the replica, the
+# write queue, the stale responses and the session backends
+import hashlib
+import sqlite3
+
+
+def owner(url, db, username):
+    # A user of an Odoo database, as the operations, replicas and rate limits know them
+    return f'{username}@{url}/{db}'
+
+
+def digest(password):
+    # Compared instead of the password to tell whether credentials changed
+    return hashlib.sha256((password or '').encode('utf-8')).hexdigest()
+
+
+def sqlite_connection(local, path):
+    # The calling thread's connection to the SQLite file path, kept in the
+    # threading.local() local, in autocommit mode
+    connection = getattr(local, 'connection', None)
+    if connection is None:
+        connection = sqlite3.connect(path, timeout=10, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        local.connection = connection
+    return connection
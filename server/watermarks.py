@@ -0,0 +1,53 @@
+import base64
+import json
+from datetime import datetime
+
+# Odoo stores write_date in UTC with this format
+ODOO_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def normalize_timestamp(value):
+    # Accept "YYYY-MM-DD HH:MM:SS", ISO 8601 ("2024-01-31T10:00:00Z") or a date
+    value = value.strip().replace('T', ' ').rstrip('Z')
+    for fmt in (ODOO_DATETIME_FORMAT, '%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, fmt).strftime(ODOO_DATETIME_FORMAT)
+        except ValueError:
+            continue
+    raise ValueError(f'Invalid timestamp: {value}')
+
+
+def parse(value, models):
+    # Decode the watermark sent by a client into {model: timestamp}. A plain
+    # timestamp applies to every model; None means a full initial sync.
+    if not value:
+        return {model: None for model in models}
+    try:
+        timestamp = normalize_timestamp(value)
+        return {model: timestamp for model in models}
+    except ValueError:
+        pass
+    try:
+        decoded = json.loads(base64.urlsafe_b64decode(value.encode('ascii') + b'=' * (-len(value) % 4)))
+    except (ValueError, UnicodeError):
+        raise ValueError(f'Invalid watermark: {value}')
+    if not isinstance(decoded, dict):
+        raise ValueError(f'Invalid watermark: {value}')
+    since = {}
+    for model in models:
+        timestamp = decoded.get(model)
+        if timestamp is not None and not isinstance(timestamp, str):
+            raise ValueError(f'Invalid watermark: {value}')
+        since[model] = None if timestamp is None else normalize_timestamp(timestamp)
+    return since
+
+
+def encode(timestamps):
+    raw = json.dumps(timestamps, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def latest(records, default):
+    # Newest write_date of the records, or default when there are none
+    dates = [record['write_date'] for record in records if record.get('write_date')]
+    return max(dates) if dates else default
@@ -0,0 +1,236 @@
+import contextlib
+import os
+import secrets
+import threading
+import time
+
+import admission
+import bulk
+import metrics
+import resilience
+import sessions
+import utils
+from odoo_client import OdooClient
+
+# When off, requests asking for an asynchronous write (Prefer: respond-async)
+# are written synchronously as before
+WRITE_QUEUE = os.environ.get('WRITE_QUEUE', '1') != '0'
+# Seconds a queued write waits for others to join its batch before the flush
+FLUSH_DELAY = float(os.environ.get('WRITE_FLUSH_DELAY', 0.5))
+# Largest number of queued writes flushed at once
+BATCH_MAX = int(os.environ.get('WRITE_BATCH_MAX', 200))
+# Attempts after a write failed because Odoo could not be reached, and the
+# first delay between them (doubled on each attempt)
+RETRY_ATTEMPTS = int(os.environ.get('WRITE_RETRY_ATTEMPTS', 5))
+RETRY_BACKOFF = float(os.environ.get('WRITE_RETRY_BACKOFF', 1))
+# Seconds the status of an operation is kept, and how many are kept in memory
+OPERATION_TTL = int(os.environ.get('WRITE_OPERATION_TTL', 24 * 3600))
+OPERATION_MAX = int(os.environ.get('WRITE_OPERATION_MAX', 10000))
+
+QUEUED, DONE, FAILED = 'queued', 'done', 'failed'
+
+SESSION_KEYS = ('url', 'db', 'username', 'password', 'uid', 'protocol')
+
+
+def default_store(redis_url=sessions.SESSION_REDIS_URL, sqlite_path=sessions.SESSION_SQLITE_PATH):
+    # Operation statuses are kept next to the sessions, so that any worker
+    # sharing them can answer /operations/<id>
+    if redis_url:
+        return sessions.RedisBackend(redis_url, ttl=OPERATION_TTL, prefix='odoo-proxy:operation:')
+    if sqlite_path:
+        return sessions.SqliteBackend(sqlite_path, ttl=OPERATION_TTL, table='operations')
+    return sessions.MemoryBackend(max_size=OPERATION_MAX, ttl=OPERATION_TTL)
+
+
+def owner(session):
+    # Operations are only visible to the user of the database that queued them
+    return utils.owner(session['url'], session['db'], session['username'])
+
+
+def is_retryable(entry, error):
+    # A write sent again sets the same values; a create sent again after Odoo
+    # may have received it could create the record twice, so creates are only
+    # retried when the call cannot have reached Odoo
+    if isinstance(error, (resilience.CircuitOpenError, ConnectionRefusedError, admission.RejectedError)):
+        return True
+    return entry['method'] == 'write' and resilience.is_failure(error)
+
+
+class WriteQueue:
+    # Write-behind queue of the task stage changes and timesheet lines: the
+    # request is answered with an operation id right away and a background
+    # thread writes to Odoo. Writes of the same record queued before the flush
+    # are collapsed into one, the flush writes records sharing the same values
+    # with one call and creates the records of a model with one call, and
+    # writes failing because Odoo is unreachable are retried with backoff.
+    # Queued writes live in this process: close() flushes them on shutdown.
+
+    def __init__(self, log_error=print, app_context=None, store=None):
+        self.log_error = log_error
+        # Context manager factory the flush runs in, e.g. Flask's app.app_context
+        self.app_context = app_context
+        self.operations = store or default_store()
+        self._pending = {}
+        self._condition = threading.Condition()
+        self._thread = None
+        self._closed = False
+
+    def submit(self, session, model, method, values, record_id=None):
+        # Queue a write of record_id or a create ('write' or 'create' method)
+        # with the credentials of session and return the operation id
+        operation_id = secrets.token_urlsafe(16)
+        now = time.time()
+        self.operations.set(operation_id, {
+            'id': operation_id, 'owner': owner(session), 'status': QUEUED, 'model': model, 'method': method,
+            'record_id': record_id, 'attempts': 0, 'error': None, 'created_at': now, 'updated_at': now,
+        })
+        credentials = (session['url'], session['db'], session['username'], session['password'],
+                       session.get('protocol'))
+        key = (credentials, model, method, record_id if method == 'write' else operation_id)
+        with self._condition:
+            if self._closed:
+                raise RuntimeError('The write queue is closed')
+            entry = self._pending.get(key)
+            if entry is None:
+                self._pending[key] = {
+                    'key': key, 'session': {name: session.get(name) for name in SESSION_KEYS},
+                    'model': model, 'method': method, 'record_id': record_id, 'values': dict(values),
+                    'operations': [operation_id], 'attempts': 0, 'due': time.monotonic() + FLUSH_DELAY,
+                }
+            else:
+                # The later values win, the record is written once
+                entry['values'].update(values)
+                entry['operations'].append(operation_id)
+                metrics.WRITES_COLLAPSED.inc(model, method)
+            metrics.WRITES_QUEUED.inc(model, method)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='write-queue', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return operation_id
+
+    def status(self, operation_id, session):
+        # The operation, or None when it is unknown, expired or not the session's
+        operation = self.operations.get(operation_id)
+        if operation is None or operation.pop('owner') != owner(session):
+            return None
+        return operation
+
+    def _delay(self):
+        # Seconds before the next flush is due, None when nothing is queued
+        if not self._pending:
+            return None
+        return max(min(entry['due'] for entry in self._pending.values()) - time.monotonic(), 0)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                delay = self._delay()
+                while not self._closed and delay != 0:
+                    self._condition.wait(delay)
+                    delay = self._delay()
+                if self._closed:
+                    return
+            try:
+                self.flush()
+            except Exception as e:
+                self.log_error(f"Error flushing the write queue: {e}")
+
+    def flush(self, final=False):
+        # Write the queued operations that are not waiting for a retry (all of
+        # them when final) and return how many were written or failed
+        now = time.monotonic()
+        with self._condition:
+            keys = [key for key, entry in self._pending.items()
+                    if final or entry['attempts'] == 0 or entry['due'] <= now][:BATCH_MAX]
+            entries = [self._pending.pop(key) for key in keys]
+
+        by_credentials = {}
+        for entry in entries:
+            by_credentials.setdefault(entry['key'][0], []).append(entry)
+        with (self.app_context or contextlib.nullcontext)():
+            for group in by_credentials.values():
+                # The queued writes keep the priority of the requests that made them
+                with admission.scope(group[-1]['session'], admission.WRITE):
+                    self._write(group, final)
+        return len(entries)
+
+    def _write(self, entries, final):
+        session = entries[-1]['session']
+        client = OdooClient(session['url'], session['db'], session['username'], session['password'],
+                            uid=session['uid'], protocol=session['protocol'])
+
+        batches = {}
+        for entry in entries:
+            if entry['method'] == 'write':
+                # Records given the same values are written with one call
+                batch_key = (entry['model'], 'write', repr(sorted(entry['values'].items())))
+            else:
+                batch_key = (entry['model'], 'create')
+            batches.setdefault(batch_key, []).append(entry)
+
+        for (model, method, *_), batch in batches.items():
+            try:
+                if method == 'write':
+                    ids = [entry['record_id'] for entry in batch]
+                    written = bulk.write_groups(client, model, {None: (ids, batch[0]['values'])})
+                    results = [written[record_id] for record_id in ids]
+                else:
+                    results = bulk.create_records(client, model, [entry['values'] for entry in batch])
+            except Exception as e:
+                results = [e] * len(batch)
+            for entry, result in zip(batch, results):
+                if not isinstance(result, Exception):
+                    self._finish(entry, DONE, error=None,
+                                 record_id=entry['record_id'] if method == 'write' else result)
+                elif not final and entry['attempts'] < RETRY_ATTEMPTS and is_retryable(entry, result):
+                    self._retry(entry, result)
+                else:
+                    metrics.WRITES_FAILED.inc(model, method)
+                    self._finish(entry, FAILED, error=bulk.error_message(result))
+
+    def _update(self, entry, **values):
+        values['updated_at'] = time.time()
+        for operation_id in entry['operations']:
+            operation = self.operations.get(operation_id)
+            if operation is not None:
+                operation.update(values)
+                self.operations.set(operation_id, operation)
+
+    def _finish(self, entry, status, **values):
+        self._update(entry, status=status, attempts=entry['attempts'] + 1, **values)
+
+    def _retry(self, entry, error):
+        entry['attempts'] += 1
+        entry['due'] = time.monotonic() + RETRY_BACKOFF * 2 ** (entry['attempts'] - 1)
+        self._update(entry, attempts=entry['attempts'], error=bulk.error_message(error))
+        metrics.WRITES_RETRIED.inc(entry['model'], entry['method'])
+        with self._condition:
+            newer = self._pending.get(entry['key'])
+            if newer is not None:
+                # Written again meanwhile: one entry, the newer values winning
+                newer['values'] = dict(entry['values'], **newer['values'])
+                newer['operations'] = entry['operations'] + newer['operations']
+                newer['attempts'] = max(newer['attempts'], entry['attempts'])
+                newer['due'] = max(newer['due'], entry['due'])
+            else:
+                self._pending[entry['key']] = entry
+            self._condition.notify()
+
+    def stats(self):
+        with self._condition:
+            return {'queued': sum(len(entry['operations']) for entry in self._pending.values()),
+                    'records': len(self._pending)}
+
+    def close(self):
+        # Stop the background flush and write what is still queued, once
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+        while self._pending:
+            self.flush(final=True)